@@ -0,0 +1,233 @@
+"""
+Analysis of a directed graph before it is deployed: cycle detection, topological order, critical path depth, fan-in
+and fan-out hot spots, and an estimate of the end-to-end latency from the service time of each node. ZdgCompose
+rejects graphs with cycles and flags the hot spots, see ZdgGraph.validate
+
+Run it using
+  python -m zdg.analyze_dgraph compose_dgraph.yml --service node_1=5 node_2=20 --default-ms 1 --rate 50
+"""
+
+import argparse
+import collections
+import math
+
+import yaml
+
+
+class ZdgGraph:
+    """
+    Graph of node names, built from (node1, node2) name pairs, from a list of ZdgEdge (see from_edges) or from a
+    compose file created by ZdgCompose (see read_compose)
+    """
+
+    # Nodes with more inbound or outbound edges than this are reported as hot spots
+    hotspot_degree = 8
+
+    def __init__(self, pair_list: list, node_list: list = None) -> None:
+        if node_list is None:
+            node_list = []
+        self.pair_list = list(pair_list)
+        self.node_list = list(dict.fromkeys(list(node_list) + [name for pair in self.pair_list for name in pair]))
+
+        self.outbound = {name: [] for name in self.node_list}
+        self.inbound = {name: [] for name in self.node_list}
+        for name1, name2 in self.pair_list:
+            self.outbound[name1].append(name2)
+            self.inbound[name2].append(name1)
+
+    @staticmethod
+    def from_edges(edge_list: list):
+        """
+        from_edges
+        """
+        return ZdgGraph([(edge.node1.node_name, edge.node2.node_name) for edge in edge_list])
+
+    @staticmethod
+    def read_compose(compose_path: str):
+        """
+        Graph of the services of a compose file, read from the ZDG_OUTBOUND_LIST of each service
+        """
+        with open(compose_path, "r", encoding="utf-8") as f_d:
+            compose_data = yaml.safe_load(f_d)
+
+        pair_list = []
+        for name, service in compose_data["services"].items():
+            for env in service.get("environment", []):
+                if not env.startswith("ZDG_OUTBOUND_LIST="):
+                    continue
+                for h_p in env.split("=", 1)[1].split(";"):
+                    if len(h_p.strip()) > 0:
+                        pair_list.append((name, h_p.split()[0]))
+        return ZdgGraph(pair_list, list(compose_data["services"].keys()))
+
+    def get_topo_order(self):
+        """
+        Kahn's algorithm. Returns the nodes in topological order and the nodes left out because they are in,
+        or downstream of, a cycle
+        """
+        in_degree = {name: len(self.inbound[name]) for name in self.node_list}
+        ready = collections.deque(name for name in self.node_list if in_degree[name] == 0)
+        topo_list = []
+        while len(ready) > 0:
+            name1 = ready.popleft()
+            topo_list.append(name1)
+            for name2 in self.outbound[name1]:
+                in_degree[name2] -= 1
+                if in_degree[name2] == 0:
+                    ready.append(name2)
+
+        cyclic_list = [name for name in self.node_list if in_degree[name] > 0]
+        return topo_list, cyclic_list
+
+    def find_cycle(self, cyclic_list: list):
+        """
+        One cycle among the nodes left out by get_topo_order, as a list of names that starts and ends with the
+        same node. Every one of them has an inbound edge from another one, so walking those edges backwards
+        always ends up in a cycle
+        """
+        cyclic_set = set(cyclic_list)
+        visited = {}
+        name = cyclic_list[0]
+        while name not in visited:
+            visited[name] = len(visited)
+            name = next(name1 for name1 in self.inbound[name] if name1 in cyclic_set)
+
+        walk = list(visited.keys())[visited[name] :]
+        return list(reversed(walk + [name]))
+
+    def get_depth(self, topo_list: list):
+        """
+        Length in edges of the longest path that ends in each node
+        """
+        depth = {}
+        for name in topo_list:
+            depth[name] = max((depth[name1] + 1 for name1 in self.inbound[name]), default=0)
+        return depth
+
+    def get_hotspots(self, max_degree: int = None):
+        """
+        (node, "fan_in" or "fan_out", degree) of the nodes with more than max_degree inbound or outbound edges.
+        Every inbound message of a node is processed by its single thread, and with acked edges every outbound
+        message waits for the slowest of its replies
+        """
+        if max_degree is None:
+            max_degree = ZdgGraph.hotspot_degree
+
+        hotspot_list = []
+        for name in self.node_list:
+            if len(self.inbound[name]) > max_degree:
+                hotspot_list.append((name, "fan_in", len(self.inbound[name])))
+            if len(self.outbound[name]) > max_degree:
+                hotspot_list.append((name, "fan_out", len(self.outbound[name])))
+        return hotspot_list
+
+    def get_load(self, topo_list: list, rate: float):
+        """
+        Messages per second received by each node when every source sends rate messages per second. Nodes forward
+        every message to all their outbound edges, so load adds up on fan-in and is copied on fan-out
+        """
+        load = {}
+        for name in topo_list:
+            load[name] = rate if len(self.inbound[name]) == 0 else sum(load[name1] for name1 in self.inbound[name])
+        return load
+
+    def estimate_latency(self, topo_list: list, service_ms: dict, default_ms: float, hop_ms: float, rate: float = 0):
+        """
+        Estimated latency from the sources to each node: the response time of every node on the slowest path, plus
+        hop_ms per edge. The response time is the service time (service_ms, default_ms for the nodes not in it) and,
+        if rate > 0, the queueing delay of an M/M/1 queue with the load of get_load, infinite if the node is
+        overloaded. Returns the latency in milliseconds and the previous node on the slowest path of each node
+        """
+        load = self.get_load(topo_list, rate)
+
+        latency = {}
+        previous = {}
+        for name in topo_list:
+            s_ms = service_ms.get(name, default_ms)
+            utilization = load[name] * s_ms / 1000
+            if rate <= 0:
+                response_ms = s_ms
+            elif utilization < 1:
+                response_ms = s_ms / (1 - utilization)
+            else:
+                response_ms = math.inf
+
+            latency_in, previous[name] = max(
+                ((latency[name1] + hop_ms, name1) for name1 in self.inbound[name]), default=(0.0, None)
+            )
+            latency[name] = latency_in + response_ms
+        return latency, previous
+
+    @staticmethod
+    def get_path(previous: dict, name: str):
+        """
+        get_path
+        """
+        path = [name]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        return list(reversed(path))
+
+    def validate(self, max_degree: int = None):
+        """
+        Raise ValueError if the graph has a cycle (acked edges in a cycle deadlock and the readiness handshake would
+        never end) and print the hot spots. Returns the nodes in topological order
+        """
+        topo_list, cyclic_list = self.get_topo_order()
+        if len(cyclic_list) > 0:
+            cycle = self.find_cycle(cyclic_list)
+            print(f"The graph has a cycle {' -> '.join(cycle)}")
+            raise ValueError
+
+        for name, kind, degree in self.get_hotspots(max_degree):
+            print(f"Warning: node {name} is a {kind} hot spot with {degree} edges")
+        return topo_list
+
+    def report(self, service_ms: dict, default_ms: float, hop_ms: float, rate: float = 0):
+        """
+        report
+        """
+        topo_list, cyclic_list = self.get_topo_order()
+        print(f"{len(self.node_list)} nodes, {len(self.pair_list)} edges")
+        if len(cyclic_list) > 0:
+            print(f"Cycle {' -> '.join(self.find_cycle(cyclic_list))}, {len(cyclic_list)} nodes can not be ordered")
+            return
+
+        depth = self.get_depth(topo_list)
+        latency, previous = self.estimate_latency(topo_list, service_ms, default_ms, hop_ms, rate)
+        load = self.get_load(topo_list, rate)
+
+        print(f"Topological order {' '.join(topo_list)}")
+        print(f"Critical path depth {max(depth.values(), default=0)} edges")
+        for name, kind, degree in self.get_hotspots():
+            print(f"Hot spot {name}: {kind} {degree}")
+
+        print(f"{'node':<30} {'in':>5} {'out':>5} {'depth':>6} {'load/s':>10} {'util':>6} {'latency ms':>12}")
+        for name in topo_list:
+            utilization = load[name] * service_ms.get(name, default_ms) / 1000
+            print(
+                f"{name:<30} {len(self.inbound[name]):>5} {len(self.outbound[name]):>5} {depth[name]:>6} "
+                f"{load[name]:>10.1f} {utilization:>6.2f} {latency[name]:>12.3f}"
+            )
+
+        sink_list = [name for name in topo_list if len(self.outbound[name]) == 0]
+        if len(sink_list) > 0:
+            sink = max(sink_list, key=lambda name: latency[name])
+            path = ZdgGraph.get_path(previous, sink)
+            print(f"Slowest path {' -> '.join(path)}: {latency[sink]:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="zdg graph analysis")
+    parser.add_argument("compose_path")
+    parser.add_argument("--service", nargs="*", default=[], help="service time of a node as name=ms")
+    parser.add_argument("--default-ms", type=float, default=1.0, help="service time of the other nodes")
+    parser.add_argument("--hop-ms", type=float, default=0.1, help="latency of each edge")
+    parser.add_argument("--rate", type=float, default=0, help="messages/s per source, 0 leaves out queueing")
+    args = parser.parse_args()
+
+    service_dict = {}
+    for item in args.service:
+        key, val = item.split("=", 1)
+        service_dict[key] = float(val)
+    ZdgGraph.read_compose(args.compose_path).report(service_dict, args.default_ms, args.hop_ms, args.rate)
@@ -0,0 +1,258 @@
+"""
+Throughput and latency benchmark of local topologies. Each topology is built using ZdgEdge and ZdgCompose and every
+node runs as a local process using the same ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST environment variables it would get
+in Docker. Sources send payloads of a given size at a given rate (0 is as fast as possible), the other nodes forward
+them and the sinks measure the latency since the source created them. Results are printed as JSON
+
+Run it using
+  python -m zdg.bench --topology chain fan_in --size 1024 1048576 --rate 0 1000 --duration 5
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from zdg.compose_dgraph import ZdgEdge, ZdgNode
+from zdg.node_interface import ZdgNodeIface
+from zdg.node_metrics import ZdgHistogram
+from zdg.run_dgraph import ZdgRunner
+
+TOPOLOGIES = ["chain", "fan_in", "fan_out", "diamond", "random_dag"]
+
+
+class ZdgBenchNode:
+    """
+    Node run by the benchmark, configured by ZDG_BENCH_SIZE, ZDG_BENCH_RATE, ZDG_BENCH_WARMUP, ZDG_BENCH_DURATION
+    and ZDG_BENCH_RESULT. The node writes the result file and exits one second after the sources stop. A timer is used
+    instead of a signal because the poller of a sink may never wake up to run a signal handler
+    """
+
+    def __init__(self) -> None:
+        self.node_name = os.environ["ZDG_CONTAINER_NAME"]
+        self.payload = b"x" * int(os.environ["ZDG_BENCH_SIZE"])
+        self.rate = float(os.environ["ZDG_BENCH_RATE"])
+        self.warmup = float(os.environ["ZDG_BENCH_WARMUP"])
+        self.duration = float(os.environ["ZDG_BENCH_DURATION"])
+        self.result_path = os.environ["ZDG_BENCH_RESULT"]
+
+        self.sent = 0
+        self.received = 0
+        self.latency = ZdgHistogram()
+        self.t_first = None
+        self.t_last = None
+        self.t_next = None
+        self.t_stop = None
+
+        threading.Timer(self.warmup + self.duration + 1.0, self.write_result).start()
+
+    def outbound_fnct(self, message={}):
+        """
+        Sources create a new payload, the other nodes forward the one they received
+        """
+        if len(message) > 0:
+            return message["data"]
+
+        if self.t_next is None:
+            time.sleep(self.warmup)
+            self.t_next = time.time()
+            self.t_stop = self.t_next + self.duration
+
+        # Deadline based pacing, a late message does not delay the following ones
+        if self.rate > 0:
+            self.t_next += 1 / self.rate
+            time.sleep(max(0.0, self.t_next - time.time()))
+        while time.time() >= self.t_stop:
+            time.sleep(1)
+
+        self.sent += 1
+        return {"payload": self.payload, "origin": time.time()}
+
+    def inbound_fnct(self, message: dict):
+        """
+        inbound_fnct
+        """
+        now = time.time()
+        self.latency.record(now - message["data"]["origin"])
+        self.received += 1
+        if self.t_first is None:
+            self.t_first = now
+        self.t_last = now
+        return {"ok": 1}
+
+    def write_result(self):
+        """
+        write_result
+        """
+        result = {
+            "node": self.node_name,
+            "sent": self.sent,
+            "received": self.received,
+            "recv_time_s": 0.0 if self.t_first is None else self.t_last - self.t_first,
+            "latency": self.latency.get_summary(),
+        }
+        with open(self.result_path, "w", encoding="utf-8") as f_d:
+            json.dump(result, f_d)
+        os._exit(0)
+
+    @staticmethod
+    def run():
+        """
+        run
+        """
+        node = ZdgBenchNode()
+        ZdgNodeIface.run(node.inbound_fnct, node.outbound_fnct)
+
+
+class ZdgBench:
+    """
+    ZdgBench
+    """
+
+    @staticmethod
+    def get_topology(name: str, num_nodes: int, mode: str, seed: int = 0):
+        """
+        Returns the list of ZdgEdge of the topology. num_nodes is the length of the chain, the number of sources or
+        sinks of fan_in and fan_out, and the number of nodes of random_dag
+        """
+        node_dict = {}
+
+        def get_node(node_name):
+            if node_name not in node_dict:
+                node_dict[node_name] = ZdgNode(node_name, "local", "local", {})
+            return node_dict[node_name]
+
+        pair_list = []
+        if name == "chain":
+            pair_list = [(f"node{i}", f"node{i + 1}") for i in range(num_nodes - 1)]
+        elif name == "fan_in":
+            pair_list = [(f"src{i}", "sink") for i in range(num_nodes)]
+        elif name == "fan_out":
+            pair_list = [("src", f"sink{i}") for i in range(num_nodes)]
+        elif name == "diamond":
+            pair_list = [("src", "left"), ("src", "right"), ("left", "sink"), ("right", "sink")]
+        elif name == "random_dag":
+            # Every node but the first one receives from one to three of the nodes before it, so node0 is the only
+            # source and there are no cycles
+            rng = random.Random(seed)
+            for i in range(1, num_nodes):
+                for j in rng.sample(range(i), min(i, rng.randint(1, 3))):
+                    pair_list.append((f"node{j}", f"node{i}"))
+        else:
+            print(f"Unknown topology {name}, expected one of {TOPOLOGIES}")
+            raise ValueError
+
+        return [ZdgEdge(get_node(name1), get_node(name2), mode=mode) for name1, name2 in pair_list]
+
+    @staticmethod
+    def run_topology(edge_list: list, port_num: int, size: int, rate: float, duration: float, warmup: float = 1.0):
+        """
+        Run every node of the topology as a local process and returns the results
+        """
+        result_dir = tempfile.mkdtemp(prefix="zdg_bench_")
+        src_dir = str(pathlib.Path(__file__).parent.parent.resolve())
+
+        env_dict = ZdgRunner.get_node_env(edge_list, port_num)
+        sink_names = [name for name, node_env in env_dict.items() if len(node_env["ZDG_OUTBOUND_LIST"]) == 0]
+
+        proc_dict = {}
+        for name, node_env in env_dict.items():
+            env = dict(os.environ)
+            env.update(node_env)
+            env["PYTHONPATH"] = os.pathsep.join([src_dir, env.get("PYTHONPATH", "")])
+            env["ZDG_BENCH_SIZE"] = str(size)
+            env["ZDG_BENCH_RATE"] = str(rate)
+            env["ZDG_BENCH_WARMUP"] = str(warmup)
+            env["ZDG_BENCH_DURATION"] = str(duration)
+            env["ZDG_BENCH_RESULT"] = os.path.join(result_dir, f"{name}.json")
+            proc_dict[name] = subprocess.Popen(
+                [sys.executable, "-m", "zdg.bench", "--node"],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+        result = {"nodes": {}}
+        for name, proc in proc_dict.items():
+            _, _, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = 0
+
+            result_path = os.path.join(result_dir, f"{name}.json")
+            if not os.path.exists(result_path):
+                print(f"Node {name} did not write its result")
+                raise RuntimeError
+            with open(result_path, "r", encoding="utf-8") as f_d:
+                node_result = json.load(f_d)
+            os.remove(result_path)
+            node_result["cpu_s"] = rusage.ru_utime + rusage.ru_stime
+            node_result["cpu_percent"] = 100 * node_result["cpu_s"] / (warmup + duration + 1.0)
+            result["nodes"][name] = node_result
+        os.rmdir(result_dir)
+
+        sink_list = [result["nodes"][name] for name in sink_names]
+        sent = sum(node["sent"] for node in result["nodes"].values())
+        received = sum(node["received"] for node in sink_list)
+        result["sent"] = sent
+        result["received"] = received
+        result["sinks"] = sink_names
+        result["message_rate"] = received / duration
+        result["byte_rate"] = received * size / duration
+        result["latency"] = ZdgBench.get_worst_latency(sink_list)
+        return result
+
+    @staticmethod
+    def get_worst_latency(sink_list: list):
+        """
+        Latency summary of the slowest sink (highest p99)
+        """
+        summary_list = [node["latency"] for node in sink_list if node["latency"]["count"] > 0]
+        if len(summary_list) == 0:
+            return {"count": 0}
+        return max(summary_list, key=lambda summary: summary["p99_ms"])
+
+    @staticmethod
+    def run(topology_list: list, num_nodes: int, mode: str, size_list: list, rate_list: list, duration: float):
+        """
+        Sweep payload size and rate for every topology
+        """
+        port_num = 6000
+        result_list = []
+        for topology in topology_list:
+            for size in size_list:
+                for rate in rate_list:
+                    edge_list = ZdgBench.get_topology(topology, num_nodes, mode)
+                    result = ZdgBench.run_topology(edge_list, port_num, size, rate, duration)
+                    result.update({"topology": topology, "mode": mode, "size": size, "rate": rate})
+                    result_list.append(result)
+                    print(
+                        f"{topology} size {size} rate {rate}: {result['message_rate']:.1f} message/s, "
+                        f"p99 {result['latency'].get('p99_ms', 0):.3f} ms",
+                        file=sys.stderr,
+                    )
+                    # Fresh ports for every run, sockets of the previous one may still be closing
+                    port_num += len(edge_list)
+        return result_list
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="zdg throughput and latency benchmark")
+    parser.add_argument("--topology", nargs="+", default=TOPOLOGIES, choices=TOPOLOGIES)
+    parser.add_argument("--nodes", type=int, default=4, help="size of the topology")
+    parser.add_argument("--mode", default="acked", choices=ZdgEdge.edge_modes)
+    parser.add_argument("--size", nargs="+", type=int, default=[1024, 65536, 1048576], help="payload bytes")
+    parser.add_argument("--rate", nargs="+", type=float, default=[0], help="messages/s per source, 0 is unlimited")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--node", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.node:
+        ZdgBenchNode.run()
+    else:
+        results = ZdgBench.run(args.topology, args.nodes, args.mode, args.size, args.rate, args.duration)
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,80 @@
+"""
+Benchmark the time ZdgCompose takes to build and dump the compose file of large graphs, random DAGs and a fan-in of
+every node into a single sink
+
+Run it using
+  python -m zdg.bench_compose --edges 1000 10000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from zdg.compose_dgraph import ZdgCompose, ZdgEdge, ZdgNode
+
+GRAPHS = ["random_dag", "fan_in"]
+
+
+class ZdgComposeBench:
+    """
+    ZdgComposeBench
+    """
+
+    @staticmethod
+    def get_edge_list(graph: str, num_edges: int, seed: int = 0):
+        """
+        random_dag has num_edges / 4 nodes, each one sending to up to 8 of the nodes after it, fan_in has
+        num_edges sources
+        """
+        if graph == "fan_in":
+            sink = ZdgNode("sink", "zdg", "python3 node.py", {})
+            return [ZdgEdge(ZdgNode(f"src{i}", "zdg", "python3 node.py", {}), sink) for i in range(num_edges)]
+
+        if graph != "random_dag":
+            print(f"Unknown graph {graph}, expected one of {GRAPHS}")
+            raise ValueError
+
+        rng = random.Random(seed)
+        num_nodes = max(2, num_edges // 4)
+        node_list = [ZdgNode(f"node{i}", "zdg", "python3 node.py", {}) for i in range(num_nodes)]
+        pair_set = set()
+        while len(pair_set) < num_edges:
+            i = rng.randrange(num_nodes - 1)
+            j = rng.randint(i + 1, min(num_nodes - 1, i + 8))
+            pair_set.add((i, j))
+        return [ZdgEdge(node_list[i], node_list[j]) for i, j in sorted(pair_set)]
+
+    @staticmethod
+    def run(graph_list: list, edges_list: list):
+        """
+        run
+        """
+        compose_path = os.path.join(tempfile.mkdtemp(prefix="zdg_bench_compose_"), "compose_dgraph.yml")
+
+        print(f"{'graph':<12} {'nodes':>8} {'edges':>8} {'build s':>10} {'dump s':>10}")
+        for graph in graph_list:
+            for num_edges in edges_list:
+                edge_list = ZdgComposeBench.get_edge_list(graph, num_edges)
+
+                t_0 = time.perf_counter()
+                compose = ZdgCompose(edge_list, 6000)
+                t_1 = time.perf_counter()
+                ZdgNode.write_yml(compose.compose_data, compose_path)
+                t_2 = time.perf_counter()
+
+                num_nodes = len(compose.compose_data["services"])
+                print(f"{graph:<12} {num_nodes:>8} {num_edges:>8} {t_1 - t_0:>10.3f} {t_2 - t_1:>10.3f}")
+
+        os.remove(compose_path)
+        os.rmdir(os.path.dirname(compose_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ZdgCompose build and dump time")
+    parser.add_argument("--graph", nargs="+", default=GRAPHS, choices=GRAPHS)
+    parser.add_argument("--edges", nargs="+", type=int, default=[1000, 10000])
+    args = parser.parse_args()
+
+    ZdgComposeBench.run(args.graph, args.edges)
@@ -0,0 +1,136 @@
+"""
+Benchmark the multipart ZdgSerializer against the pickle path (send_pyobj / recv_pyobj) over an inproc socket pair,
+and the codecs against each other on small telemetry messages
+
+Run it using
+  python -m zdg.bench_serializer
+"""
+
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import zmq
+
+from zdg.node_interface import ZdgNodeIface
+
+
+class ZdgSerializerBench:
+    """
+    ZdgSerializerBench
+    """
+
+    pickle_codec = ZdgNodeIface.create_codec({"codec": "pickle"})
+
+    @staticmethod
+    def get_payloads():
+        """
+        Payloads similar to the ones sent by camera and point cloud nodes
+        """
+        return {
+            "bytes_1k": b"x" * 1024,
+            "bytes_256k": b"x" * (256 * 1024),
+            "bytes_1m": b"x" * (1024 * 1024),
+            "pointcloud_100k": np.random.rand(100_000, 3).astype(np.float32),
+            "image_720p": np.random.randint(0, 255, (720, 1280, 3), dtype=np.uint8),
+            "image_1080p": np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8),
+        }
+
+    @staticmethod
+    def send_recv_pickle(sock_a, sock_b, message):
+        """
+        send_recv_pickle
+        """
+        sock_a.send_pyobj(message)
+        return sock_b.recv_pyobj()
+
+    @staticmethod
+    def send_recv_frames(sock_a, sock_b, message):
+        """
+        send_recv_frames
+        """
+        ZdgNodeIface.send_message(sock_a, message, ZdgSerializerBench.pickle_codec)
+        return ZdgNodeIface.recv_message(sock_b, ZdgSerializerBench.pickle_codec)[1]
+
+    @staticmethod
+    def measure(send_recv, sock_a, sock_b, data, duration: float):
+        """
+        Returns the throughput in MB/s and the peak of Python allocations per message in MB
+        """
+        message = {"data": data, "time": time.time(), "counter": 0}
+        nbytes = memoryview(data).nbytes
+
+        message_cnt = 0
+        t_0 = time.perf_counter()
+        while (time.perf_counter() - t_0) < duration:
+            message["counter"] = message_cnt
+            send_recv(sock_a, sock_b, message)
+            message_cnt += 1
+        mb_per_s = message_cnt * nbytes / (time.perf_counter() - t_0) / 1e6
+
+        tracemalloc.start()
+        send_recv(sock_a, sock_b, message)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return mb_per_s, peak / 1e6
+
+    @staticmethod
+    def run(duration: float = 1.0):
+        """
+        run
+        """
+        context = zmq.Context()
+        sock_a = context.socket(zmq.PAIR)
+        sock_b = context.socket(zmq.PAIR)
+        sock_a.bind("inproc://bench_serializer")
+        sock_b.connect("inproc://bench_serializer")
+
+        print(f"{'payload':<18} {'size MB':>8} {'pickle MB/s':>12} {'frames MB/s':>12} {'pickle alloc MB':>16} "
+              f"{'frames alloc MB':>16}")
+        for name, data in ZdgSerializerBench.get_payloads().items():
+            size = memoryview(data).nbytes / 1e6
+            pickle_rate, pickle_alloc = ZdgSerializerBench.measure(
+                ZdgSerializerBench.send_recv_pickle, sock_a, sock_b, data, duration
+            )
+            frames_rate, frames_alloc = ZdgSerializerBench.measure(
+                ZdgSerializerBench.send_recv_frames, sock_a, sock_b, data, duration
+            )
+            print(f"{name:<18} {size:>8.3f} {pickle_rate:>12.1f} {frames_rate:>12.1f} {pickle_alloc:>16.3f} "
+                  f"{frames_alloc:>16.3f}")
+
+        sock_a.close()
+        sock_b.close()
+        context.term()
+
+    @staticmethod
+    def run_codecs(number: int = 100_000):
+        """
+        Per message CPU time (encode + decode) and size of a small telemetry message for each codec
+        """
+        message = {
+            "data": {"x": 1.25, "y": -3.5, "z": 10.0, "roll": 0.01, "pitch": 0.02, "yaw": 1.57, "status": 3},
+            "time": time.time(),
+            "counter": 123456,
+        }
+        opt_list = [
+            {"codec": "pickle"},
+            {"codec": "msgpack"},
+            {"codec": "struct", "schema": "x:d,y:d,z:d,roll:d,pitch:d,yaw:d,status:i"},
+        ]
+
+        print(f"{'codec':<10} {'us/message':>12} {'bytes/message':>14}")
+        for opt in opt_list:
+            codec = ZdgNodeIface.create_codec(opt)
+            frames = codec.encode(message)
+            assert codec.decode(frames) == message
+
+            dt = timeit.timeit(lambda: codec.decode(codec.encode(message)), number=number)
+            size = sum(len(frame) for frame in frames)
+            print(f"{opt['codec']:<10} {dt / number * 1e6:>12.2f} {size:>14}")
+
+
+if __name__ == "__main__":
+    ZdgSerializerBench.run()
+    ZdgSerializerBench.run_codecs()
@@ -1,11 +1,14 @@
 """
 Create a directed graph where each node is a Docker container and each edge is a ZMQ point-to-point socket
 """
+import copy
 import os
 import pathlib
 
 import yaml
 
+from zdg.analyze_dgraph import ZdgGraph
+
 # import random
 
 
@@ -14,10 +17,25 @@ class ZdgNode:
     Class to create a directed graph where each node is a Docker container and each edge is a ZMQ point-to-point socket
     """
 
-    def __init__(self, node_name: str, node_image: str, node_command: str, opt: dict) -> None:
+    # Mount point of the volume shared by the nodes of a host that have ipc edges
+    ipc_dir = "/zdg_ipc"
+
+    # Mount point of the tmpfs volume shared by the nodes of a host that have shm edges
+    shm_dir = "/dev/shm"
+
+    # Mount point of the volume of the logs of recorded edges
+    record_dir = "/zdg_record"
+
+    def __init__(
+        self, node_name: str, node_image: str, node_command: str, opt: dict, host: str = None, replicas: int = 1
+    ) -> None:
         """
-        __init__
+        host is a placement label, edges between nodes with the same host use ipc sockets instead of TCP.
+        With replicas > 1 the node is deployed as that many services, see get_replicas
         """
+        if replicas < 1:
+            print(f"Node {node_name} needs at least one replica, got {replicas}")
+            raise ValueError
         # self.current_dir = pathlib.Path(__file__).parent.resolve()
 
         self.node_name = node_name
@@ -25,42 +43,91 @@ class ZdgNode:
         self.node_command = node_command
 
         # self.volumes = [".:/app"]
-        # self.volumes = []
+        self.volumes = []
         self.environment = [f"ZDG_CONTAINER_NAME={self.node_name}"]
-        self.depends_on = []
+        self.host = host
+        self.replicas = replicas
+        self.replica_list = []
 
         self.opt = opt
 
-    def update_inbound_list(self, in_h_list: list, in_p_list: list):
+    def get_replicas(self):
+        """
+        ZdgNode of each replica, named node_name_0 to node_name_N-1, or [self] if the node has a single replica.
+        Replicas get their node name and their index in ZDG_NODE_NAME and ZDG_REPLICA
+        """
+        if self.replicas == 1:
+            return [self]
+        if len(self.replica_list) == 0:
+            for i in range(self.replicas):
+                replica_name = f"{self.node_name}_{i}"
+                replica = ZdgNode(replica_name, self.node_image, self.node_command, copy.deepcopy(self.opt), self.host)
+                replica.environment += [f"ZDG_NODE_NAME={self.node_name}", f"ZDG_REPLICA={i}"]
+                self.replica_list.append(replica)
+        return self.replica_list
+
+    def update_inbound_list(self, in_h_list: list, in_p_list: list, in_o_list: list = None):
         """
         update_inbound_list
         """
+        if in_o_list is None:
+            in_o_list = [""] * len(in_p_list)
+
         env = "ZDG_INBOUND_LIST"
-        h_p_list = ""
-        for _, in_p in zip(in_h_list, in_p_list):
-            if len(h_p_list) == 0:
-                # h_p_list = f"{in_h} {port}"
-                h_p_list = f"* {in_p}"
-            else:
-                # h_p_list = f"{h_p_list};{in_h} {port}"
-                h_p_list = f"{h_p_list};* {in_p}"
+        h_p_list = ";".join(f"* {in_p} {in_o}".strip() for _, in_p, in_o in zip(in_h_list, in_p_list, in_o_list))
         self.environment.append(f"{env}={h_p_list}")
 
-        self.depends_on = in_h_list
-
-    def update_outbound_list(self, out_h_list: list, out_p_list: list):
+    def update_outbound_list(self, out_h_list: list, out_p_list: list, out_o_list: list = None):
         """
         update_outbound_list
         """
+        if out_o_list is None:
+            out_o_list = [""] * len(out_p_list)
+
         env = "ZDG_OUTBOUND_LIST"
-        h_p_list = ""
-        for out_h, out_p in zip(out_h_list, out_p_list):
-            if len(h_p_list) == 0:
-                h_p_list = f"{out_h} {out_p}"
-            else:
-                h_p_list = f"{h_p_list};{out_h} {out_p}"
+        h_p_list = ";".join(
+            f"{out_h} {out_p} {out_o}".strip() for out_h, out_p, out_o in zip(out_h_list, out_p_list, out_o_list)
+        )
         self.environment.append(f"{env}={h_p_list}")
 
+    def get_ipc_volume(self):
+        """
+        Name of the volume shared by the nodes of the host
+        """
+        return "zdg_ipc" if self.host is None else f"zdg_ipc_{self.host}"
+
+    def add_ipc_volume(self):
+        """
+        Mount the ipc volume of the host and point ZDG_IPC_DIR to it
+        """
+        volume = f"{self.get_ipc_volume()}:{ZdgNode.ipc_dir}"
+        if volume not in self.volumes:
+            self.volumes.append(volume)
+            self.environment.append(f"ZDG_IPC_DIR={ZdgNode.ipc_dir}")
+
+    def get_shm_volume(self):
+        """
+        Name of the tmpfs volume shared by the nodes of the host, it replaces the /dev/shm of each container
+        """
+        return "zdg_shm" if self.host is None else f"zdg_shm_{self.host}"
+
+    def add_shm_volume(self):
+        """
+        add_shm_volume
+        """
+        volume = f"{self.get_shm_volume()}:{ZdgNode.shm_dir}"
+        if volume not in self.volumes:
+            self.volumes.append(volume)
+
+    def add_record_volume(self):
+        """
+        Mount the volume of the logs of recorded edges and point ZDG_RECORD_DIR to it, replay sources need it too
+        """
+        volume = f"zdg_record:{ZdgNode.record_dir}"
+        if volume not in self.volumes:
+            self.volumes.append(volume)
+            self.environment.append(f"ZDG_RECORD_DIR={ZdgNode.record_dir}")
+
     def update_yml(self):
         """
         update_yml
@@ -90,11 +157,18 @@ class ZdgNode:
         # Update reserved (key, val) pairs
         datad[self.node_name]["command"] = self.node_command
         datad[self.node_name]["container_name"] = self.node_name
-        datad[self.node_name]["depends_on"] = self.depends_on
+        # No depends_on, containers start together and the nodes order themselves with a readiness handshake
+        # (see ZdgNodeIface.wait_outbound_ready)
         try:
             _ = [datad[self.node_name]["environment"].append(item) for item in self.environment]
         except KeyError:
             datad[self.node_name]["environment"] = self.environment
+        if len(self.volumes) > 0:
+            volumes = list(datad[self.node_name].get("volumes", []))
+            datad[self.node_name]["volumes"] = volumes + [item for item in self.volumes if item not in volumes]
+        if self.host is not None:
+            # Docker swarm places the service on the host
+            datad[self.node_name]["deploy"] = {"placement": {"constraints": [f"node.hostname == {self.host}"]}}
         datad[self.node_name]["image"] = self.node_image
 
         return datad
@@ -106,8 +180,10 @@ class ZdgNode:
         """
         # datad = self.update_yml()
         # yaml_path = str(self.current_dir / f"pubsub_compose_{self.container_name}.yml")
+        # The libyaml emitter, when PyYAML was built with it, writes the same output several times faster
+        dumper = getattr(yaml, "CDumper", yaml.Dumper)
         with open(yaml_path, "w", encoding="utf-8") as f_d:
-            yaml.dump(datad, f_d, default_flow_style=False)
+            yaml.dump(datad, f_d, Dumper=dumper, default_flow_style=False)
 
     @staticmethod
     def get_comments():
@@ -130,9 +206,170 @@ class ZdgEdge:
     Class to create a directed graph where each node is a Docker container and each edge is a ZMQ point-to-point socket
     """
 
-    def __init__(self, node1: ZdgNode, node2: ZdgNode) -> None:
+    # Edge modes understood by ZdgNodeIface (see EDGE_MODES in node_interface.py)
+    edge_modes = ["acked", "push", "dealer"]
+
+    # Edge transports understood by ZdgNodeIface (see EDGE_TRANSPORTS in node_interface.py)
+    edge_transports = ["tcp", "ipc", "inproc"]
+
+    # Overflow policies understood by ZdgNodeIface (see EDGE_OVERFLOW in node_interface.py)
+    edge_overflows = ["block", "drop_oldest", "drop_newest", "spill"]
+
+    # Ends of the edge that can record it (see EDGE_RECORD in node_interface.py)
+    edge_records = ["inbound", "outbound"]
+
+    # Compression algorithms understood by ZdgNodeIface (see EDGE_COMPRESS in node_interface.py)
+    edge_compressions = ["zlib", "lz4", "zstd"]
+
+    def __init__(
+        self,
+        node1: ZdgNode,
+        node2: ZdgNode,
+        mode: str = "acked",
+        window: int = None,
+        timeout: int = None,
+        codec: str = "pickle",
+        schema: str = None,
+        batch: int = 1,
+        batch_ms: int = None,
+        conflate: bool = False,
+        transport: str = None,
+        shm: int = 0,
+        shm_size: int = None,
+        key: str = None,
+        queue: int = None,
+        overflow: str = "block",
+        heartbeat: int = None,
+        resend: bool = True,
+        record: str = None,
+        compress: str = None,
+        compress_min: int = None,
+        compress_level: int = None,
+    ) -> None:
+        """
+        shm > 0 sends large frames through a shared memory ring of shm slots of shm_size bytes, both nodes have to
+        be on the same host and the edge can not be push or conflated.
+        If node2 has replicas, each message goes to one of them: the one with the fewest messages in flight or, with
+        key, the one the value of message["data"][key] is hashed to (sticky routing).
+        Messages of acked and dealer edges that find no room in the window wait in a queue of queue messages,
+        overflow is what happens to the next ones: the node blocks, drops the oldest or the newest, or spills them
+        to disk. An edge that stops replying is probed every heartbeat milliseconds at most and, with resend, its
+        messages in flight are sent again once it replies.
+        record is the end of the edge ("inbound" or "outbound") that appends its messages to a log, see ZdgRecordLog.
+        compress compresses the frames of at least compress_min bytes with zlib, lz4 or zstd, see ZdgCompressor
+        """
+        if mode not in ZdgEdge.edge_modes:
+            print(f"Unknown edge mode {mode}, expected one of {ZdgEdge.edge_modes}")
+            raise ValueError
+        if (transport is not None) and (transport not in ZdgEdge.edge_transports):
+            print(f"Unknown edge transport {transport}, expected one of {ZdgEdge.edge_transports}")
+            raise ValueError
+        if (shm > 0) and ((mode == "push") or conflate or (transport == "tcp")):
+            print("Edge option shm can not be used with push, conflate or tcp edges")
+            raise ValueError
+        if (shm > 0) and (node1.replicas > 1):
+            print(f"Edge option shm can not be used with the replicas of {node1.node_name}, they would share the ring")
+            raise ValueError
+        if (key is not None) and (node2.replicas == 1):
+            print(f"Edge option key needs replicas of {node2.node_name}")
+            raise ValueError
+        if overflow not in ZdgEdge.edge_overflows:
+            print(f"Unknown edge overflow {overflow}, expected one of {ZdgEdge.edge_overflows}")
+            raise ValueError
+        if (overflow != "block") and ((mode == "push") or conflate):
+            print("Edge option overflow can not be used with push or conflate edges")
+            raise ValueError
+        if (record is not None) and (record not in ZdgEdge.edge_records):
+            print(f"Unknown edge record {record}, expected one of {ZdgEdge.edge_records}")
+            raise ValueError
+        if (compress is not None) and (compress not in ZdgEdge.edge_compressions):
+            print(f"Unknown edge compress {compress}, expected one of {ZdgEdge.edge_compressions}")
+            raise ValueError
+
         self.node1 = node1
         self.node2 = node2
+        self.mode = mode
+        self.window = window
+        self.timeout = timeout
+        self.codec = codec
+        self.schema = schema
+        self.batch = batch
+        self.batch_ms = batch_ms
+        self.conflate = conflate
+        self.transport = transport
+        self.shm = shm
+        self.shm_size = shm_size
+        self.key = key
+        self.queue = queue
+        self.overflow = overflow
+        self.heartbeat = heartbeat
+        self.resend = resend
+        self.record = record
+        self.compress = compress
+        self.compress_min = compress_min
+        self.compress_level = compress_level
+
+    def get_transport(self):
+        """
+        Unless it was set, the transport is ipc between nodes with the same host (or with shm edges) and tcp otherwise
+        """
+        if self.transport is not None:
+            return self.transport
+        if (self.node1.host is not None) and (self.node1.host == self.node2.host):
+            return "ipc"
+        if self.shm > 0:
+            return "ipc"
+        return "tcp"
+
+    def get_opt(self):
+        """
+        Edge options as "key=val" tokens, both ends of the edge get the same tokens in their
+        ZDG_OUTBOUND_LIST and ZDG_INBOUND_LIST entries. Default options are left out
+        """
+        opt_list = []
+        if self.mode != "acked":
+            opt_list.append(f"mode={self.mode}")
+        if self.window is not None:
+            opt_list.append(f"window={self.window}")
+        if self.timeout is not None:
+            opt_list.append(f"timeout={self.timeout}")
+        if self.codec != "pickle":
+            opt_list.append(f"codec={self.codec}")
+        if self.schema is not None:
+            opt_list.append(f"schema={self.schema}")
+        if self.batch != 1:
+            opt_list.append(f"batch={self.batch}")
+        if self.batch_ms is not None:
+            opt_list.append(f"batch_ms={self.batch_ms}")
+        if self.conflate:
+            opt_list.append("conflate=1")
+        if self.get_transport() != "tcp":
+            opt_list.append(f"transport={self.get_transport()}")
+        if self.shm > 0:
+            opt_list.append(f"shm={self.shm}")
+        if self.shm_size is not None:
+            opt_list.append(f"shm_size={self.shm_size}")
+        if self.node2.replicas > 1:
+            opt_list.append(f"group={self.node2.node_name}")
+        if self.key is not None:
+            opt_list.append(f"key={self.key}")
+        if self.queue is not None:
+            opt_list.append(f"queue={self.queue}")
+        if self.overflow != "block":
+            opt_list.append(f"overflow={self.overflow}")
+        if self.heartbeat is not None:
+            opt_list.append(f"heartbeat={self.heartbeat}")
+        if not self.resend:
+            opt_list.append("resend=0")
+        if self.record is not None:
+            opt_list.append(f"record={self.record}")
+        if self.compress is not None:
+            opt_list.append(f"compress={self.compress}")
+        if self.compress_min is not None:
+            opt_list.append(f"compress_min={self.compress_min}")
+        if self.compress_level is not None:
+            opt_list.append(f"compress_level={self.compress_level}")
+        return " ".join(opt_list)
 
 
 class ZdgCompose:
@@ -141,77 +378,106 @@ class ZdgCompose:
     """
 
     def __init__(self, edge_list: list, port_num: int) -> None:
+        """
+        Edges are indexed by node name as they are registered, so building the compose data is linear in the number
+        of nodes and edges. Ports are assigned in edge order, starting at port_num
+        """
         zmq_port = port_num
         port_data = {}
-        name1_list = []
-        name2_list = []
-        node_list = []
+        opt_data = {}
+        # Node of each name and service of each name (the node itself or one of its replicas). For each service, the
+        # (service name, port, opt) of its outbound edges and the (service names, port, opt) of its inbound edges,
+        # in edge order. Every replica of node2 binds a port of its own and every replica of node1 connects to it
+        node_dict = {}
+        service_dict = {}
+        # (node1 name, node2 name) of the edges, edge_key is only a label and names may contain "_to_"
+        edge_set = set()
+        outbound_dict = {}
+        inbound_dict = {}
         for edge in edge_list:
             assert isinstance(edge, ZdgEdge)
 
-            name1 = edge.node1
+            node1 = edge.node1
             node2 = edge.node2
-            port_key = f"{name1.node_name}_to_{node2.node_name}"
-            if port_key in port_data.keys():
-                print(f"Edge is already registered {port_key}")
+            edge_key = f"{node1.node_name}_to_{node2.node_name}"
+            if (node1.node_name, node2.node_name) in edge_set:
+                print(f"Edge is already registered {edge_key}")
                 raise ValueError
-
-            name1_list.append(name1.node_name)
-            name2_list.append(node2.node_name)
-            node_list.append(name1)
-            node_list.append(node2)
-
-            port_data[port_key] = zmq_port
-            zmq_port += 1
-        name1_set = set(name1_list)
-        name2_set = set(name2_list)
-        node_set = set(node_list)
+            edge_set.add((node1.node_name, node2.node_name))
+            for node in [node1, node2]:
+                if node_dict.setdefault(node.node_name, node) is not node:
+                    print(f"Node name {node.node_name} is used by more than one ZdgNode")
+                    raise ValueError
+                for replica in node.get_replicas():
+                    if service_dict.setdefault(replica.node_name, replica) is not replica:
+                        print(f"Service name {replica.node_name} is used by more than one ZdgNode")
+                        raise ValueError
+
+            opt = edge.get_opt()
+            replica1_names = [replica1.node_name for replica1 in node1.get_replicas()]
+            for replica2 in node2.get_replicas():
+                port_key = f"{node1.node_name}_to_{replica2.node_name}"
+                port_data[port_key] = zmq_port
+                opt_data[port_key] = opt
+                for name1 in replica1_names:
+                    outbound_dict.setdefault(name1, []).append((replica2.node_name, zmq_port, opt))
+                inbound_dict.setdefault(replica2.node_name, []).append((replica1_names, zmq_port, opt))
+                zmq_port += 1
+
+            if edge.get_transport() == "ipc":
+                if node1.host != node2.host:
+                    print(f"Edge {edge_key} uses ipc between different hosts {node1.host} and {node2.host}")
+                    raise ValueError
+                for replica in node1.get_replicas() + node2.get_replicas():
+                    replica.add_ipc_volume()
+            if edge.shm > 0:
+                for replica in node1.get_replicas() + node2.get_replicas():
+                    replica.add_shm_volume()
+            if edge.record is not None:
+                for replica in (node2 if edge.record == "inbound" else node1).get_replicas():
+                    replica.add_record_volume()
+
+        # Reject cycles before writing anything, see ZdgGraph.validate
+        ZdgGraph.from_edges(edge_list).validate()
 
         compose_data = {"services": {}}
+        volume_names = sorted(set(volume.split(":")[0] for node in service_dict.values() for volume in node.volumes))
+        if len(volume_names) > 0:
+            compose_data["volumes"] = {}
+        for volume in volume_names:
+            if volume.startswith("zdg_shm"):
+                compose_data["volumes"][volume] = {"driver_opts": {"type": "tmpfs", "device": "tmpfs"}}
+            else:
+                compose_data["volumes"][volume] = {}
 
         # For each node1, connect to all node2 we want to send data to
-        for name1 in name1_set:
-            outbound_list_h = []
-            outbound_list_p = []
-            for port_key, port_val in port_data.items():
-                prefix = f"{name1}_to_"
-                if prefix in port_key:
-                    name2 = port_key.replace(prefix, "")
-                    outbound_list_h.append(name2)
-                    outbound_list_p.append(port_val)
-            for node in node_set:
-                assert isinstance(node, ZdgNode)
-                if name1 == node.node_name:
-                    node.update_outbound_list(outbound_list_h, outbound_list_p)
-                    node.update_inbound_list([], [])
-                    compose_data["services"][name1] = node.update_yml()[name1]
+        for name1, adjacency in outbound_dict.items():
+            node = service_dict[name1]
+            node.update_outbound_list(
+                [name2 for name2, _, _ in adjacency],
+                [port for _, port, _ in adjacency],
+                [opt for _, _, opt in adjacency],
+            )
+            node.update_inbound_list([], [])
+            compose_data["services"][name1] = node.update_yml()[name1]
 
         # For each node2, connect to all node1 we want to receive data from
-        for name2 in name2_set:
-            inbound_list_h = []
-            inbound_list_p = []
-            for port_key, port_val in port_data.items():
-                sufix = f"_to_{name2}"
-                if sufix in port_key:
-                    name1 = port_key.replace(sufix, "")
-                    inbound_list_h.append(name1)
-                    inbound_list_p.append(port_val)
-            for node in node_set:
-                assert isinstance(node, ZdgNode)
-                if name2 == node.node_name:
-                    no_outbound_env = True
-                    for env in node.environment:
-                        if "ZDG_OUTBOUND_LIST" in env:
-                            no_outbound_env = False
-                    if no_outbound_env:
-                        node.update_outbound_list([], [])
-                    node.update_inbound_list(inbound_list_h, inbound_list_p)
-                    compose_data["services"][name2] = node.update_yml()[name2]
+        for name2, adjacency in inbound_dict.items():
+            node = service_dict[name2]
+            if name2 not in outbound_dict:
+                node.update_outbound_list([], [])
+            node.update_inbound_list(
+                [names[0] for names, _, _ in adjacency],
+                [port for _, port, _ in adjacency],
+                [opt for _, _, opt in adjacency],
+            )
+            compose_data["services"][name2] = node.update_yml()[name2]
 
         # # Append to inbound_list and outbound_list
         # node1.update_inbound_list(inbound_list_h, inbound_list_p)
         # node1.update_outbound_list(outbound_list_h, outbound_list_p)
         self.port_data = port_data
+        self.opt_data = opt_data
         self.compose_data = compose_data
         # self.compose_path = compose_path
 
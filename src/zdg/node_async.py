@@ -0,0 +1,646 @@
+"""
+asyncio version of ZdgNodeIface, for nodes that also do async I/O (HTTP sinks, database writes) and need to share
+the event loop with the ZMQ sockets
+"""
+
+import asyncio
+import os
+import time
+
+import zmq
+import zmq.asyncio
+
+from zdg import node_interface
+from zdg.node_interface import BACKOFF_MIN, FRAME_MIN_SIZE, HEARTBEAT_FRAME, ZdgNodeIface
+from zdg.node_metrics import ZdgMetrics, metrics
+from zdg.node_schedule import ZdgSourceScheduler
+from zdg.node_trace import ZdgTrace, tracer
+
+#  Socket to talk to server, shares the context of ZdgNodeIface so that inproc edges work between both
+context = zmq.asyncio.Context.shadow(node_interface.context)
+
+
+class AsyncZdgNodeIface:
+    """
+    Same topology environment variables (ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST), edge options and role dispatch
+    (n to m, 0 to n and m to 0) as ZdgNodeIface, built on zmq.asyncio and taking async def inbound_fnct and
+    outbound_fnct. Messages of different inbound sockets, and of the same push or dealer inbound socket, are handled
+    concurrently. Outbound edges with the batch option, and acked or dealer outbound edges with the conflate option,
+    are not supported.
+
+    Run it using
+      asyncio.run(AsyncZdgNodeIface.run(inbound_fnct, outbound_fnct))
+    """
+
+    def __init__(self) -> None:
+        pass
+
+    @staticmethod
+    def create_inbound_sockets(inbound_list: str = None):
+        """
+        create_inbound_sockets
+        """
+        inbound_sockets = ZdgNodeIface.create_inbound_sockets(context, inbound_list)
+        for in_val in inbound_sockets.values():
+            # Push and dealer messages of the same socket are handled concurrently, up to window at once
+            in_val["window_sem"] = asyncio.Semaphore(in_val["opt"]["window"])
+        return inbound_sockets
+
+    @staticmethod
+    def create_outbound_sockets(outbound_list: str = None, start: bool = True):
+        """
+        With start, the tasks of the edges are started, see start_outbound_tasks
+        """
+        if outbound_list is None:
+            outbound_list = str(os.environ["ZDG_OUTBOUND_LIST"])
+        # The options are checked before any socket is created, so that an error leaves no socket behind
+        for _, _, opt in ZdgNodeIface.parse_socket_list(outbound_list):
+            if opt["batch"] > 1:
+                print(f"{AsyncZdgNodeIface.__name__} does not support the batch option on outbound edges")
+                raise ValueError
+            if (opt["conflate"] == 1) and (opt["mode"] != "push"):
+                print(f"{AsyncZdgNodeIface.__name__} supports the conflate option only on push outbound edges")
+                raise ValueError
+
+        outbound_sockets = ZdgNodeIface.create_outbound_sockets(context, outbound_list)
+        for out_val in outbound_sockets.values():
+            out_val["lock"] = asyncio.Lock()
+            out_val["tasks"] = set()
+        if start:
+            AsyncZdgNodeIface.start_outbound_tasks(outbound_sockets)
+        return outbound_sockets
+
+    @staticmethod
+    def start_outbound_tasks(outbound_sockets: dict):
+        """
+        Reply reader of dealer edges, queue sender and connection manager of acked and dealer edges
+        """
+        for out_val in outbound_sockets.values():
+            if out_val["opt"]["mode"] == "dealer":
+                AsyncZdgNodeIface.start_dealer_reader(out_val)
+            if out_val["opt"]["mode"] != "push":
+                AsyncZdgNodeIface.start_queue_sender(out_val)
+                out_val["monitor"] = asyncio.ensure_future(AsyncZdgNodeIface.monitor_outbound_socket(out_val))
+
+    @staticmethod
+    async def wait_outbound_ready(outbound_sockets: dict, ready_timeout: float = None):
+        """
+        Readiness handshake, see ZdgNodeIface.wait_outbound_ready. It has to run before start_outbound_tasks, the
+        reply reader of dealer edges would take the replies to the heartbeats
+        """
+        if ready_timeout is None:
+            ready_timeout = ZdgNodeIface.get_ready_timeout()
+        t_0 = time.time()
+
+        probes = ZdgNodeIface.get_ready_probes(outbound_sockets)
+        poller = zmq.asyncio.Poller()
+        for socket, out_key in probes.items():
+            if socket is outbound_sockets[out_key]["socket"]:
+                await socket.send_multipart([HEARTBEAT_FRAME])
+            poller.register(socket, zmq.POLLIN)
+
+        while len(probes) > 0:
+            poll_timeout = (t_0 + ready_timeout - time.time()) * 1000
+            if poll_timeout <= 0:
+                break
+            for socket, _ in await poller.poll(poll_timeout):
+                await socket.recv_multipart()
+                poller.unregister(socket)
+                out_key = probes.pop(socket)
+                ZdgNodeIface.set_edge_ready(outbound_sockets[out_key], time.time() - t_0)
+
+        ZdgNodeIface.finish_ready_probes(outbound_sockets, probes)
+
+    @staticmethod
+    def start_queue_sender(socket_dict: dict):
+        """
+        Queued messages are sent by a task of their own: every message of the edges with an overflow policy other
+        than block, which are not waited for, and the messages resent after a reset
+        """
+        socket_dict["queued"] = asyncio.Event()
+        socket_dict["sender"] = asyncio.ensure_future(AsyncZdgNodeIface.send_queued_messages(socket_dict))
+
+    @staticmethod
+    async def send_queued_messages(socket_dict: dict):
+        """
+        Messages stay queued while the edge is suspect
+        """
+        queued = socket_dict["queued"]
+        while True:
+            await queued.wait()
+            queued.clear()
+            while (ZdgNodeIface.get_queued_count(socket_dict) > 0) and not socket_dict["suspect"]:
+                message = ZdgNodeIface.pop_queued_message(socket_dict)
+                await AsyncZdgNodeIface.process_outbound_message(message, socket_dict)
+
+    @staticmethod
+    def set_healthy(socket_dict: dict):
+        """
+        The edge replied, send the messages that were queued while it was suspect
+        """
+        socket_dict["failures"] = 0
+        socket_dict["suspect"] = False
+        ZdgNodeIface.update_backoff(socket_dict)
+        socket_dict["queued"].set()
+
+    @staticmethod
+    async def monitor_outbound_socket(socket_dict: dict):
+        """
+        Connection manager of an acked or dealer edge, see ZdgNodeIface.check_outbound_socket. A suspect edge is
+        probed with a heartbeat and, if it is not answered within the backoff, the socket is rebuilt and probed again.
+        The REQ socket of an acked edge that still waits for the reply to its readiness heartbeat (see
+        ZdgNodeIface.finish_ready_probes) waits for it instead of sending another one. A socket error rebuilds the
+        socket, it does not end the task
+        """
+        while True:
+            if not socket_dict["suspect"]:
+                await asyncio.sleep(BACKOFF_MIN)
+                continue
+
+            backoff = socket_dict["backoff"]
+            try:
+                if socket_dict["opt"]["mode"] == "dealer":
+                    # The reply is received by read_dealer_replies
+                    await socket_dict["socket"].send_multipart([HEARTBEAT_FRAME])
+                    await asyncio.sleep(backoff)
+                    answered = not socket_dict["suspect"]
+                else:
+                    answered = await AsyncZdgNodeIface.probe_acked_socket(socket_dict, backoff)
+            except zmq.ZMQError as err:
+                print(f"Probe of {socket_dict['url']} failed ({err}), reconnecting")
+                answered = False
+
+            if not answered:
+                AsyncZdgNodeIface.reset_outbound_socket(socket_dict)
+
+    @staticmethod
+    async def probe_acked_socket(socket_dict: dict, backoff: float) -> bool:
+        """
+        Send a heartbeat on the REQ socket, unless a request is still in flight, and wait up to backoff for the
+        reply. Returns True if it arrived
+        """
+        async with socket_dict["lock"]:
+            socket = socket_dict["socket"]
+            if socket_dict["in_flight"] == 0:
+                await socket.send_multipart([HEARTBEAT_FRAME])
+                socket_dict["in_flight"] = 1
+            try:
+                await asyncio.wait_for(socket.recv_multipart(copy=False), backoff)
+            except asyncio.TimeoutError:
+                return False
+            socket_dict["in_flight"] = 0
+            AsyncZdgNodeIface.set_healthy(socket_dict)
+            return True
+
+    @staticmethod
+    def start_dealer_reader(socket_dict: dict):
+        """
+        Replies of a dealer edge are received by a task of their own, each reply makes room in the window
+        """
+        socket_dict["window_sem"] = asyncio.Semaphore(socket_dict["opt"]["window"])
+        socket_dict["reader"] = asyncio.ensure_future(AsyncZdgNodeIface.read_dealer_replies(socket_dict))
+
+    @staticmethod
+    async def read_dealer_replies(socket_dict: dict):
+        """
+        read_dealer_replies
+        """
+        socket = socket_dict["socket"]
+        window_sem = socket_dict["window_sem"]
+        while True:
+            frames = await socket.recv_multipart(copy=False)
+            _, reply = AsyncZdgNodeIface.decode_edge_frames(socket_dict, frames)
+            if reply is not None:
+                window_sem.release()
+                if len(socket_dict["sent"]) > 0:
+                    socket_dict["sent"].popleft()
+            AsyncZdgNodeIface.set_healthy(socket_dict)
+
+    @staticmethod
+    def decode_edge_frames(socket_dict: dict, frames: list, envelope_len: int = 0):
+        """
+        Decode frames received with recv_multipart(copy=False), returns the envelope frames and the message
+        (None for heartbeats)
+        """
+        frames = [frame.bytes if len(frame) < FRAME_MIN_SIZE else frame for frame in frames]
+        if ZdgNodeIface.is_heartbeat(frames, envelope_len):
+            return frames[:envelope_len], None
+        socket_dict["metrics"]["bytes"] += ZdgMetrics.get_frames_size(frames)
+        frames, envelope_len = ZdgNodeIface.get_shm_frames(socket_dict, frames, envelope_len)
+        ZdgNodeIface.tap_edge_frames(socket_dict, frames[envelope_len:], "inbound")
+        batch, join = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+        compressor = socket_dict.get("compressor")
+        message = ZdgNodeIface.decode_frames(frames[envelope_len:], socket_dict["codec"], batch, join, compressor)
+        return frames[:envelope_len], message
+
+    @staticmethod
+    def encode_edge_frames(socket_dict: dict, message, envelope: list = None):
+        """
+        encode_edge_frames
+        """
+        batch, join = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+        compressor = socket_dict.get("compressor")
+        frames = ZdgNodeIface.encode_frames(message, socket_dict["codec"], batch, join, compressor)
+        socket_dict["metrics"]["bytes"] += ZdgMetrics.get_frames_size(frames)
+        if envelope is None:
+            ZdgNodeIface.tap_edge_frames(socket_dict, frames, "outbound")
+            return ZdgNodeIface.put_shm_frames(socket_dict, frames)
+        return envelope + frames
+
+    @staticmethod
+    def reset_outbound_socket(socket_dict: dict):
+        """
+        Close a socket that stopped replying and connect a new one in its place.
+        Messages in flight on the old socket are queued again, or lost without the resend edge option
+        """
+        socket_url = socket_dict["url"]
+        opt = socket_dict["opt"]
+
+        if "reader" in socket_dict:
+            socket_dict["reader"].cancel()
+        if "shm" in socket_dict:
+            socket_dict["shm"].release_all()
+        socket = socket_dict["socket"]
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.close()
+        if (opt["overflow"] not in ["block", "spill"]) and (opt["resend"] == 0):
+            socket_dict["dropped"] += len(socket_dict["queue"])
+            socket_dict["queue"].clear()
+        ZdgNodeIface.requeue_sent_messages(socket_dict)
+
+        if not socket_dict["suspect"]:
+            print(f"No response from server {socket_url}, reconnecting")
+        socket_dict["socket"] = ZdgNodeIface.create_outbound_socket(socket_url, opt, context)
+        socket_dict["in_flight"] = 0
+        if opt["mode"] == "dealer":
+            window_sem = socket_dict["window_sem"]
+            AsyncZdgNodeIface.start_dealer_reader(socket_dict)
+            # Wake up the messages waiting on the old semaphore, they move to the new one
+            for _ in range(opt["window"]):
+                window_sem.release()
+
+        ZdgNodeIface.update_backoff(socket_dict)
+        socket_dict["failures"] += 1
+        socket_dict["suspect"] = True
+        socket_dict["metrics"]["timeouts"] += 1
+        socket_dict["metrics"]["reconnects"] += 1
+        if socket_dict["failures"] == opt["retries"]:
+            print(f"Server {socket_url} seems to be offline, skipping it until it replies")
+
+    @staticmethod
+    async def process_outbound_message(message: dict, socket_dict: dict):
+        """
+        Send message and, on acked edges, wait for its reply. Returns the reply, None for push and dealer edges
+        (dealer replies are received by read_dealer_replies) or if the edge timed out
+        """
+        opt = socket_dict["opt"]
+        timeout = opt["timeout"] / 1000
+        copy = socket_dict.get("copy", False)
+        ZdgTrace.stamp_trace([message])
+        frames = AsyncZdgNodeIface.encode_edge_frames(socket_dict, message)
+
+        if opt["mode"] == "push":
+            flags = zmq.DONTWAIT if socket_dict["suspect"] else 0
+            try:
+                await asyncio.wait_for(socket_dict["socket"].send_multipart(frames, flags=flags, copy=copy), timeout)
+            except (asyncio.TimeoutError, zmq.error.Again):
+                if not socket_dict["suspect"]:
+                    print(f"Server {socket_dict['url']} is not receiving, skipping it until it does")
+                    socket_dict["metrics"]["timeouts"] += 1
+                socket_dict["suspect"] = True
+                socket_dict["dropped"] += 1
+                return None
+            socket_dict["suspect"] = False
+            ZdgNodeIface.record_edge_messages(socket_dict, message)
+            return None
+
+        if opt["mode"] == "dealer":
+            t_0 = time.time()
+            try:
+                while True:
+                    # A reset replaces the semaphore, messages waiting on the old one go on waiting on the new one
+                    window_sem = socket_dict["window_sem"]
+                    try:
+                        await asyncio.wait_for(window_sem.acquire(), timeout)
+                    except asyncio.TimeoutError:
+                        if socket_dict["window_sem"] is not window_sem:
+                            continue
+                        socket_dict["dropped"] += 1
+                        AsyncZdgNodeIface.reset_outbound_socket(socket_dict)
+                        return None
+                    if socket_dict["window_sem"] is window_sem:
+                        break
+            finally:
+                if opt["overflow"] == "block":
+                    socket_dict["metrics"]["stall_s"] += time.time() - t_0
+            await socket_dict["socket"].send_multipart(frames, copy=copy)
+            ZdgNodeIface.record_edge_messages(socket_dict, message)
+            socket_dict["sent"].append(message)
+            return None
+
+        # A REQ socket allows only one message in flight
+        t_0 = time.time()
+        async with socket_dict["lock"]:
+            if opt["overflow"] == "block":
+                socket_dict["metrics"]["stall_s"] += time.time() - t_0
+            socket = socket_dict["socket"]
+            await socket.send_multipart(frames, copy=copy)
+            ZdgNodeIface.record_edge_messages(socket_dict, message)
+            socket_dict["sent"].append(message)
+            socket_dict["in_flight"] = 1
+            try:
+                frames = await asyncio.wait_for(socket.recv_multipart(copy=False), timeout)
+            except asyncio.TimeoutError:
+                if opt["resend"] == 0:
+                    socket_dict["dropped"] += 1
+                AsyncZdgNodeIface.reset_outbound_socket(socket_dict)
+                return None
+            socket_dict["sent"].clear()
+            socket_dict["in_flight"] = 0
+
+        AsyncZdgNodeIface.set_healthy(socket_dict)
+        return AsyncZdgNodeIface.decode_edge_frames(socket_dict, frames)[1]
+
+    @staticmethod
+    def has_idle_replica(socket_dict: dict) -> bool:
+        """
+        An idle acked edge of a replica group is not waited for while another replica of the group is healthy and
+        idle too, so that the group keeps up to one message in flight per replica, see ZdgNodeIface.has_idle_replica.
+        A busy edge is waited for, with the key option messages would otherwise pile up on one replica
+        """
+        if (socket_dict["opt"]["mode"] != "acked") or ("group" not in socket_dict):
+            return False
+        idle = [
+            member
+            for member in socket_dict["group"]["members"]
+            if (not member["lock"].locked()) and (len(member["tasks"]) == 0) and not member["suspect"]
+        ]
+        return any(member is socket_dict for member in idle) and (len(idle) > 1)
+
+    @staticmethod
+    def has_credit(socket_dict: dict) -> bool:
+        """
+        An edge can send a message right away if it is healthy, nothing is queued or being sent before it and the
+        window has room: the REQ socket of an acked edge is free, a dealer edge has a credit left
+        """
+        busy = (ZdgNodeIface.get_queued_count(socket_dict) > 0) or (len(socket_dict["tasks"]) > 0)
+        if socket_dict["suspect"] or busy:
+            return False
+        if socket_dict["opt"]["mode"] == "dealer":
+            return not socket_dict["window_sem"].locked()
+        return not socket_dict["lock"].locked()
+
+    @staticmethod
+    async def process_outbound_messages(message: dict, outbound_sockets: dict):
+        """
+        Send message to all outbound sockets (one replica per group) concurrently and wait for their replies.
+        Suspect edges are not waited for, so that a dead server does not slow down the healthy ones: messages to
+        suspect acked and dealer edges are dropped until their connection manager gets a reply, see
+        monitor_outbound_socket. Edges with an overflow policy other than block are not waited for either, they
+        send the message right away if they have a credit, see has_credit, and queue it otherwise, see
+        start_queue_sender
+        """
+        tasks = {}
+        for out_key, out_val in ZdgNodeIface.get_outbound_targets(message, outbound_sockets).items():
+            if (out_val["opt"]["overflow"] != "block") and AsyncZdgNodeIface.has_credit(out_val):
+                task = asyncio.ensure_future(AsyncZdgNodeIface.process_outbound_message(message, out_val))
+                out_val["tasks"].add(task)
+                task.add_done_callback(out_val["tasks"].discard)
+                continue
+            if out_val["opt"]["overflow"] != "block":
+                ZdgNodeIface.queue_outbound_message(message, out_val)
+                out_val["queued"].set()
+                continue
+
+            busy = out_val["lock"].locked() or (("window_sem" in out_val) and out_val["window_sem"].locked())
+            if out_val["suspect"] and (busy or (out_val["opt"]["mode"] != "push")):
+                out_val["dropped"] += 1
+                continue
+            if busy:
+                out_val["metrics"]["stalls"] += 1
+
+            task = asyncio.ensure_future(AsyncZdgNodeIface.process_outbound_message(message, out_val))
+            if out_val["suspect"] or AsyncZdgNodeIface.has_idle_replica(out_val):
+                # Keep a reference until it is done
+                out_val["tasks"].add(task)
+                task.add_done_callback(out_val["tasks"].discard)
+                continue
+            tasks[out_key] = task
+
+        if len(tasks) == 0:
+            # Let the senders run, nothing else may be awaited by a source that only has queued edges
+            await asyncio.sleep(0)
+        replies = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks.keys(), replies))
+
+    @staticmethod
+    async def call_inbound_fnct(inbound_fnct, messages: list):
+        """
+        Await inbound_fnct once per message, or once with all the messages of a request if it is a batch_fnct
+        (one that gathers messages across inbound sockets is rejected by run). Returns the replies
+        """
+        if getattr(inbound_fnct, "zdg_batch", False):
+            replies = await inbound_fnct(ZdgNodeIface.get_batch_input(inbound_fnct, messages))
+            assert isinstance(replies, list) and (len(replies) == len(messages))
+        else:
+            replies = [await inbound_fnct(message) for message in messages]
+
+        for reply in replies:
+            assert isinstance(reply, dict)
+        return replies
+
+    @staticmethod
+    async def process_inbound_request(socket_dict: dict, envelope: list, message, node: dict):
+        """
+        Reply to a request, a single message or a batch of them, and forward the outbound data of each message.
+        Frames in a shared memory ring are only valid until the reply, on shm edges the reply is sent last
+        """
+        batch = socket_dict["opt"]["batch"] > 1
+        messages = message if batch else [message]
+
+        t_0 = time.perf_counter()
+        replies = await AsyncZdgNodeIface.call_inbound_fnct(node["inbound_fnct"], messages)
+        metrics.node["inbound_fnct"].record(time.perf_counter() - t_0)
+        tracer.done_trace(messages)
+        if "shm" not in socket_dict:
+            await AsyncZdgNodeIface.send_inbound_replies(socket_dict, envelope, replies)
+
+        if len(node["outbound_sockets"]) == 0:
+            tracer.write_trace(messages)
+        else:
+            await AsyncZdgNodeIface.forward_inbound_messages(messages, node)
+
+        if "shm" in socket_dict:
+            await AsyncZdgNodeIface.send_inbound_replies(socket_dict, envelope, replies)
+
+    @staticmethod
+    async def send_inbound_replies(socket_dict: dict, envelope: list, replies: list):
+        """
+        send_inbound_replies
+        """
+        if socket_dict["opt"]["mode"] == "push":
+            return
+        batch = socket_dict["opt"]["batch"] > 1
+        frames = AsyncZdgNodeIface.encode_edge_frames(socket_dict, replies if batch else replies[0], envelope)
+        await socket_dict["socket"].send_multipart(frames, copy=False)
+
+    @staticmethod
+    async def forward_inbound_messages(messages: list, node: dict):
+        """
+        forward_inbound_messages
+        """
+        # For every inbound message, send the same outbound message data to all outbound sockets
+        for inbound_message in messages:
+            t_0 = time.perf_counter()
+            outbound_data = await node["outbound_fnct"](inbound_message)
+            metrics.node["outbound_fnct"].record(time.perf_counter() - t_0)
+            node["message_cnt"] += 1
+            outbound_message = {
+                "data": outbound_data,
+                "time": time.time(),
+                "counter": node["message_cnt"],
+            }
+            tracer.forward_trace(inbound_message, outbound_message)
+            await AsyncZdgNodeIface.process_outbound_messages(outbound_message, node["outbound_sockets"])
+
+    @staticmethod
+    async def process_inbound_socket(socket_dict: dict, node: dict):
+        """
+        Receive loop of one inbound socket. Acked (REP) sockets take the next message only after replying,
+        push and dealer messages are handled concurrently
+        """
+        socket = socket_dict["socket"]
+        mode = socket_dict["opt"]["mode"]
+        window_sem = socket_dict["window_sem"]
+
+        # ROUTER sockets prepend the identity of the client, it is needed to route the reply back
+        envelope_len = 1 if mode == "dealer" else 0
+
+        tasks = set()
+        while True:
+            frames = await socket.recv_multipart(copy=False)
+            envelope, message = AsyncZdgNodeIface.decode_edge_frames(socket_dict, frames, envelope_len)
+            if message is None:
+                # Liveness probe of the client, answered right away
+                await socket.send_multipart(envelope + [HEARTBEAT_FRAME])
+                continue
+            ZdgNodeIface.record_edge_messages(socket_dict, message)
+            tracer.recv_trace(ZdgNodeIface.get_edge_messages(socket_dict, message))
+
+            if mode == "acked":
+                await AsyncZdgNodeIface.process_inbound_request(socket_dict, envelope, message, node)
+                continue
+
+            await window_sem.acquire()
+            task = asyncio.ensure_future(
+                AsyncZdgNodeIface.process_inbound_request(socket_dict, envelope, message, node)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: window_sem.release())
+
+    @staticmethod
+    async def process_n_to_m_communication(inbound_sockets: dict, node: dict):
+        """
+        Also used for the m to 0 role, with empty outbound sockets
+        """
+        fname = AsyncZdgNodeIface.process_n_to_m_communication.__name__
+        print(fname)
+
+        for in_key, in_val in inbound_sockets.items():
+            print(f"Start receive loop: socket_cnt {in_key}, url {in_val['url']}")
+
+        await asyncio.gather(
+            *[AsyncZdgNodeIface.process_inbound_socket(in_val, node) for in_val in inbound_sockets.values()]
+        )
+
+    @staticmethod
+    async def process_0_to_n_communication(
+        outbound_sockets: dict, outbound_fnct, scheduler: ZdgSourceScheduler = None
+    ):
+        """
+        See ZdgNodeIface.process_0_to_n_communication
+        """
+        fname = AsyncZdgNodeIface.process_0_to_n_communication.__name__
+        print(fname)
+
+        scheduler = scheduler or ZdgSourceScheduler.from_env()
+        print(f"[{fname}] Source period {scheduler.period} s, schedule {scheduler.schedule}")
+
+        message_t0 = time.time()
+        message_cnt = 0
+        while True:
+            message_cnt += 1
+
+            t_deadline = await scheduler.async_wait()
+            t_start = t_deadline if scheduler.open_loop else time.time()
+            t_0 = time.perf_counter()
+            message = {
+                "data": await outbound_fnct(),
+                "time": t_deadline if scheduler.open_loop else time.time(),
+                "counter": message_cnt,
+            }
+            metrics.node["outbound_fnct"].record(time.perf_counter() - t_0)
+            tracer.start_trace(message, t_start)
+
+            replies = await AsyncZdgNodeIface.process_outbound_messages(message, outbound_sockets)
+            _ = replies
+
+            if message_cnt % 100 == 0:
+                message_t100 = time.time()
+                message_dt = message_t100 - message_t0
+                message_rate = 100 / message_dt
+                print(f"[{fname}] Effective outbound message rate {message_rate} message/s")
+                if scheduler.missed > 0:
+                    print(f"[{fname}] Missed {scheduler.missed} deadlines")
+                message_t0 = time.time()
+
+    @staticmethod
+    async def run(
+        inbound_fnct,
+        outbound_fnct,
+        inbound_list: str = None,
+        outbound_list: str = None,
+        scheduler: ZdgSourceScheduler = None,
+    ):
+        """
+        Pull data from subscribers and push data to publishers. inbound_list and outbound_list default to
+        ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST, scheduler sets the rate of source nodes
+        """
+        print(f"zmq.zmq_version() {zmq.zmq_version()}")
+
+        if ZdgNodeIface.get_gather_opt(inbound_fnct) is not None:
+            print("AsyncZdgNodeIface does not gather messages across inbound sockets (max_batch), use ZdgNodeIface")
+            raise ValueError
+
+        t_start = time.time()
+        outbound_sockets = AsyncZdgNodeIface.create_outbound_sockets(outbound_list, start=False)
+        await AsyncZdgNodeIface.wait_outbound_ready(outbound_sockets)
+        AsyncZdgNodeIface.start_outbound_tasks(outbound_sockets)
+        # Binding the inbound sockets announces that the node is ready
+        inbound_sockets = AsyncZdgNodeIface.create_inbound_sockets(inbound_list)
+        ZdgNodeIface.set_shm_copy(inbound_sockets, outbound_sockets)
+        ZdgNodeIface.set_node_ready(t_start)
+        metrics.start()
+        tracer.start()
+
+        n_in = len(inbound_sockets)
+        m_out = len(outbound_sockets)
+
+        print(f"inbound length {n_in}")
+        print(f"outbound length {m_out}")
+
+        node = {
+            "inbound_fnct": inbound_fnct,
+            "outbound_fnct": outbound_fnct,
+            "outbound_sockets": outbound_sockets,
+            "message_cnt": 0,
+        }
+
+        if n_in > 0:
+            # m to 0 role if there are no outbound sockets
+            await AsyncZdgNodeIface.process_n_to_m_communication(inbound_sockets, node)
+        elif m_out > 0:
+            await AsyncZdgNodeIface.process_0_to_n_communication(outbound_sockets, outbound_fnct, scheduler)
+        else:
+            print("Nothing to do here, empty inbound_sockets and outbound_sockets")
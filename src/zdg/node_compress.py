@@ -0,0 +1,134 @@
+"""
+Compression of the frames of an edge (see the compress edge option in node_interface.py). Frames of at least
+compress_min bytes are compressed with lz4, zstd or zlib and sent as they are if they do not shrink. A small frame
+in front of the message tells the receiving node which frames are compressed and how
+"""
+
+import time
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Id of each algorithm in the flags frame, 0 is a frame sent as it is
+COMPRESS_IDS = {"zlib": 1, "lz4": 2, "zstd": 3}
+
+
+class ZdgCompressor:
+    """
+    Compressor of an edge, both ends of the edge have one. Algorithms that are not installed fall back to zlib,
+    which is always available, the receiving node decompresses every algorithm it has installed.
+    Counts the bytes before and after compression, the frames sent as they were and the seconds spent
+    """
+
+    def __init__(self, opt: dict) -> None:
+        name = opt["compress"]
+        if (name == "lz4") and (lz4 is None):
+            print("The lz4 compression needs the lz4 package (pip install lz4), using zlib")
+            name = "zlib"
+        if (name == "zstd") and (zstandard is None):
+            print("The zstd compression needs the zstandard package (pip install zstandard), using zlib")
+            name = "zlib"
+
+        self.name = name
+        self.level = opt["compress_level"]
+        self.min_size = opt["compress_min"]
+        self.compress_fnct = ZdgCompressor.get_compress_fnct(name, self.level)
+        self.zstd_decompressor = None if zstandard is None else zstandard.ZstdDecompressor()
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compressed = 0
+        self.skipped = 0
+        self.compress_s = 0.0
+        self.decompress_s = 0.0
+
+    @staticmethod
+    def get_compress_fnct(name: str, level: int):
+        """
+        Function of a buffer that returns the compressed bytes. Level -1 is a fast level, compressing links that
+        saturate before the CPU should not make the nodes CPU bound
+        """
+        if name == "lz4":
+            return lambda buffer: lz4.frame.compress(buffer, compression_level=max(level, 0))
+        if name == "zstd":
+            compressor = zstandard.ZstdCompressor(level=1 if level < 0 else level)
+            return compressor.compress
+        return lambda buffer: zlib.compress(buffer, 1 if level < 0 else level)
+
+    def decompress_frame(self, compress_id: int, frame):
+        """
+        decompress_frame
+        """
+        if compress_id == COMPRESS_IDS["lz4"]:
+            if lz4 is None:
+                print("Received an lz4 frame, install the lz4 package using: pip install lz4")
+                raise ImportError
+            return lz4.frame.decompress(memoryview(frame))
+        if compress_id == COMPRESS_IDS["zstd"]:
+            if zstandard is None:
+                print("Received a zstd frame, install the zstandard package using: pip install zstandard")
+                raise ImportError
+            return self.zstd_decompressor.decompress(memoryview(frame))
+        return zlib.decompress(memoryview(frame))
+
+    def compress(self, frames: list) -> list:
+        """
+        Returns the flags frame followed by the frames, compressed if they are large enough and shrink
+        """
+        t_0 = time.perf_counter()
+        flags = bytearray(len(frames))
+        out_frames = []
+        for idx, frame in enumerate(frames):
+            buffer = memoryview(frame).cast("B")
+            if buffer.nbytes < self.min_size:
+                out_frames.append(frame)
+                continue
+
+            data = self.compress_fnct(buffer)
+            self.bytes_in += buffer.nbytes
+            if len(data) >= buffer.nbytes:
+                self.skipped += 1
+                self.bytes_out += buffer.nbytes
+                out_frames.append(frame)
+                continue
+            self.compressed += 1
+            self.bytes_out += len(data)
+            flags[idx] = COMPRESS_IDS[self.name]
+            out_frames.append(data)
+        self.compress_s += time.perf_counter() - t_0
+        return [bytes(flags)] + out_frames
+
+    def decompress(self, frames: list) -> list:
+        """
+        Inverse of compress
+        """
+        t_0 = time.perf_counter()
+        flags = frames[0]
+        out_frames = []
+        for compress_id, frame in zip(flags, frames[1:]):
+            out_frames.append(frame if compress_id == 0 else self.decompress_frame(compress_id, frame))
+        self.decompress_s += time.perf_counter() - t_0
+        return out_frames
+
+    def get_summary(self):
+        """
+        Compression ratio of the frames large enough to be compressed, including the ones that did not shrink
+        """
+        return {
+            "algorithm": self.name,
+            "ratio": self.bytes_in / self.bytes_out if self.bytes_out > 0 else 1.0,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "compress_s": self.compress_s,
+            "decompress_s": self.decompress_s,
+        }
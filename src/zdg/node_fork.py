@@ -0,0 +1,162 @@
+"""
+Worker processes of the fork pool (see process_pool_communication in node_interface.py). The node forks its workers
+before it creates any socket, keeps every edge of the graph and hands the inbound messages to the workers through a
+ROUTER socket in ZDG_IPC_DIR, each worker is a DEALER. Workers inherit the callbacks, which do not need to be
+picklable, and the graph still sees one node
+"""
+
+import concurrent.futures
+import os
+import signal
+import struct
+import time
+import traceback
+import zlib
+
+import zmq
+
+# Every task and result starts with the id of the task
+TASK_ID = struct.Struct("<Q")
+
+# First message of a worker, and status frame of its results
+WORKER_READY = b"ready"
+RESULT_OK = b"ok"
+RESULT_ERROR = b"error"
+
+
+class ZdgForkPool:
+    """
+    Forked worker processes with an interface close to concurrent.futures.Executor. Tasks go to the worker with the
+    fewest tasks in flight or, with a route value, to the worker the value hashes to, so that the tasks of a key are
+    run in order by the same worker. The results are read by recv_results, which completes the futures
+    """
+
+    def __init__(self, workers: int, task_fnct, codec) -> None:
+        """
+        task_fnct is called by the workers with the messages of a task, its result is sent back with codec
+        """
+        self.workers = workers
+        self.codec = codec
+        self.url = f"ipc://{os.environ.get('ZDG_IPC_DIR', '/tmp')}/zdg-workers-{os.getpid()}"
+        self.pid_list = []
+        self.in_flight = [0] * workers
+        self.futures = {}
+        self.task_cnt = 0
+        self.socket = None
+
+        parent_pid = os.getpid()
+        for idx in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                ZdgForkPool.run_worker(self.url, idx, task_fnct, codec, parent_pid)
+            self.pid_list.append(pid)
+
+    @staticmethod
+    def run_worker(url: str, idx: int, task_fnct, codec, parent_pid: int):
+        """
+        Worker process, runs tasks until the node exits. It does not return
+        """
+        status = 0
+        try:
+            # The context of the node is not usable after a fork
+            ctx = zmq.Context()
+            socket = ctx.socket(zmq.DEALER)
+            socket.setsockopt(zmq.IDENTITY, ZdgForkPool.get_identity(idx))
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(url)
+            socket.send(WORKER_READY)
+            while os.getppid() == parent_pid:
+                if socket.poll(1000) == 0:
+                    continue
+                task_id, *frames = socket.recv_multipart(copy=False)
+                try:
+                    result = task_fnct(codec.decode([frame.bytes for frame in frames[:1]] + frames[1:]))
+                    socket.send_multipart([task_id.bytes, RESULT_OK] + codec.encode(result), copy=False)
+                except Exception:  # pylint: disable=broad-except
+                    socket.send_multipart([task_id.bytes, RESULT_ERROR, traceback.format_exc().encode()])
+        except KeyboardInterrupt:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            status = 1
+        os._exit(status)  # pylint: disable=protected-access
+
+    @staticmethod
+    def get_identity(idx: int) -> bytes:
+        """
+        get_identity
+        """
+        return f"worker-{idx}".encode()
+
+    def start(self, ctx, ready_timeout: float):
+        """
+        Bind the socket of the workers and wait until all of them are connected
+        """
+        self.socket = ctx.socket(zmq.ROUTER)
+        self.socket.setsockopt(zmq.ROUTER_MANDATORY, 1)
+        self.socket.bind(self.url)
+
+        ready = set()
+        deadline = time.time() + ready_timeout
+        while len(ready) < self.workers:
+            if self.socket.poll(max(deadline - time.time(), 0) * 1000) == 0:
+                print(f"Only {len(ready)} of {self.workers} workers started within {ready_timeout} s")
+                self.shutdown()
+                raise RuntimeError
+            identity, _ = self.socket.recv_multipart()
+            ready.add(identity)
+        print(f"{self.workers} workers ready on {self.url}")
+
+    def select_worker(self, route=None) -> int:
+        """
+        select_worker
+        """
+        if route is not None:
+            # crc32 instead of hash(), which is salted per process
+            return zlib.crc32(str(route).encode()) % self.workers
+        return min(range(self.workers), key=lambda idx: self.in_flight[idx])
+
+    def submit(self, messages: list, route=None):
+        """
+        Send the messages to a worker, returns the concurrent.futures.Future of the result
+        """
+        idx = self.select_worker(route)
+        self.task_cnt += 1
+        future = concurrent.futures.Future()
+        self.futures[self.task_cnt] = (future, idx)
+        self.in_flight[idx] += 1
+
+        frames = [ZdgForkPool.get_identity(idx), TASK_ID.pack(self.task_cnt)] + self.codec.encode(messages)
+        self.socket.send_multipart(frames, copy=False)
+        return future
+
+    def recv_results(self):
+        """
+        Complete the futures of the results that arrived, without waiting
+        """
+        while (self.socket.poll(0) & zmq.POLLIN) != 0:
+            _, task_id, status, *frames = self.socket.recv_multipart(copy=False)
+            (task_cnt,) = TASK_ID.unpack(task_id.bytes)
+            future, idx = self.futures.pop(task_cnt)
+            self.in_flight[idx] -= 1
+            if status.bytes == RESULT_ERROR:
+                print(frames[0].bytes.decode())
+                future.set_exception(RuntimeError(f"Task failed in {ZdgForkPool.get_identity(idx).decode()}"))
+                continue
+            future.set_result(self.codec.decode([frames[0].bytes] + frames[1:]))
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """
+        Stop the workers, same arguments as concurrent.futures.Executor.shutdown
+        """
+        _ = cancel_futures
+        for pid in self.pid_list:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if wait:
+            for pid in self.pid_list:
+                os.waitpid(pid, 0)
+        if self.socket is not None:
+            self.socket.close(linger=0)
@@ -2,14 +2,406 @@
 Interface to connect two or more nodes (Docker containers) together using point-to-point ZMQ sockets (client-server)
 """
 
+import collections
+import concurrent.futures
+import functools
+import json
 import os
+import pickle
+import signal
+import struct
+import threading
 import time
+import zlib
 
 import zmq
 
+from zdg.node_compress import ZdgCompressor
+from zdg.node_fork import ZdgForkPool
+from zdg.node_metrics import ZdgMetrics, metrics
+from zdg.node_record import ZdgRecordLog
+from zdg.node_schedule import ZdgSourceScheduler
+from zdg.node_shm import ZdgShmRing
+from zdg.node_spill import ZdgSpillQueue
+from zdg.node_trace import ZdgTrace, tracer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 #  Socket to talk to server
 context = zmq.Context()
 
+# Socket pair (outbound, inbound) used by each edge mode
+#   acked:  REQ/REP lockstep, every message waits for its reply (default)
+#   push:   PUSH/PULL, no replies, the window is used as the send/receive high water mark
+#   dealer: DEALER/ROUTER, replies are collected asynchronously with up to window messages in flight
+EDGE_MODES = {
+    "acked": (zmq.REQ, zmq.REP),
+    "push": (zmq.PUSH, zmq.PULL),
+    "dealer": (zmq.DEALER, zmq.ROUTER),
+}
+
+# Default edge options, each entry of ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST can overwrite them
+# using "key=val" tokens after the hostname and port
+#   timeout: milliseconds to wait for a reply (or for room in the window) before the edge is reset
+#   retries: consecutive timeouts after which the edge is reported as offline
+#   codec:   name of the codec in CODECS used to serialize messages and replies
+#   schema:  fields of the struct codec
+#   batch:    messages sent together as one batch (1 disables batching)
+#   batch_ms: milliseconds a batch waits to fill up before it is sent anyway
+#   conflate: keep only the latest message of the edge (1) instead of queueing them (0)
+#   transport: tcp, ipc (nodes on the same host) or inproc (nodes in the same process), see get_socket_url
+#   shm:      slots of the shared memory ring used for large frames (0 disables it), see ZdgShmRing
+#   shm_size: bytes per slot, larger frames are sent through the socket
+#   group: replica group of the outbound edge, each message is sent to only one edge of the group, see select_replica
+#   key:   field of message["data"] that routes messages with the same value to the same replica ("" balances load)
+#   queue:    messages of acked and dealer edges waiting for a credit (room in the window), see queue_outbound_message
+#   overflow: what to do with a message when the queue is full, one of EDGE_OVERFLOW
+#   heartbeat: milliseconds between ZMTP heartbeats, and longest wait between liveness probes of a suspect edge,
+#              see check_outbound_socket
+#   resend:    resend the messages in flight when an acked or dealer edge is reset (1, at least once delivery)
+#              or drop them (0, at most once delivery)
+#   record: end of the edge that records its requests, one of EDGE_RECORD
+#   compress:       compression of the frames of the edge, one of EDGE_COMPRESS ("" disables it), see ZdgCompressor
+#   compress_min:   frames smaller than compress_min bytes are not compressed
+#   compress_level: level of the compression algorithm, -1 is a fast level
+EDGE_OPT = {
+    "mode": "acked",
+    "window": 100,
+    "timeout": 2500,
+    "retries": 3,
+    "codec": "pickle",
+    "schema": "",
+    "batch": 1,
+    "batch_ms": 10,
+    "conflate": 0,
+    "transport": "tcp",
+    "shm": 0,
+    "shm_size": 8 * 1024 * 1024,
+    "group": "",
+    "key": "",
+    "queue": 1,
+    "overflow": "block",
+    "heartbeat": 1000,
+    "resend": 1,
+    "record": "",
+    "compress": "",
+    "compress_min": 1024,
+    "compress_level": -1,
+}
+
+# Transports of the transport edge option. ipc sockets are files in ZDG_IPC_DIR, nodes in different containers
+# need to share that directory
+EDGE_TRANSPORTS = ["tcp", "ipc", "inproc"]
+
+# Overflow policies of the overflow edge option
+#   block:       the node waits, up to the timeout, until a reply makes room in the queue
+#   drop_oldest: the oldest message in the queue is dropped to make room
+#   drop_newest: the new message is dropped
+#   spill:       messages are appended to a file in ZDG_SPILL_DIR and sent once there is room, see ZdgSpillQueue
+EDGE_OVERFLOW = ["block", "drop_oldest", "drop_newest", "spill"]
+
+# Ends of the edge that can record its messages with the record edge option, see ZdgRecordLog
+EDGE_RECORD = ["", "inbound", "outbound"]
+
+# Compression algorithms of the compress edge option, lz4 and zstd fall back to zlib if they are not installed
+EDGE_COMPRESS = ["", "zlib", "lz4", "zstd"]
+
+# Liveness probe of suspect acked and dealer edges, answered by the inbound end without calling inbound_fnct.
+# It can not be mistaken for a request, whose first frame is a codec header or a shm index frame
+HEARTBEAT_FRAME = b"\x00zdg-heartbeat\x00"
+
+# First wait for the reply to a liveness probe, in seconds. It doubles after every probe that is not answered, up to
+# the heartbeat edge option. ZMQ retries connections at the same interval
+BACKOFF_MIN = 0.1
+
+# Seconds a node waits for its outbound edges to be ready before it starts anyway, see wait_outbound_ready.
+# ZDG_READY_TIMEOUT overwrites it
+READY_TIMEOUT = 60.0
+
+# Keys of the messages built by the process_*_communication functions
+MESSAGE_KEYS = {"data", "time", "counter"}
+
+# Payloads smaller than FRAME_MIN_SIZE bytes are serialized in the header frame, larger bytes and ndarray payloads
+# are sent in their own frame. Below about 128 KiB serializing is faster than tracking a zero-copy frame
+# (see bench_serializer.py)
+FRAME_MIN_SIZE = 128 * 1024
+FRAME_KEY = "__zdg_frame__"
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class ZdgSerializer:
+    """
+    Frame layer shared by the codecs. A message is sent as a small header frame, serialized by the codec,
+    followed by one raw frame per large bytes or ndarray payload. Raw frames are sent without copying them
+    (send_multipart(copy=False)) and ndarrays are rebuilt on top of the received frames with np.frombuffer
+    (the rebuilt ndarrays may be read-only)
+    """
+
+    @staticmethod
+    def extract_frames(obj, frames: list):
+        """
+        Replace large bytes and ndarray payloads in obj by a placeholder and append them to frames.
+        Containers without such payloads are returned as they are
+        """
+        obj_type = type(obj)
+        if obj_type in SCALAR_TYPES:
+            return obj
+
+        if obj_type is dict:
+            items = None
+            for key, val in obj.items():
+                if type(val) in SCALAR_TYPES:
+                    continue
+                item = ZdgSerializer.extract_frames(val, frames)
+                if item is not val:
+                    if items is None:
+                        items = dict(obj)
+                    items[key] = item
+            return obj if items is None else items
+
+        if obj_type in (list, tuple):
+            items = None
+            for idx, val in enumerate(obj):
+                if type(val) in SCALAR_TYPES:
+                    continue
+                item = ZdgSerializer.extract_frames(val, frames)
+                if item is not val:
+                    if items is None:
+                        items = list(obj)
+                    items[idx] = item
+            return obj if items is None else obj_type(items)
+
+        if obj_type in (bytes, bytearray, memoryview):
+            nbytes = memoryview(obj).nbytes if obj_type is memoryview else len(obj)
+            if nbytes < FRAME_MIN_SIZE:
+                return obj
+            frames.append(obj)
+            return {FRAME_KEY: len(frames) - 1, "type": obj_type.__name__}
+
+        if (np is not None) and (obj_type is np.ndarray):
+            # Structured and object dtypes can not be described by dtype.str, pickle them instead
+            if (obj.nbytes < FRAME_MIN_SIZE) or (obj.dtype.fields is not None) or obj.dtype.hasobject:
+                return obj
+            frames.append(np.ascontiguousarray(obj))
+            return {FRAME_KEY: len(frames) - 1, "dtype": obj.dtype.str, "shape": list(obj.shape)}
+
+        return obj
+
+    @staticmethod
+    def insert_frames(obj, frames: list):
+        """
+        Inverse of extract_frames
+        """
+        if isinstance(obj, dict):
+            if FRAME_KEY not in obj:
+                return {key: ZdgSerializer.insert_frames(val, frames) for key, val in obj.items()}
+
+            buffer = memoryview(frames[obj[FRAME_KEY]])
+            if "dtype" in obj:
+                return np.frombuffer(buffer, dtype=obj["dtype"]).reshape(obj["shape"])
+            if obj["type"] == "bytes":
+                return bytes(buffer)
+            if obj["type"] == "bytearray":
+                return bytearray(buffer)
+            return buffer
+
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(ZdgSerializer.insert_frames(val, frames) for val in obj)
+
+        return obj
+
+    @staticmethod
+    def encode_batch(codec, messages: list) -> list:
+        """
+        Encode each message with codec, the first frame holds the number of frames of each message
+        """
+        frame_cnt = []
+        frames = []
+        for message in messages:
+            message_frames = codec.encode(message)
+            frame_cnt.append(len(message_frames))
+            frames.extend(message_frames)
+        return [struct.pack(f"<{len(frame_cnt)}I", *frame_cnt)] + frames
+
+    @staticmethod
+    def decode_batch(codec, frames: list) -> list:
+        """
+        Inverse of encode_batch
+        """
+        frame_cnt = struct.unpack(f"<{len(frames[0]) // 4}I", frames[0])
+        messages = []
+        idx = 1
+        for cnt in frame_cnt:
+            messages.append(codec.decode(frames[idx : idx + cnt]))
+            idx += cnt
+        return messages
+
+    @staticmethod
+    def join_frames(frames: list) -> bytes:
+        """
+        Join frames into a single frame, sockets with ZMQ_CONFLATE drop multipart messages
+        """
+        sizes = [memoryview(frame).nbytes for frame in frames]
+        return b"".join([struct.pack(f"<I{len(sizes)}Q", len(sizes), *sizes)] + frames)
+
+    @staticmethod
+    def split_frames(frame) -> list:
+        """
+        Inverse of join_frames, large frames are returned as memoryviews of frame
+        """
+        buffer = memoryview(frame)
+        (frame_cnt,) = struct.unpack_from("<I", buffer)
+        sizes = struct.unpack_from(f"<{frame_cnt}Q", buffer, 4)
+        frames = []
+        idx = 4 + 8 * frame_cnt
+        for size in sizes:
+            item = buffer[idx : idx + size]
+            frames.append(item.tobytes() if size < FRAME_MIN_SIZE else item)
+            idx += size
+        return frames
+
+
+class ZdgPickleCodec:
+    """
+    Header frame pickled, accepts any picklable object. Only use it between trusted nodes
+    """
+
+    def __init__(self, opt: dict) -> None:
+        _ = opt
+
+    def encode(self, message) -> list:
+        """
+        encode
+        """
+        frames = []
+        header = ZdgSerializer.extract_frames(message, frames)
+        return [pickle.dumps(header, pickle.DEFAULT_PROTOCOL)] + frames
+
+    def decode(self, frames: list):
+        """
+        decode
+        """
+        header = pickle.loads(frames[0])
+        if len(frames) == 1:
+            return header
+        return ZdgSerializer.insert_frames(header, frames[1:])
+
+
+class ZdgMsgpackCodec:
+    """
+    Header frame packed with msgpack. Accepts dict, list, str, bytes, int, float, bool, None and ndarray
+    (tuples are received as lists). Nothing is executed on decode, so it is safe across trust boundaries
+    """
+
+    # msgpack extension type used for ndarrays smaller than FRAME_MIN_SIZE
+    ext_ndarray = 1
+
+    def __init__(self, opt: dict) -> None:
+        _ = opt
+        if msgpack is None:
+            print("The msgpack codec needs the msgpack package, install it using: pip install msgpack")
+            raise ImportError
+
+    @staticmethod
+    def pack_default(obj):
+        """
+        pack_default
+        """
+        if (np is not None) and isinstance(obj, np.ndarray) and (obj.dtype.fields is None) and not obj.dtype.hasobject:
+            data = msgpack.packb([obj.dtype.str, list(obj.shape), np.ascontiguousarray(obj).tobytes()])
+            return msgpack.ExtType(ZdgMsgpackCodec.ext_ndarray, data)
+        print(f"The msgpack codec can not encode objects of type {type(obj)}")
+        raise TypeError
+
+    @staticmethod
+    def unpack_ext(code: int, data: bytes):
+        """
+        unpack_ext
+        """
+        if code == ZdgMsgpackCodec.ext_ndarray:
+            dtype, shape, buffer = msgpack.unpackb(data)
+            return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+        return msgpack.ExtType(code, data)
+
+    def encode(self, message) -> list:
+        """
+        encode
+        """
+        frames = []
+        header = ZdgSerializer.extract_frames(message, frames)
+        return [msgpack.packb(header, default=ZdgMsgpackCodec.pack_default, use_bin_type=True)] + frames
+
+    def decode(self, frames: list):
+        """
+        decode
+        """
+        header = msgpack.unpackb(frames[0], ext_hook=ZdgMsgpackCodec.unpack_ext, raw=False, strict_map_key=False)
+        if len(frames) == 1:
+            return header
+        return ZdgSerializer.insert_frames(header, frames[1:])
+
+
+class ZdgStructCodec:
+    """
+    Fixed schema codec for small telemetry messages. The schema edge option lists the fields of
+    message["data"] as name:format pairs, where format is a struct format character, e.g.
+    schema=x:d,y:d,z:d,status:i. Messages are packed together with their time and counter into a
+    single struct record. Anything else, like replies, is sent as JSON
+    """
+
+    # First byte of a struct record, JSON documents never start with it
+    record_tag = b"S"
+
+    def __init__(self, opt: dict) -> None:
+        if len(opt["schema"]) == 0:
+            print("The struct codec needs a schema edge option, e.g. schema=x:d,y:d,z:d")
+            raise ValueError
+
+        self.names = []
+        fmt = "<cdq"
+        for field in opt["schema"].split(","):
+            name, field_fmt = field.split(":")
+            self.names.append(name)
+            fmt = f"{fmt}{field_fmt}"
+        self.record = struct.Struct(fmt)
+
+    def encode(self, message) -> list:
+        """
+        encode
+        """
+        if isinstance(message, dict) and (message.keys() == MESSAGE_KEYS) and isinstance(message["data"], dict):
+            data = message["data"]
+            values = [data[name] for name in self.names]
+            return [self.record.pack(ZdgStructCodec.record_tag, message["time"], message["counter"], *values)]
+        return [json.dumps(message).encode()]
+
+    def decode(self, frames: list):
+        """
+        decode
+        """
+        frame = frames[0]
+        if (len(frame) == self.record.size) and (frame[:1] == ZdgStructCodec.record_tag):
+            _, mtime, mcounter, *values = self.record.unpack(frame)
+            return {"data": dict(zip(self.names, values)), "time": mtime, "counter": mcounter}
+        return json.loads(bytes(frame))
+
+
+# Codec registry, the codec edge option selects one by name. More codecs can be added using
+# ZdgNodeIface.register_codec, any class with an __init__(opt), encode(message) and decode(frames) will do
+CODECS = {
+    "pickle": ZdgPickleCodec,
+    "msgpack": ZdgMsgpackCodec,
+    "struct": ZdgStructCodec,
+}
+
 
 class ZdgNodeIface:
     """
@@ -20,34 +412,160 @@ class ZdgNodeIface:
         pass
 
     @staticmethod
-    def create_inbound_sockets():
+    def parse_socket_list(socket_list: str):
         """
-        create_client_sockets
+        Parse the value of ZDG_INBOUND_LIST or ZDG_OUTBOUND_LIST. Entries are separated by ";" and
+        each entry is "hostname port" optionally followed by "key=val" edge options
         """
+        if len(socket_list) == 0:
+            return []
+
+        entry_list = []
+        for h_p in socket_list.split(";"):
+            h, p, *o = h_p.split()
+
+            opt = dict(EDGE_OPT)
+            for o_i in o:
+                key, val = o_i.split("=", 1)
+                if key not in EDGE_OPT:
+                    print(f"Unknown edge option {key} in {h_p}")
+                    raise ValueError
+                opt[key] = type(EDGE_OPT[key])(val)
+            if opt["mode"] not in EDGE_MODES:
+                print(f"Unknown edge mode {opt['mode']} in {h_p}")
+                raise ValueError
+            if opt["codec"] not in CODECS:
+                print(f"Unknown edge codec {opt['codec']} in {h_p}")
+                raise ValueError
+            if opt["transport"] not in EDGE_TRANSPORTS:
+                print(f"Unknown edge transport {opt['transport']} in {h_p}")
+                raise ValueError
+            if (opt["conflate"] == 1) and (opt["batch"] > 1):
+                print(f"Edge options conflate and batch can not be used together in {h_p}")
+                raise ValueError
+            if opt["overflow"] not in EDGE_OVERFLOW:
+                print(f"Unknown edge overflow {opt['overflow']} in {h_p}")
+                raise ValueError
+            if (opt["overflow"] != "block") and ((opt["conflate"] == 1) or (opt["mode"] == "push")):
+                print(f"Edge option overflow is for acked and dealer edges that are not conflated in {h_p}")
+                raise ValueError
+            if opt["record"] not in EDGE_RECORD:
+                print(f"Unknown edge record {opt['record']} in {h_p}, expected inbound or outbound")
+                raise ValueError
+            if opt["compress"] not in EDGE_COMPRESS:
+                print(f"Unknown edge compress {opt['compress']} in {h_p}, expected one of {EDGE_COMPRESS[1:]}")
+                raise ValueError
+            if opt["queue"] < 1:
+                print(f"Edge option queue needs room for at least one message in {h_p}")
+                raise ValueError
+            if opt["heartbeat"] <= 0:
+                print(f"Edge option heartbeat must be a positive number of milliseconds in {h_p}")
+                raise ValueError
+            if (opt["shm"] > 0) and ((opt["mode"] == "push") or (opt["conflate"] == 1)):
+                print(f"Edge option shm needs replies to release its slots, it can not be used with push or conflate "
+                      f"in {h_p}")
+                raise ValueError
+            if (opt["shm"] > 0) and (opt["transport"] == "tcp"):
+                print(f"Edge option shm needs both nodes on the same host, use transport ipc or inproc in {h_p}")
+                raise ValueError
+
+            entry_list.append((str(h), int(p), opt))
+
+        return entry_list
 
-        inbound_list = str(os.environ["ZDG_INBOUND_LIST"])
-        print(f"Inbound list: {inbound_list}")
+    @staticmethod
+    def register_codec(name: str, codec_cls):
+        """
+        Make codec_cls selectable using the codec=name edge option
+        """
+        CODECS[name] = codec_cls
+
+    @staticmethod
+    def create_codec(opt: dict):
+        """
+        create_codec
+        """
+        return CODECS[opt["codec"]](opt)
+
+    @staticmethod
+    def get_socket_url(hostname: str, port: int, opt: dict):
+        """
+        With the ipc and inproc transports the hostname is not used, both ends of the edge are found by its port
+        """
+        if opt["transport"] == "inproc":
+            return f"inproc://zdg-{port}"
+        if opt["transport"] == "ipc":
+            ipc_dir = os.environ.get("ZDG_IPC_DIR", "/tmp")
+            return f"ipc://{ipc_dir}/zdg-{port}"
+        return f"tcp://{hostname}:{port}"
+
+    @staticmethod
+    def create_inbound_socket(socket_url: str, opt: dict, ctx=None):
+        """
+        create_inbound_socket, ctx defaults to the module context
+        """
+        ctx = context if ctx is None else ctx
+        socket_socket = ctx.socket(EDGE_MODES[opt["mode"]][1])
+        if opt["mode"] == "push":
+            socket_socket.setsockopt(zmq.RCVHWM, opt["window"])
+            socket_socket.setsockopt(zmq.CONFLATE, opt["conflate"])
+        ZdgNodeIface.set_heartbeat(socket_socket, opt)
+        print(f"Binding socket to {socket_url} (mode {opt['mode']})")
+        socket_socket.bind(socket_url)
+        return socket_socket
+
+    @staticmethod
+    def create_outbound_socket(socket_url: str, opt: dict, ctx=None, monitor: bool = False):
+        """
+        create_outbound_socket, ctx defaults to the module context. With monitor, handshakes are reported to the
+        socket returned by get_monitor_socket
+        """
+        ctx = context if ctx is None else ctx
+        socket_socket = ctx.socket(EDGE_MODES[opt["mode"]][0])
+        if opt["mode"] == "push":
+            socket_socket.setsockopt(zmq.SNDHWM, opt["window"])
+            socket_socket.setsockopt(zmq.SNDTIMEO, opt["timeout"])
+            socket_socket.setsockopt(zmq.CONFLATE, opt["conflate"])
+        ZdgNodeIface.set_heartbeat(socket_socket, opt)
+        # Connections are retried without backing off, so a node that comes up is found within BACKOFF_MIN. Rebuilding
+        # the socket of a suspect edge backs off instead, see check_outbound_socket
+        socket_socket.setsockopt(zmq.RECONNECT_IVL, int(BACKOFF_MIN * 1000))
+        if monitor:
+            # Push edges are confirmed by the ZMTP handshake, the monitor has to be there before the connection is
+            # made. get_monitor_socket returns the same socket until disable_monitor, see wait_outbound_ready
+            socket_socket.get_monitor_socket(zmq.EVENT_HANDSHAKE_SUCCEEDED)
+        print(f"Connecting socket to {socket_url} (mode {opt['mode']})")
+        socket_socket.connect(socket_url)
+        return socket_socket
+
+    @staticmethod
+    def set_heartbeat(socket_socket, opt: dict):
+        """
+        ZMTP heartbeats, a connection whose peer stops answering them for 3 intervals is closed and reconnected
+        """
+        socket_socket.setsockopt(zmq.HEARTBEAT_IVL, opt["heartbeat"])
+        socket_socket.setsockopt(zmq.HEARTBEAT_TIMEOUT, 3 * opt["heartbeat"])
 
-        if len(inbound_list) == 0:
-            return {}
+    @staticmethod
+    def create_inbound_sockets(ctx=None, inbound_list: str = None):
+        """
+        create_client_sockets, inbound_list defaults to ZDG_INBOUND_LIST
+        """
+
+        if inbound_list is None:
+            inbound_list = str(os.environ["ZDG_INBOUND_LIST"])
+        print(f"Inbound list: {inbound_list}")
 
         inbound_sockets = {}
         socket_cnt = 0
-        for h_p in inbound_list.split(";"):
+        for h, p, opt in ZdgNodeIface.parse_socket_list(inbound_list):
             socket_cnt += 1
 
-            h, p = h_p.split()
-            # print(f"h_p {h_p}")
-            # print(f"h {h}")
-            # print(f"p {p}")
-
-            socket_hostname = str(h)
-            socket_port = int(p)
+            socket_hostname = h
+            socket_port = p
 
-            socket_socket = context.socket(zmq.REP)
-            socket_url = f"tcp://{socket_hostname}:{socket_port}"
-            print(f"Binding socket to {socket_url}")
-            socket_socket.bind(socket_url)
+            socket_url = ZdgNodeIface.get_socket_url(socket_hostname, socket_port, opt)
+            socket_socket = ZdgNodeIface.create_inbound_socket(socket_url, opt, ctx)
 
             # Subscribe to zipcode, default is NYC, 10001
             # topic_filter = "10001"
@@ -59,147 +577,1034 @@ class ZdgNodeIface:
                 "port": socket_port,
                 "url": socket_url,
                 "socket": socket_socket,
+                "opt": opt,
+                "codec": ZdgNodeIface.create_codec(opt),
             }
+            if opt["shm"] > 0:
+                ring = ZdgShmRing(f"zdg-{socket_port}", opt["shm"], opt["shm_size"], create=False)
+                inbound_sockets[f"socket_{socket_cnt}"]["shm"] = ring
+            if opt["compress"] != "":
+                inbound_sockets[f"socket_{socket_cnt}"]["compressor"] = ZdgCompressor(opt)
+            if opt["record"] == "inbound":
+                inbound_sockets[f"socket_{socket_cnt}"]["record"] = ZdgNodeIface.create_record_log(socket_port, opt)
+            metrics.add_edge("inbound", inbound_sockets[f"socket_{socket_cnt}"])
 
         return inbound_sockets
 
     @staticmethod
-    def create_outbound_sockets():
+    def create_outbound_sockets(ctx=None, outbound_list: str = None):
         """
-        create_server_sockets
+        create_server_sockets, outbound_list defaults to ZDG_OUTBOUND_LIST
         """
 
-        outbound_list = str(os.environ["ZDG_OUTBOUND_LIST"])
+        if outbound_list is None:
+            outbound_list = str(os.environ["ZDG_OUTBOUND_LIST"])
         print(f"Outbound list: {outbound_list}")
 
-        if len(outbound_list) == 0:
-            return {}
-
         outbound_sockets = {}
         socket_cnt = 0
-        for h_p in outbound_list.split(";"):
+        for h, p, opt in ZdgNodeIface.parse_socket_list(outbound_list):
             socket_cnt += 1
 
-            h, p = h_p.split()
-            # print(f"h_p {h_p}")
-            # print(f"h {h}")
-            # print(f"p {p}")
-
-            socket_hostname = str(h)
+            socket_hostname = h
             # pub_hostname = "0.0.0.0"
-            socket_port = int(p)
+            socket_port = p
 
             # pub_socket = context.socket(zmq.PUB)
             # pub_url = f"tcp://{pub_hostname}:{pub_port}"
             # print(f"Connecting socket to {pub_url}")
             # pub_socket.connect(pub_url)
 
-            socket_socket = context.socket(zmq.REQ)
-            socket_url = f"tcp://{socket_hostname}:{socket_port}"
-            print(f"Connecting socket to {socket_url}")
-            socket_socket.connect(socket_url)
+            socket_url = ZdgNodeIface.get_socket_url(socket_hostname, socket_port, opt)
+            monitor = (opt["mode"] == "push") and (opt["transport"] != "inproc")
+            socket_socket = ZdgNodeIface.create_outbound_socket(socket_url, opt, ctx, monitor)
 
             outbound_sockets[f"socket_{socket_cnt}"] = {
                 "hostname": socket_hostname,
                 "port": socket_port,
                 "url": socket_url,
                 "socket": socket_socket,
+                "opt": opt,
+                "codec": ZdgNodeIface.create_codec(opt),
+                "in_flight": 0,
+                "held": None,
+                "deadline": 0.0,
+                "suspect": False,
+                "failures": 0,
+                "dropped": 0,
+                "batch": [],
+                "batch_deadline": 0.0,
+                "queue": collections.deque(),
+                "sent": collections.deque(),
+                "probe": None,
+                "backoff": BACKOFF_MIN,
             }
-
+            if opt["shm"] > 0:
+                ring = ZdgShmRing(f"zdg-{socket_port}", opt["shm"], opt["shm_size"], create=True)
+                outbound_sockets[f"socket_{socket_cnt}"]["shm"] = ring
+            if opt["overflow"] == "spill":
+                outbound_sockets[f"socket_{socket_cnt}"]["spill"] = ZdgSpillQueue(f"zdg-{socket_port}")
+            if opt["compress"] != "":
+                outbound_sockets[f"socket_{socket_cnt}"]["compressor"] = ZdgCompressor(opt)
+            if opt["record"] == "outbound":
+                outbound_sockets[f"socket_{socket_cnt}"]["record"] = ZdgNodeIface.create_record_log(socket_port, opt)
+            metrics.add_edge("outbound", outbound_sockets[f"socket_{socket_cnt}"])
+
+        ZdgNodeIface.create_replica_groups(outbound_sockets)
         return outbound_sockets
 
     @staticmethod
-    def process_outbound_message(message: dict, socket_dict: dict):
+    def create_record_log(port: int, opt: dict):
         """
-        process_outbound_message
+        Log of the edge, named after the node and the port of the edge so that the replicas of a node do not share it
+        """
+        node_name = os.environ.get("ZDG_CONTAINER_NAME", "zdg")
+        return ZdgRecordLog(f"{node_name}-{port}", opt)
+
+    @staticmethod
+    def create_replica_groups(outbound_sockets: dict):
         """
+        Outbound edges with the same group option are the edges to the replicas of a node. They share a
+        {"name", "members", "keys", "next"} dict under the "group" key, with the socket dicts of the edges, their
+        keys in outbound_sockets and the round robin position
+        """
+        group_dict = {}
+        for out_key, out_val in outbound_sockets.items():
+            name = out_val["opt"]["group"]
+            if len(name) == 0:
+                continue
+            group = group_dict.setdefault(name, {"name": name, "members": [], "keys": [], "next": 0})
+            group["members"].append(out_val)
+            group["keys"].append(out_key)
+            out_val["group"] = group
+
+    @staticmethod
+    def select_replica(message: dict, group: dict):
+        """
+        With the key option, messages with the same key go to the same replica while it is not suspect. Otherwise
+        to the replica with the fewest messages in flight, in round robin order among equals. Suspect replicas
+        are skipped unless all of them are suspect
+        """
+        members = group["members"]
+        key = members[0]["opt"]["key"]
+        if len(key) > 0:
+            data = message.get("data") if isinstance(message, dict) else None
+            value = data.get(key) if isinstance(data, dict) else None
+            # crc32 instead of hash(), every node has to send a key to the same replica
+            start = zlib.crc32(str(value).encode()) % len(members)
+            for i in range(len(members)):
+                member = members[(start + i) % len(members)]
+                if not member["suspect"]:
+                    return member
+            return members[start]
+
+        start = group["next"]
+        order = members[start:] + members[:start]
+        healthy = [member for member in order if not member["suspect"]]
+        member = min(healthy if len(healthy) > 0 else order, key=lambda member: member["in_flight"])
+        group["next"] = (members.index(member) + 1) % len(members)
+        return member
+
+    @staticmethod
+    def has_idle_replica(socket_dict: dict) -> bool:
+        """
+        True if the edge is in a replica group with a healthy replica that has no message in flight. An acked edge
+        of the group is not waited for then, so that the group keeps up to one message in flight per replica
+        """
+        if "group" not in socket_dict:
+            return False
+        return any((member["in_flight"] == 0) and not member["suspect"] for member in socket_dict["group"]["members"])
+
+    @staticmethod
+    def get_outbound_targets(message: dict, outbound_sockets: dict):
+        """
+        Outbound sockets message is sent to: every edge that is not in a replica group and one edge per group
+        """
+        targets = {}
+        for out_key, out_val in outbound_sockets.items():
+            if "group" not in out_val:
+                targets[out_key] = out_val
+                continue
+            group = out_val["group"]
+            if out_val is group["members"][0]:
+                member = ZdgNodeIface.select_replica(message, group)
+                targets[group["keys"][group["members"].index(member)]] = member
+        return targets
+
+    @staticmethod
+    def encode_frames(message, codec, batch: bool = False, join: bool = False, compressor=None) -> list:
+        """
+        With batch, message is a list of messages sent together. With join, all frames are joined into one.
+        With compressor, large frames are compressed, see ZdgCompressor
+        """
+        if batch:
+            frames = ZdgSerializer.encode_batch(codec, message)
+        else:
+            frames = codec.encode(message)
+        if compressor is not None:
+            frames = compressor.compress(frames)
+        if join:
+            frames = [ZdgSerializer.join_frames(frames)]
+        return frames
+
+    @staticmethod
+    def decode_frames(frames: list, codec, batch: bool = False, join: bool = False, compressor=None):
+        """
+        Inverse of encode_frames, returns the list of messages with batch
+        """
+        if join:
+            frames = ZdgSerializer.split_frames(frames[0])
+        if compressor is not None:
+            frames = compressor.decompress(frames)
+        if batch:
+            return ZdgSerializer.decode_batch(codec, frames)
+        return codec.decode(frames)
+
+    @staticmethod
+    def get_edge_framing(opt: dict):
+        """
+        Returns the batch and join arguments of encode_frames and decode_frames for an edge
+        """
+        batch = opt["batch"] > 1
+        join = (opt["conflate"] == 1) and (opt["mode"] == "push")
+        return batch, join
+
+    @staticmethod
+    def send_message(
+        socket, message, codec, envelope: list = None, flags: int = 0, batch: bool = False, join: bool = False
+    ):
+        """
+        Send message as a multipart message, envelope frames (ROUTER identities) are sent first.
+        Returns the number of bytes sent
+        """
+        frames = ZdgNodeIface.encode_frames(message, codec, batch, join)
+        if envelope is not None:
+            frames = envelope + frames
+        ZdgNodeIface.send_frames(socket, frames, flags)
+        return ZdgMetrics.get_frames_size(frames)
+
+    @staticmethod
+    def send_frames(socket, frames: list, flags: int = 0, copy: bool = False):
+        """
+        send_frames
+        """
+        if len(frames) == 1:
+            socket.send(frames[0], flags=flags)
+        else:
+            socket.send_multipart(frames, flags=flags, copy=copy)
+
+    @staticmethod
+    def recv_frames(socket) -> list:
+        """
+        Receive all the frames of a multipart message, large frames are not copied
+        """
+        # Envelope and header frames are small, copying them is cheaper than tracking zero-copy frames
+        frames = [socket.recv()]
+        while socket.getsockopt(zmq.RCVMORE):
+            frame = socket.recv(copy=False)
+            frames.append(frame.bytes if len(frame) < FRAME_MIN_SIZE else frame)
+        return frames
+
+    @staticmethod
+    def recv_message(socket, codec, envelope_len: int = 0, batch: bool = False, join: bool = False):
+        """
+        Receive a multipart message, returns the envelope frames and the decoded message
+        """
+        frames = ZdgNodeIface.recv_frames(socket)
+        return frames[:envelope_len], ZdgNodeIface.decode_frames(frames[envelope_len:], codec, batch, join)
+
+    @staticmethod
+    def send_edge_message(socket_dict: dict, message, envelope: list = None, flags: int = 0):
+        """
+        send_message using the codec and the options of the edge
+        """
+        batch, join = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+        compressor = socket_dict.get("compressor")
+        frames = ZdgNodeIface.encode_frames(message, socket_dict["codec"], batch, join, compressor)
+        socket_dict["metrics"]["bytes"] += ZdgMetrics.get_frames_size(frames)
+        if envelope is None:
+            ZdgNodeIface.tap_edge_frames(socket_dict, frames, "outbound")
+            frames = ZdgNodeIface.put_shm_frames(socket_dict, frames)
+        else:
+            frames = envelope + frames
+        ZdgNodeIface.send_frames(socket_dict["socket"], frames, flags, socket_dict.get("copy", False))
+
+    @staticmethod
+    def recv_edge_message(socket_dict: dict, envelope_len: int = 0):
+        """
+        recv_message using the codec and the options of the edge. The message is None for heartbeats
+        """
+        batch, join = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+        frames = ZdgNodeIface.recv_frames(socket_dict["socket"])
+        if ZdgNodeIface.is_heartbeat(frames, envelope_len):
+            return frames[:envelope_len], None
+        socket_dict["metrics"]["bytes"] += ZdgMetrics.get_frames_size(frames)
+        frames, envelope_len = ZdgNodeIface.get_shm_frames(socket_dict, frames, envelope_len)
+        ZdgNodeIface.tap_edge_frames(socket_dict, frames[envelope_len:], "inbound")
+        compressor = socket_dict.get("compressor")
+        message = ZdgNodeIface.decode_frames(frames[envelope_len:], socket_dict["codec"], batch, join, compressor)
+        return frames[:envelope_len], message
+
+    @staticmethod
+    def tap_edge_frames(socket_dict: dict, frames: list, direction: str):
+        """
+        Append the frames of a request to the log of the edge, if this end of the edge records it. Requests are sent
+        by outbound edges and received by inbound edges, the replies are not recorded
+        """
+        if ("record" in socket_dict) and (socket_dict["opt"]["record"] == direction):
+            if (direction == "inbound") and ("shm" in socket_dict):
+                # Frames in a shared memory ring are only valid until the reply, the writer thread runs later
+                frames = [bytes(frame) for frame in frames]
+            socket_dict["record"].put(time.time(), frames)
+
+    @staticmethod
+    def is_heartbeat(frames: list, envelope_len: int = 0) -> bool:
+        """
+        is_heartbeat
+        """
+        return (len(frames) == envelope_len + 1) and (frames[envelope_len] == HEARTBEAT_FRAME)
+
+    @staticmethod
+    def put_shm_frames(socket_dict: dict, frames: list) -> list:
+        """
+        Requests of shm outbound edges, large frames go into the shared memory ring, see ZdgShmRing
+        """
+        if "shm" not in socket_dict:
+            return frames
+        return socket_dict["shm"].put_frames(frames, FRAME_MIN_SIZE)
+
+    @staticmethod
+    def get_shm_frames(socket_dict: dict, frames: list, envelope_len: int):
+        """
+        On shm inbound edges, read the frames in the shared memory ring and keep the index frame in the envelope,
+        so that the reply echoes it. On shm outbound edges, the echoed index frame releases the slots.
+        Returns the frames and the envelope length
+        """
+        if "shm" not in socket_dict:
+            return frames, envelope_len
+
+        ring = socket_dict["shm"]
+        if ring.owner:
+            ring.release_frames(frames[envelope_len])
+            return frames[:envelope_len] + frames[envelope_len + 1 :], envelope_len
+
+        payload = ring.get_frames(frames[envelope_len], frames[envelope_len + 1 :])
+        return frames[: envelope_len + 1] + payload, envelope_len + 1
+
+    @staticmethod
+    def set_shm_copy(inbound_sockets: dict, outbound_sockets: dict):
+        """
+        Zero-copy sends keep a reference to the frames until they leave the node, which can be after the reply to a
+        shm inbound edge released them. Outbound sockets of nodes with shm inbound edges copy their frames instead
+        """
+        if any("shm" in in_val for in_val in inbound_sockets.values()):
+            for out_val in outbound_sockets.values():
+                out_val["copy"] = True
+
+    @staticmethod
+    def get_edge_messages(socket_dict: dict, message) -> list:
+        """
+        message is a list of messages with the batch edge option
+        """
+        return message if socket_dict["opt"]["batch"] > 1 else [message]
+
+    @staticmethod
+    def record_edge_messages(socket_dict: dict, message):
+        """
+        Add message to the metrics of the edge
+        """
+        ZdgMetrics.record_messages(socket_dict, ZdgNodeIface.get_edge_messages(socket_dict, message))
+
+    @staticmethod
+    def reset_outbound_socket(socket_dict: dict):
+        """
+        Close a socket that stopped replying and connect a new one in its place (lazy pirate pattern).
+        Messages in flight on the old socket are queued again, or lost without the resend edge option
+        """
+        socket_url = socket_dict["url"]
+        opt = socket_dict["opt"]
+
+        # Socket is confused. Close and remove it.
         socket = socket_dict["socket"]
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.close()
+
+        if not socket_dict["suspect"]:
+            print(f"No response from server {socket_url}, reconnecting")
+        socket_dict["socket"] = ZdgNodeIface.create_outbound_socket(socket_url, opt)
+        socket_dict["in_flight"] = 0
+        if socket_dict["held"] is not None:
+            socket_dict["held"] = None
+            socket_dict["dropped"] += 1
+        # Spilled and resent edges keep their queue, it is sent in order once the edge replies again
+        if (opt["overflow"] != "spill") and (opt["resend"] == 0):
+            socket_dict["dropped"] += len(socket_dict["queue"])
+            socket_dict["queue"].clear()
+        ZdgNodeIface.requeue_sent_messages(socket_dict)
+
+        if "shm" in socket_dict:
+            socket_dict["shm"].release_all()
+
+        ZdgNodeIface.update_backoff(socket_dict)
+        socket_dict["failures"] += 1
+        socket_dict["suspect"] = True
+        socket_dict["metrics"]["timeouts"] += 1
+        socket_dict["metrics"]["reconnects"] += 1
+        if socket_dict["failures"] == opt["retries"]:
+            print(f"Server {socket_url} seems to be offline, skipping it until it replies")
+
+    @staticmethod
+    def requeue_sent_messages(socket_dict: dict):
+        """
+        With the resend edge option, messages in flight go back to the front of the queue, in the order they were
+        sent. The server may have processed some of them already
+        """
+        opt = socket_dict["opt"]
+        sent = socket_dict["sent"]
+        if (opt["resend"] == 1) and (opt["conflate"] == 0):
+            socket_dict["queue"].extendleft(reversed(sent))
+            socket_dict["metrics"]["resent"] += len(sent)
+        sent.clear()
+
+    @staticmethod
+    def update_backoff(socket_dict: dict):
+        """
+        Double the wait for the reply to the next liveness probe of a suspect edge, up to the heartbeat interval
+        """
+        socket_dict["probe"] = None
+        if socket_dict["suspect"]:
+            socket_dict["backoff"] = min(2 * socket_dict["backoff"], socket_dict["opt"]["heartbeat"] / 1000)
+        else:
+            socket_dict["backoff"] = BACKOFF_MIN
+
+    @staticmethod
+    def get_ready_timeout() -> float:
+        """
+        get_ready_timeout
+        """
+        return float(os.environ.get("ZDG_READY_TIMEOUT", READY_TIMEOUT))
+
+    @staticmethod
+    def get_ready_probes(outbound_sockets: dict) -> dict:
+        """
+        Sockets to poll for the readiness handshake, mapped to their edge: the socket of acked and dealer edges, which
+        gets the reply to a heartbeat, and the monitor of push edges, which gets their ZMTP handshake. Push edges
+        over inproc are ready at once, their messages wait in the socket until the other end binds
+        """
+        probes = {}
+        for out_key, out_val in outbound_sockets.items():
+            opt = out_val["opt"]
+            if opt["mode"] != "push":
+                probes[out_val["socket"]] = out_key
+            elif opt["transport"] != "inproc":
+                probes[out_val["socket"].get_monitor_socket()] = out_key
+        return probes
+
+    @staticmethod
+    def set_edge_ready(socket_dict: dict, t_ready: float):
+        """
+        set_edge_ready
+        """
+        socket_dict["metrics"]["ready_s"] = t_ready
+        print(f"Edge {socket_dict['url']} is ready after {t_ready:.3f} s")
+
+    @staticmethod
+    def finish_ready_probes(outbound_sockets: dict, probes: dict):
+        """
+        Stop the monitors of push edges. Acked and dealer edges that are still not ready are left to the connection
+        manager, with their heartbeat in flight
+        """
+        for out_val in outbound_sockets.values():
+            if out_val["opt"]["mode"] != "push":
+                continue
+            if out_val["opt"]["transport"] != "inproc":
+                monitor = out_val["socket"].get_monitor_socket()
+                out_val["socket"].disable_monitor()
+                monitor.close(linger=0)
+
+        for out_key in probes.values():
+            out_val = outbound_sockets[out_key]
+            print(f"Edge {out_val['url']} is not ready, starting anyway")
+            out_val["suspect"] = True
+            if out_val["opt"]["mode"] != "push":
+                out_val["in_flight"] += 1
+                out_val["probe"] = time.time() + out_val["backoff"]
+
+    @staticmethod
+    def wait_outbound_ready(outbound_sockets: dict, ready_timeout: float = None):
+        """
+        Readiness handshake. A node binds its inbound sockets only once all its outbound edges are ready, so an edge
+        is ready when the node at its other end, and the whole graph downstream of it, is. Sources start sending
+        once their outbound edges are ready, a graph comes up as fast as its slowest node. After ready_timeout
+        (default get_ready_timeout) the node starts anyway
+        """
+        if ready_timeout is None:
+            ready_timeout = ZdgNodeIface.get_ready_timeout()
+        t_0 = time.time()
+
+        probes = ZdgNodeIface.get_ready_probes(outbound_sockets)
+        poller = zmq.Poller()
+        for socket, out_key in probes.items():
+            if socket is outbound_sockets[out_key]["socket"]:
+                ZdgNodeIface.send_frames(socket, [HEARTBEAT_FRAME])
+            poller.register(socket, zmq.POLLIN)
+
+        while len(probes) > 0:
+            poll_timeout = (t_0 + ready_timeout - time.time()) * 1000
+            if poll_timeout <= 0:
+                break
+            for socket in dict(poller.poll(poll_timeout)):
+                socket.recv_multipart()
+                poller.unregister(socket)
+                out_key = probes.pop(socket)
+                ZdgNodeIface.set_edge_ready(outbound_sockets[out_key], time.time() - t_0)
+
+        ZdgNodeIface.finish_ready_probes(outbound_sockets, probes)
+
+    @staticmethod
+    def check_outbound_socket(socket_dict: dict):
+        """
+        Connection manager of a suspect acked or dealer edge. A heartbeat is sent as a liveness probe and, if it is
+        not answered within the backoff, the socket is rebuilt and probed again. Once a probe is answered the edge
+        is healthy again and its queued messages are sent, see recv_outbound_reply. Replies are not waited for, they
+        are received by send_outbound_request and collect_outbound_replies
+        """
+        if (not socket_dict["suspect"]) or (socket_dict["opt"]["mode"] == "push"):
+            return
+
+        now = time.time()
+        if socket_dict["probe"] is not None:
+            if now < socket_dict["probe"]:
+                return
+            ZdgNodeIface.reset_outbound_socket(socket_dict)
+
+        # A REQ socket can only send once the reply to its previous request arrived
+        if (socket_dict["opt"]["mode"] == "acked") and (socket_dict["in_flight"] > 0):
+            return
+        ZdgNodeIface.send_frames(socket_dict["socket"], [HEARTBEAT_FRAME])
+        socket_dict["in_flight"] += 1
+        socket_dict["probe"] = now + socket_dict["backoff"]
+
+    @staticmethod
+    def send_outbound_frames(message: dict, socket_dict: dict):
+        """
+        send_outbound_frames
+        """
+        ZdgTrace.stamp_trace(ZdgNodeIface.get_edge_messages(socket_dict, message))
+        ZdgNodeIface.send_edge_message(socket_dict, message)
+        ZdgNodeIface.record_edge_messages(socket_dict, message)
+        socket_dict["sent"].append(message)
+        socket_dict["in_flight"] += 1
+        socket_dict["deadline"] = time.time() + socket_dict["opt"]["timeout"] / 1000
+
+    @staticmethod
+    def recv_outbound_reply(socket_dict: dict):
+        """
+        Receive one reply (None for a heartbeat) and, if messages were held back or queued waiting for room in the
+        window, send them
+        """
+        _, reply = ZdgNodeIface.recv_edge_message(socket_dict)
+        if (reply is not None) and (len(socket_dict["sent"]) > 0):
+            socket_dict["sent"].popleft()
+
+        socket_dict["in_flight"] -= 1
+        socket_dict["deadline"] = time.time() + socket_dict["opt"]["timeout"] / 1000
+        socket_dict["failures"] = 0
+        socket_dict["suspect"] = False
+        ZdgNodeIface.update_backoff(socket_dict)
+
+        if socket_dict["held"] is not None:
+            message = socket_dict["held"]
+            socket_dict["held"] = None
+            ZdgNodeIface.send_outbound_frames(message, socket_dict)
+        ZdgNodeIface.send_queued_messages(socket_dict)
+
+        return reply
+
+    @staticmethod
+    def get_window(opt: dict) -> int:
+        """
+        Messages in flight allowed by the edge, every reply returns a credit.
+        A REQ socket allows only one message in flight, conflated edges keep the rest in the latest value slot
+        """
+        if (opt["mode"] == "acked") or (opt["conflate"] == 1):
+            return 1
+        return opt["window"]
+
+    @staticmethod
+    def get_queued_count(socket_dict: dict) -> int:
+        """
+        get_queued_count
+        """
+        spill = socket_dict.get("spill")
+        return len(socket_dict["queue"]) + (0 if spill is None else len(spill))
+
+    @staticmethod
+    def queue_outbound_message(message, socket_dict: dict):
+        """
+        Queue a message until a reply returns a credit, applying the overflow policy if the queue is full.
+        Spilled messages stay behind the ones in the queue, and new messages behind the spilled ones.
+        Returns False if a message was dropped
+        """
+        opt = socket_dict["opt"]
+        queue = socket_dict["queue"]
+        overflow = opt["overflow"]
+
+        spilled = ("spill" in socket_dict) and (len(socket_dict["spill"]) > 0)
+        if (len(queue) < opt["queue"]) and not spilled:
+            queue.append(message)
+            if overflow == "block":
+                # The node waits for room in the queue, see collect_outbound_replies
+                socket_dict["deadline"] = time.time() + opt["timeout"] / 1000
+            return True
+
+        if overflow == "drop_newest":
+            socket_dict["dropped"] += 1
+            return False
+        if overflow == "drop_oldest":
+            queue.popleft()
+            queue.append(message)
+            socket_dict["dropped"] += 1
+            return False
+        if overflow == "spill":
+            ZdgNodeIface.spill_outbound_message(message, socket_dict)
+            return True
+
+        # block, the queue is only full after the edge was reset
+        queue.append(message)
+        return True
+
+    @staticmethod
+    def spill_outbound_message(message, socket_dict: dict):
+        """
+        Messages are spilled using the codec of the edge, as they would be sent
+        """
+        batch, _ = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+        frames = ZdgNodeIface.encode_frames(message, socket_dict["codec"], batch, join=True)
+        socket_dict["spill"].put(frames[0])
+        socket_dict["metrics"]["spilled"] += 1
+
+    @staticmethod
+    def pop_queued_message(socket_dict: dict):
+        """
+        Oldest queued message, the queue is refilled from the spill file
+        """
+        queue = socket_dict["queue"]
+        spill = socket_dict.get("spill")
+        if (spill is not None) and (len(spill) > 0) and (len(queue) < socket_dict["opt"]["queue"]):
+            batch, _ = ZdgNodeIface.get_edge_framing(socket_dict["opt"])
+            queue.append(ZdgNodeIface.decode_frames([spill.get()], socket_dict["codec"], batch, join=True))
+        return queue.popleft()
+
+    @staticmethod
+    def send_queued_messages(socket_dict: dict):
+        """
+        Send queued messages while there are credits left
+        """
+        window = ZdgNodeIface.get_window(socket_dict["opt"])
+        while (socket_dict["in_flight"] < window) and (ZdgNodeIface.get_queued_count(socket_dict) > 0):
+            ZdgNodeIface.send_outbound_frames(ZdgNodeIface.pop_queued_message(socket_dict), socket_dict)
+
+    @staticmethod
+    def send_outbound_message(message: dict, socket_dict: dict):
+        """
+        Send message without waiting for its reply. With the batch edge option, message is added to the batch of
+        the edge and the batch is sent once full, see also flush_outbound_batches
+        """
+        opt = socket_dict["opt"]
+        if opt["batch"] <= 1:
+            return ZdgNodeIface.send_outbound_request(message, socket_dict)
+
+        batch = socket_dict["batch"]
+        if len(batch) == 0:
+            socket_dict["batch_deadline"] = time.time() + opt["batch_ms"] / 1000
+        batch.append(message)
+        if len(batch) < opt["batch"]:
+            return True
+
+        socket_dict["batch"] = []
+        return ZdgNodeIface.send_outbound_request(batch, socket_dict)
+
+    @staticmethod
+    def flush_outbound_batches(outbound_sockets: dict):
+        """
+        Send the batches that waited batch_ms or more. Returns the milliseconds until the next batch
+        has to be sent, None if there are no batches waiting
+        """
+        now = time.time()
+        poll_timeout = None
+        for out_val in outbound_sockets.values():
+            batch = out_val["batch"]
+            if len(batch) == 0:
+                continue
+            if out_val["batch_deadline"] <= now:
+                out_val["batch"] = []
+                ZdgNodeIface.send_outbound_request(batch, out_val)
+                continue
+            batch_timeout = (out_val["batch_deadline"] - now) * 1000
+            poll_timeout = batch_timeout if poll_timeout is None else min(poll_timeout, batch_timeout)
+        return poll_timeout
+
+    @staticmethod
+    def send_outbound_request(message, socket_dict: dict):
+        """
+        Send a request (a message or, with the batch edge option, a list of messages) without waiting for its
+        reply. Returns False if the request was dropped because the edge is not replying (or, for push edges,
+        its high water mark was reached within the timeout)
+        """
         socket_url = socket_dict["url"]
+        opt = socket_dict["opt"]
+        mode = opt["mode"]
 
         verbose = False
 
         # Send request to server
         if verbose:
             print(f"[outbound] Sending to     {socket_url} a reqst with keys: {message.keys()}")
-        try:
-            socket.send_pyobj(message)
-        except zmq.error.ZMQError:
-            print("")
-            print("")
-            fname = ZdgNodeIface.process_outbound_message.__name__
-            print(f"[{fname}] zmq.error.ZMQError: Socket operation on non-socket")
-            print(f"[{fname}] {ZdgNodeIface.create_outbound_sockets.__name__}")
-            print("")
-            print("")
-            ZdgNodeIface.create_outbound_sockets()
-
-        # # Get the reply from server
-        # reply = socket.recv_pyobj()
-        # print(f"[outbound] Receiving from {socket_url}: {reply}")
-
-        request_timeout = 2500
-        request_retries = 3
-        server_endpoint = socket_url
-
-        retries_left = request_retries
+
+        if mode == "push":
+            # Block up to the timeout (SNDTIMEO) only while the edge is healthy
+            flags = zmq.DONTWAIT if socket_dict["suspect"] else 0
+            ZdgTrace.stamp_trace(ZdgNodeIface.get_edge_messages(socket_dict, message))
+            try:
+                ZdgNodeIface.send_edge_message(socket_dict, message, flags=flags)
+            except zmq.error.Again:
+                if not socket_dict["suspect"]:
+                    print(f"Server {socket_url} is not receiving, skipping it until it does")
+                    socket_dict["metrics"]["timeouts"] += 1
+                socket_dict["suspect"] = True
+                socket_dict["dropped"] += 1
+                return False
+            socket_dict["suspect"] = False
+            ZdgNodeIface.record_edge_messages(socket_dict, message)
+            return True
+
+        if opt["conflate"] == 1:
+            # Replace the older message in the latest value slot first, so that the replies below send this one
+            if socket_dict["held"] is not None:
+                socket_dict["dropped"] += 1
+            socket_dict["held"] = message
+
+        # Collect replies that already arrived
+        while (socket_dict["in_flight"] > 0) and ((socket_dict["socket"].poll(0) & zmq.POLLIN) != 0):
+            ZdgNodeIface.recv_outbound_reply(socket_dict)
+
+        if opt["conflate"] == 1:
+            if socket_dict["held"] is None:
+                return True
+            socket_dict["held"] = None
+
+        queued = ZdgNodeIface.get_queued_count(socket_dict) > 0
+        has_credit = (socket_dict["in_flight"] < ZdgNodeIface.get_window(opt)) and not socket_dict["suspect"]
+        if has_credit and not queued:
+            ZdgNodeIface.send_outbound_frames(message, socket_dict)
+            return True
+
+        if (opt["conflate"] == 1) and (time.time() < socket_dict["deadline"]):
+            # Sent as soon as the reply arrives, see watch_held_messages
+            socket_dict["held"] = message
+            return True
+
+        if (opt["conflate"] == 0) and not socket_dict["suspect"]:
+            # Send it as soon as a reply makes room for it, see collect_outbound_replies
+            return ZdgNodeIface.queue_outbound_message(message, socket_dict)
+
+        # Do not wait for a suspect edge, its connection manager probes it until it replies again
+        ZdgNodeIface.check_outbound_socket(socket_dict)
+
+        if opt["overflow"] == "spill":
+            ZdgNodeIface.spill_outbound_message(message, socket_dict)
+            return True
+
+        socket_dict["dropped"] += 1
+        return False
+
+    @staticmethod
+    def collect_outbound_replies(outbound_sockets: dict):
+        """
+        Wait on all outbound sockets together until every acked edge got its reply and every edge with the block
+        overflow policy has room in its queue, or until the timeout of the edge expires. Edges that time out are
+        reset and marked as suspect, suspect edges are not waited for so that a dead server does not slow down the
+        healthy ones. Conflated edges are never waited for either, their replies are collected if they already
+        arrived. Edges with other overflow policies are reset once their deadline expires
+        """
+        replies = {}
+        stalled = {}
         while True:
-            if (socket.poll(request_timeout) & zmq.POLLIN) != 0:
-                reply = socket.recv_pyobj()
-                if verbose:
-                    print(f"[outbound] Receiving from {socket_url} a reply with keys: {reply.keys()}")
+            waiting = {}
+            stalling = {}
+            poller = zmq.Poller()
+            for out_key, out_val in outbound_sockets.items():
+                if out_val["opt"]["mode"] == "push" or out_val["in_flight"] == 0:
+                    continue
+                poller.register(out_val["socket"], zmq.POLLIN)
+
+                opt = out_val["opt"]
+                is_full = (opt["overflow"] == "block") and (len(out_val["queue"]) >= opt["queue"])
+                # Replicas of a group that are still idle take the next messages, see has_idle_replica
+                is_acked = (opt["mode"] == "acked") and (opt["overflow"] == "block")
+                is_acked = is_acked and not ZdgNodeIface.has_idle_replica(out_val)
+                is_waiting = is_acked or (out_val["held"] is not None) or is_full
+                if is_waiting and not out_val["suspect"] and (opt["conflate"] == 0):
+                    waiting[out_key] = out_val
+                # Waiting for the reply of an acked edge stalls the node like a full queue does
+                if (is_acked or is_full) and (out_key in waiting):
+                    stalling[out_key] = out_val
+
+            if len(waiting) == 0:
                 break
-                # if int(reply) == sequence:
-                #     print("Server replied OK (%s)", reply)
-                #     retries_left = REQUEST_RETRIES
-                #     break
-                # else:
-                #     print("Malformed reply from server: %s", reply)
-                #     continue
-
-            retries_left -= 1
-            print("No response from server")
-            # Socket is confused. Close and remove it.
-            socket.setsockopt(zmq.LINGER, 0)
-            socket.close()
-            if retries_left == 0:
-                print("Server seems to be offline, abandoning")
-                raise RuntimeError
-
-            print("Reconnecting to server")
-            # Create new connection
-            socket = context.socket(zmq.REQ)
-            socket.connect(server_endpoint)
-            print(f"Resending message {message.keys()}")
-            socket.send_pyobj(message)
+
+            deadline = min(out_val["deadline"] for out_val in waiting.values())
+            t_0 = time.time()
+            poll_timeout = max(0, deadline - t_0) * 1000
+            socket_list = dict(poller.poll(poll_timeout))
+            metrics.node["reply_wait"] += time.time() - t_0
+            for out_key, out_val in stalling.items():
+                out_val["metrics"]["stall_s"] += time.time() - t_0
+                stalled[out_key] = out_val
+
+            for out_key, out_val in outbound_sockets.items():
+                if out_val["socket"] in socket_list:
+                    ZdgNodeIface.add_outbound_reply(replies, out_key, out_val)
+
+            now = time.time()
+            for out_key, out_val in waiting.items():
+                if (out_key not in replies) and (out_val["deadline"] <= now):
+                    ZdgNodeIface.reset_outbound_socket(out_val)
+
+        # Replies that already arrived on the edges that are not waited for
+        now = time.time()
+        for out_key, out_val in outbound_sockets.items():
+            if out_val["opt"]["mode"] == "push":
+                continue
+            while (out_val["in_flight"] > 0) and ((out_val["socket"].poll(0) & zmq.POLLIN) != 0):
+                ZdgNodeIface.add_outbound_reply(replies, out_key, out_val)
+
+            if out_val["suspect"]:
+                ZdgNodeIface.check_outbound_socket(out_val)
+                continue
+            no_credit = (out_val["in_flight"] > 0) and (len(out_val["queue"]) > 0)
+            if no_credit and (out_val["opt"]["overflow"] != "block") and (out_val["deadline"] <= now):
+                ZdgNodeIface.reset_outbound_socket(out_val)
+
+        for out_val in stalled.values():
+            out_val["metrics"]["stalls"] += 1
+
+        return replies
+
+    @staticmethod
+    def watch_held_messages(poller, outbound_sockets: dict, watched: set) -> set:
+        """
+        Register in poller the conflated edges that hold a message waiting for a reply, and unregister the watched
+        ones that no longer do, so that the node wakes up to send the message when the reply arrives (it is received
+        by collect_outbound_replies). Returns the sockets that are watched now
+        """
+        held = {out_val["socket"] for out_val in outbound_sockets.values() if out_val["held"] is not None}
+        for socket in watched - held:
+            poller.unregister(socket)
+        for socket in held - watched:
+            poller.register(socket, zmq.POLLIN)
+        return held
+
+    @staticmethod
+    def wait_held_messages(outbound_sockets: dict, timeout: float):
+        """
+        Send the messages held by conflated edges as their replies arrive, for at most timeout seconds.
+        Sources call it while they wait for their next deadline
+        """
+        t_end = time.time() + timeout
+        while True:
+            poller = zmq.Poller()
+            watched = ZdgNodeIface.watch_held_messages(poller, outbound_sockets, set())
+            wait = t_end - time.time()
+            if (len(watched) == 0) or (wait <= 0):
+                return
+            if len(poller.poll(wait * 1000)) == 0:
+                return
+            ZdgNodeIface.collect_outbound_replies(outbound_sockets)
+
+    @staticmethod
+    def add_outbound_reply(replies: dict, out_key: str, socket_dict: dict):
+        """
+        Receive a reply of the edge into replies, heartbeats are left out
+        """
+        reply = ZdgNodeIface.recv_outbound_reply(socket_dict)
+        if reply is not None:
+            replies[out_key] = reply
+
+    @staticmethod
+    def process_outbound_messages(message: dict, outbound_sockets: dict):
+        """
+        Send message to all outbound sockets (one replica per group) first and then collect their replies together
+        """
+        for out_val in ZdgNodeIface.get_outbound_targets(message, outbound_sockets).values():
+            ZdgNodeIface.send_outbound_message(message, out_val)
+        ZdgNodeIface.flush_outbound_batches(outbound_sockets)
+
+        return ZdgNodeIface.collect_outbound_replies(outbound_sockets)
+
+    @staticmethod
+    def process_outbound_message(message: dict, socket_dict: dict):
+        """
+        process_outbound_message
+        """
+        replies = ZdgNodeIface.process_outbound_messages(message, {"socket": socket_dict})
 
         # return message, reply
-        return reply
+        return replies.get("socket")
 
     @staticmethod
-    def process_inbound_message(inbound_fnct, socket_dict: dict):
+    def recv_inbound_message(socket_dict: dict):
         """
-        process_inbound_message
+        Receive the next request, returns the envelope needed to reply to it and the message (None for heartbeats,
+        which are answered here)
         """
-        socket = socket_dict["socket"]
         socket_url = socket_dict["url"]
 
         verbose = False
 
-        # Wait for the next request from client
-        message = socket.recv_pyobj()
+        # ROUTER sockets prepend the identity of the client, it is needed to route the reply back
+        envelope_len = 1 if socket_dict["opt"]["mode"] == "dealer" else 0
+        envelope, message = ZdgNodeIface.recv_edge_message(socket_dict, envelope_len)
+        if message is None:
+            # Liveness probe of the client, answered right away
+            ZdgNodeIface.send_frames(socket_dict["socket"], envelope + [HEARTBEAT_FRAME])
+            return envelope, None
+        ZdgNodeIface.record_edge_messages(socket_dict, message)
+        tracer.recv_trace(ZdgNodeIface.get_edge_messages(socket_dict, message))
         if verbose:
             print(f"[inbound]  Receiving from {socket_url}     a reqst with keys: {message.keys()}")
 
-        # Process message
-        reply = inbound_fnct(message)
-        assert isinstance(reply, dict)
+        return envelope, message
+
+    @staticmethod
+    def send_inbound_reply(socket_dict: dict, envelope: list, reply: dict):
+        """
+        Send reply to the client (a list of replies with the batch edge option), push edges take no replies
+        """
+        socket_url = socket_dict["url"]
+
+        verbose = False
 
-        # Send reply to client
         if verbose:
             print(f"[inbound]  Sending to     {socket_url}     a reply with keys: {reply.keys()}")
-        socket.send_pyobj(reply)
+        if socket_dict["opt"]["mode"] != "push":
+            ZdgNodeIface.send_edge_message(socket_dict, reply, envelope)
+
+    @staticmethod
+    def batch_fnct(fnct=None, max_batch: int = 0, max_wait_ms: float = 0.0, stack: bool = False):
+        """
+        Decorator for an inbound_fnct that takes a list of messages and returns a list with one reply per message.
+        With max_batch > 0, the messages are gathered across the inbound sockets, see gather_inbound_requests.
+        With stack, inbound_fnct takes the data of the messages stacked in a numpy array instead
+          @ZdgNodeIface.batch_fnct(max_batch=64, max_wait_ms=5, stack=True)
+        """
+        if stack and (np is None):
+            print("The stack option needs numpy, install it using: pip install numpy")
+            raise ImportError
+        if (max_batch < 0) or (max_wait_ms < 0):
+            print("max_batch and max_wait_ms can not be negative")
+            raise ValueError
+
+        def decorate(fnct):
+            fnct.zdg_batch = True
+            fnct.zdg_gather = {"max_batch": max_batch, "max_wait_ms": max_wait_ms, "stack": stack}
+            return fnct
 
-        return message, reply
+        return decorate if fnct is None else decorate(fnct)
+
+    @staticmethod
+    def get_gather_opt(inbound_fnct):
+        """
+        Options of an inbound_fnct decorated with batch_fnct(max_batch=...), None if it does not gather messages
+        """
+        gather_opt = getattr(inbound_fnct, "zdg_gather", None)
+        if (gather_opt is None) or (gather_opt["max_batch"] == 0):
+            return None
+        return gather_opt
+
+    @staticmethod
+    def get_batch_input(inbound_fnct, messages: list):
+        """
+        Argument of a batch_fnct, the messages or their data stacked with the stack option
+        """
+        gather_opt = getattr(inbound_fnct, "zdg_gather", None)
+        if (gather_opt is not None) and gather_opt["stack"]:
+            return np.stack([message["data"] for message in messages])
+        return messages
+
+    @staticmethod
+    def call_inbound_fnct(inbound_fnct, messages: list):
+        """
+        Call inbound_fnct once per message, or once with all the messages if it is a batch_fnct. Returns the replies
+        """
+        if getattr(inbound_fnct, "zdg_batch", False):
+            replies = inbound_fnct(ZdgNodeIface.get_batch_input(inbound_fnct, messages))
+            assert isinstance(replies, list) and (len(replies) == len(messages))
+        else:
+            replies = [inbound_fnct(message) for message in messages]
+
+        for reply in replies:
+            assert isinstance(reply, dict)
+        return replies
+
+    @staticmethod
+    def process_inbound_messages(inbound_fnct, socket_dict: dict):
+        """
+        Receive the next request, a single message or a batch of them, and reply to it.
+        Returns the list of messages and the list of replies, both empty for heartbeats
+        """
+        envelope, messages, replies = ZdgNodeIface.call_inbound_messages(inbound_fnct, socket_dict)
+
+        # Send reply to client
+        ZdgNodeIface.send_inbound_replies(socket_dict, envelope, replies)
+
+        return messages, replies
+
+    @staticmethod
+    def call_inbound_messages(inbound_fnct, socket_dict: dict):
+        """
+        Receive the next request and call inbound_fnct, without replying to it.
+        Returns the envelope, the list of messages and the list of replies
+        """
+        batch = socket_dict["opt"]["batch"] > 1
+
+        # Wait for the next request from client
+        envelope, message = ZdgNodeIface.recv_inbound_message(socket_dict)
+        if message is None:
+            return envelope, [], []
+        messages = message if batch else [message]
+
+        # Process messages
+        t_0 = time.perf_counter()
+        replies = ZdgNodeIface.call_inbound_fnct(inbound_fnct, messages)
+        metrics.node["inbound_fnct"].record(time.perf_counter() - t_0)
+        tracer.done_trace(messages)
+
+        return envelope, messages, replies
+
+    @staticmethod
+    def send_inbound_replies(socket_dict: dict, envelope: list, replies: list):
+        """
+        send_inbound_replies, heartbeats were already answered
+        """
+        if len(replies) == 0:
+            return
+        batch = socket_dict["opt"]["batch"] > 1
+        ZdgNodeIface.send_inbound_reply(socket_dict, envelope, replies if batch else replies[0])
+
+    @staticmethod
+    def process_inbound_message(inbound_fnct, socket_dict: dict):
+        """
+        process_inbound_message, see process_inbound_messages for edges with the batch option.
+        Returns None, None for heartbeats
+        """
+        messages, replies = ZdgNodeIface.process_inbound_messages(inbound_fnct, socket_dict)
+        if len(messages) == 0:
+            return None, None
+        if socket_dict["opt"]["batch"] > 1:
+            return messages, replies
+        return messages[0], replies[0]
 
     @staticmethod
     def acknowledge_message(message):
@@ -209,6 +1614,128 @@ class ZdgNodeIface:
         reply = {"message_time": message["time"]}
         return reply
 
+    @staticmethod
+    def gather_inbound_requests(poller, inbound_sockets: dict, socket_list: dict, gather_opt: dict):
+        """
+        Receive the requests that are ready on the inbound sockets, one per socket in turn, until there are max_batch
+        messages or max_wait_ms passed since the first one (0 takes the messages that are ready). An acked (REP)
+        socket leaves the poller after its request, it takes the next one only after replying.
+        Returns the list of (socket_dict, envelope, messages) of the requests, empty if there were only heartbeats
+        """
+        max_batch = gather_opt["max_batch"]
+        requests = []
+        message_cnt = 0
+        t_end = None
+        while True:
+            for in_val in inbound_sockets.values():
+                if (message_cnt >= max_batch) or (in_val["socket"] not in socket_list):
+                    continue
+                envelope, message = ZdgNodeIface.recv_inbound_message(in_val)
+                if message is None:
+                    continue
+                messages = message if in_val["opt"]["batch"] > 1 else [message]
+                requests.append((in_val, envelope, messages))
+                message_cnt += len(messages)
+                if in_val["opt"]["mode"] == "acked":
+                    poller.unregister(in_val["socket"])
+
+            if (message_cnt == 0) or (message_cnt >= max_batch):
+                break
+            if t_end is None:
+                t_end = time.time() + gather_opt["max_wait_ms"] / 1000
+            t_0 = time.time()
+            socket_list = dict(poller.poll(max(t_end - t_0, 0) * 1000))
+            metrics.node["poll_idle"] += time.time() - t_0
+            if len(socket_list) == 0:
+                break
+
+        for in_val, _, _ in requests:
+            if (in_val["opt"]["mode"] == "acked") and (in_val["socket"] not in poller):
+                poller.register(in_val["socket"], zmq.POLLIN)
+        return requests
+
+    @staticmethod
+    def call_gathered_fnct(inbound_fnct, messages: list):
+        """
+        Call inbound_fnct once with the gathered messages. It returns the replies, or the replies and the data of
+        a single outbound message for all of them. Returns the replies and that data, None if there is none
+        """
+        result = inbound_fnct(ZdgNodeIface.get_batch_input(inbound_fnct, messages))
+        replies, outbound_data = result if isinstance(result, tuple) else (result, None)
+
+        assert isinstance(replies, list) and (len(replies) == len(messages))
+        for reply in replies:
+            assert isinstance(reply, dict)
+        return replies, outbound_data
+
+    @staticmethod
+    def send_gathered_replies(requests: list, replies: list, shm: bool):
+        """
+        Split the replies among the requests and send them, to the requests of shm edges only if shm is set
+        and to the others if it is not
+        """
+        offset = 0
+        for in_val, envelope, messages in requests:
+            if ("shm" in in_val) == shm:
+                ZdgNodeIface.send_inbound_replies(in_val, envelope, replies[offset : offset + len(messages)])
+            offset += len(messages)
+
+    @staticmethod
+    def forward_outbound_data(inbound_message, outbound_data, outbound_sockets: dict, message_cnt: int):
+        """
+        Send the outbound message with outbound_data, inbound_message carries on its trace
+        """
+        outbound_message = {
+            "data": outbound_data,
+            "time": time.time(),
+            "counter": message_cnt,
+        }
+        tracer.forward_trace(inbound_message, outbound_message)
+
+        outbound_replies = ZdgNodeIface.process_outbound_messages(
+            message=outbound_message, outbound_sockets=outbound_sockets
+        )
+        return outbound_replies
+
+    @staticmethod
+    def process_gathered_requests(
+        requests: list, inbound_fnct, outbound_sockets: dict, outbound_fnct, message_cnt: int
+    ) -> int:
+        """
+        Call inbound_fnct once for the messages of the gathered requests and reply to each request. If inbound_fnct
+        returned outbound data, a single outbound message is sent for all the messages (it carries on the trace of
+        the first traced one), otherwise outbound_fnct is called for each message as usual. Sinks write the traces.
+        Returns the updated count of outbound messages
+        """
+        messages = [message for _, _, request_messages in requests for message in request_messages]
+        metrics.node["gather_batches"] += 1
+        metrics.node["gather_messages"] += len(messages)
+
+        t_0 = time.perf_counter()
+        replies, outbound_data = ZdgNodeIface.call_gathered_fnct(inbound_fnct, messages)
+        metrics.node["inbound_fnct"].record(time.perf_counter() - t_0)
+        tracer.done_trace(messages)
+        # Frames in a shared memory ring are only valid until the reply, forward them first
+        ZdgNodeIface.send_gathered_replies(requests, replies, shm=False)
+
+        if len(outbound_sockets) == 0:
+            tracer.write_trace(messages)
+        elif outbound_data is not None:
+            message_cnt += 1
+            traced = [message for message in messages if isinstance(message, dict) and ("trace" in message)]
+            inbound_message = traced[0] if len(traced) > 0 else None
+            ZdgNodeIface.forward_outbound_data(inbound_message, outbound_data, outbound_sockets, message_cnt)
+        else:
+            for inbound_message in messages:
+                message_cnt += 1
+                t_0 = time.perf_counter()
+                outbound_data = outbound_fnct(inbound_message)
+                metrics.node["outbound_fnct"].record(time.perf_counter() - t_0)
+                ZdgNodeIface.forward_outbound_data(inbound_message, outbound_data, outbound_sockets, message_cnt)
+
+        ZdgNodeIface.send_gathered_replies(requests, replies, shm=True)
+        return message_cnt
+
     @staticmethod
     def process_m_to_0_communication(inbound_sockets: dict, inbound_fnct):
         """
@@ -229,6 +1756,11 @@ class ZdgNodeIface:
             print(f"Register socket to Poller: socket_cnt {in_socket_cnt}, url {in_socket_url}")
             poller.register(in_socket_socket, zmq.POLLIN)
 
+        # inbound_fnct takes the messages of all inbound sockets at once
+        gather_opt = ZdgNodeIface.get_gather_opt(inbound_fnct)
+        if gather_opt is not None:
+            print(f"Gathering inbound messages {gather_opt}")
+
         # Process messages from both sockets
         message_t0 = time.time()
         message_cnt = 0
@@ -236,19 +1768,29 @@ class ZdgNodeIface:
             message_cnt += 1
 
             try:
+                t_0 = time.time()
                 socket_list = dict(poller.poll())
+                metrics.node["poll_idle"] += time.time() - t_0
             except KeyboardInterrupt:
                 break
 
+            if gather_opt is not None:
+                requests = ZdgNodeIface.gather_inbound_requests(poller, inbound_sockets, socket_list, gather_opt)
+                if len(requests) > 0:
+                    ZdgNodeIface.process_gathered_requests(requests, inbound_fnct, {}, None, 0)
+                socket_list = {}
+
             for in_key, in_val in inbound_sockets.items():
                 in_socket_cnt = in_key
                 in_socket_socket = in_val["socket"]
                 in_socket_url = in_val["url"]
 
                 if in_socket_socket in socket_list:
-                    message, reply = ZdgNodeIface.process_inbound_message(inbound_fnct=inbound_fnct, socket_dict=in_val)
-                    _ = message
-                    _ = reply
+                    messages, replies = ZdgNodeIface.process_inbound_messages(
+                        inbound_fnct=inbound_fnct, socket_dict=in_val
+                    )
+                    tracer.write_trace(messages)
+                    _ = replies
 
             if message_cnt % 100 == 0:
                 message_t100 = time.time()
@@ -258,16 +1800,17 @@ class ZdgNodeIface:
                 message_t0 = time.time()
 
     @staticmethod
-    def process_0_to_n_communication(outbound_sockets: dict, outbound_fnct):
+    def process_0_to_n_communication(outbound_sockets: dict, outbound_fnct, scheduler: ZdgSourceScheduler = None):
         """
-        process_0_to_n_communication
+        Call outbound_fnct at the deadlines of scheduler (default ZdgSourceScheduler.from_env()). In open loop
+        message["time"] is the deadline, so the latency downstream includes the time the message was late
         """
         fname = ZdgNodeIface.process_0_to_n_communication.__name__
         print(fname)
 
-        # This is not an ideal solution
-        # Allow for downstream nodes to initalize
-        # time.sleep(10)
+        # Downstream nodes are ready, see wait_outbound_ready
+        scheduler = scheduler or ZdgSourceScheduler.from_env()
+        print(f"[{fname}] Source period {scheduler.period} s, schedule {scheduler.schedule}")
 
         # Process messages from both sockets
         message_t0 = time.time()
@@ -275,26 +1818,28 @@ class ZdgNodeIface:
         while True:
             message_cnt += 1
 
+            ZdgNodeIface.wait_held_messages(outbound_sockets, scheduler.get_wait() - ZdgSourceScheduler.spin_s)
+            t_deadline = scheduler.wait()
+            t_start = t_deadline if scheduler.open_loop else time.time()
+            t_0 = time.perf_counter()
             message = {
                 "data": outbound_fnct(),
-                "time": time.time(),
+                "time": t_deadline if scheduler.open_loop else time.time(),
                 "counter": message_cnt,
             }
+            metrics.node["outbound_fnct"].record(time.perf_counter() - t_0)
+            tracer.start_trace(message, t_start)
 
-            for out_key, out_val in outbound_sockets.items():
-                # out_socket_cnt = out_key
-                # out_socket_socket = out_val["socket"]
-                # out_socket_url = out_val["url"]
-                _ = out_key
-
-                reply = ZdgNodeIface.process_outbound_message(message=message, socket_dict=out_val)
-                _ = reply
+            replies = ZdgNodeIface.process_outbound_messages(message=message, outbound_sockets=outbound_sockets)
+            _ = replies
 
             if message_cnt % 100 == 0:
                 message_t100 = time.time()
                 message_dt = message_t100 - message_t0
                 message_rate = message_cnt / message_dt
                 print(f"[{fname}] Effective outbound message rate {message_rate} message/s")
+                if scheduler.missed > 0:
+                    print(f"[{fname}] Missed {scheduler.missed} deadlines")
                 message_t0 = time.time()
 
     @staticmethod
@@ -336,13 +1881,24 @@ class ZdgNodeIface:
             print(f"Register socket to Poller: socket_cnt {in_socket_cnt}, url {in_socket_url}")
             poller.register(in_socket_socket, zmq.POLLIN)
 
+        # inbound_fnct takes the messages of all inbound sockets at once
+        gather_opt = ZdgNodeIface.get_gather_opt(inbound_fnct)
+        if gather_opt is not None:
+            print(f"Gathering inbound messages {gather_opt}")
+
         # Process messages from both sockets
         message_cnt = 0
+        held_sockets = set()
         while True:
-            message_cnt += 1
+            # Wake up in time to send the outbound batches that are not full, and the messages held by conflated edges
+            poll_timeout = ZdgNodeIface.flush_outbound_batches(outbound_sockets)
+            ZdgNodeIface.collect_outbound_replies(outbound_sockets)
+            held_sockets = ZdgNodeIface.watch_held_messages(poller, outbound_sockets, held_sockets)
 
             try:
-                socket_list = dict(poller.poll())
+                t_0 = time.time()
+                socket_list = dict(poller.poll(poll_timeout))
+                metrics.node["poll_idle"] += time.time() - t_0
             except KeyboardInterrupt:
                 break
 
@@ -354,43 +1910,286 @@ class ZdgNodeIface:
             #     message = subscriber.recv_pyobj()
             #     # process weather update
 
+            if gather_opt is not None:
+                requests = ZdgNodeIface.gather_inbound_requests(poller, inbound_sockets, socket_list, gather_opt)
+                if len(requests) > 0:
+                    message_cnt = ZdgNodeIface.process_gathered_requests(
+                        requests, inbound_fnct, outbound_sockets, outbound_fnct, message_cnt
+                    )
+                socket_list = {}
+
             for in_key, in_val in inbound_sockets.items():
                 in_socket_cnt = in_key
                 in_socket_socket = in_val["socket"]
                 in_socket_url = in_val["url"]
 
                 if in_socket_socket in socket_list:
-                    inbound_message, inbound_reply = ZdgNodeIface.process_inbound_message(
+                    envelope, inbound_messages, inbound_replies = ZdgNodeIface.call_inbound_messages(
                         # target_fnct=ZmqNodeIface.acknowledge_message,
                         inbound_fnct=inbound_fnct,
                         socket_dict=in_val,
                     )
-                    _ = inbound_reply
+                    # Frames in a shared memory ring are only valid until the reply, forward them first
+                    if "shm" not in in_val:
+                        ZdgNodeIface.send_inbound_replies(in_val, envelope, inbound_replies)
 
                     # For every inbound message, send the same outbound message data to all outbound sockets
-                    outbound_data = outbound_fnct(inbound_message)
-
-                    for out_key, out_val in outbound_sockets.items():
-                        # out_socket_cnt = out_key
-                        # out_socket_socket = out_val["socket"]
-                        # out_socket_url = out_val["url"]
-                        _ = out_key
-
-                        outbound_message = {
-                            "data": outbound_data,
-                            "time": time.time(),
-                            "counter": message_cnt,
-                        }
-
-                        outbound_reply = ZdgNodeIface.process_outbound_message(
-                            message=outbound_message, socket_dict=out_val
+                    for inbound_message in inbound_messages:
+                        message_cnt += 1
+                        t_0 = time.perf_counter()
+                        outbound_data = outbound_fnct(inbound_message)
+                        metrics.node["outbound_fnct"].record(time.perf_counter() - t_0)
+
+                        outbound_replies = ZdgNodeIface.forward_outbound_data(
+                            inbound_message, outbound_data, outbound_sockets, message_cnt
                         )
-                        _ = outbound_reply
+                        _ = outbound_replies
+
+                    if "shm" in in_val:
+                        ZdgNodeIface.send_inbound_replies(in_val, envelope, inbound_replies)
+
+    @staticmethod
+    def run_inbound_task(inbound_fnct, outbound_fnct, messages: list):
+        """
+        Task executed by the worker pool, returns the replies and the outbound data of the messages
+        (empty if there is no outbound_fnct), and the execution time of inbound_fnct and of each outbound_fnct call.
+        Times are returned instead of recorded here because a process pool does not share the metrics of the node
+        """
+        t_0 = time.perf_counter()
+        replies = ZdgNodeIface.call_inbound_fnct(inbound_fnct, messages)
+        inbound_dt = time.perf_counter() - t_0
+
+        outbound_data = []
+        outbound_dt = []
+        if outbound_fnct is not None:
+            for message in messages:
+                t_0 = time.perf_counter()
+                outbound_data.append(outbound_fnct(message))
+                outbound_dt.append(time.perf_counter() - t_0)
+        return replies, outbound_data, inbound_dt, outbound_dt
+
+    @staticmethod
+    def get_route(message: dict, key: str):
+        """
+        Value of message["data"][key] that routes the message to a worker of the fork pool, None without key
+        """
+        if key is None:
+            return None
+        data = message.get("data") if isinstance(message, dict) else None
+        return str(data.get(key) if isinstance(data, dict) else None)
+
+    @staticmethod
+    def fork_workers(workers: int, inbound_fnct, outbound_fnct, inbound_list: str, outbound_list: str):
+        """
+        Fork the workers of the fork pool, before the node creates any socket. Returns None for source nodes,
+        which do not use the pool
+        """
+        if inbound_list is None:
+            inbound_list = str(os.environ["ZDG_INBOUND_LIST"])
+        if outbound_list is None:
+            outbound_list = str(os.environ["ZDG_OUTBOUND_LIST"])
+        if len(ZdgNodeIface.parse_socket_list(inbound_list)) == 0:
+            return None
+        if len(ZdgNodeIface.parse_socket_list(outbound_list)) == 0:
+            outbound_fnct = None
+
+        task_fnct = functools.partial(ZdgNodeIface.run_inbound_task, inbound_fnct, outbound_fnct)
+        return ZdgForkPool(workers, task_fnct, ZdgPickleCodec({}))
+
+    @staticmethod
+    def process_pool_communication(
+        inbound_sockets: dict, inbound_fnct, outbound_sockets: dict, outbound_fnct, pool_opt: dict, fork_pool=None
+    ):
+        """
+        Same as process_m_to_0_communication (empty outbound_sockets) and process_n_to_m_communication, but
+        inbound_fnct and outbound_fnct run in a thread or process pool, or in the forked workers of fork_pool,
+        so that a slow handler does not hold up the other inbound sockets. Replies and outbound messages are sent
+        as tasks finish, in arrival order per inbound socket (ordering "fifo") or as soon as possible (ordering
+        "unordered"). With the key pool option, fork_pool runs the messages with the same message["data"][key]
+        in the same worker, in arrival order.
+        An acked (REP) inbound socket accepts its next message only after replying, use push or dealer edges to
+        process several messages of the same inbound socket at once
+        """
+        fname = ZdgNodeIface.process_pool_communication.__name__
+        print(f"{fname} {pool_opt}")
+
+        workers = pool_opt["workers"]
+        if fork_pool is not None:
+            executor = fork_pool
+        elif pool_opt["pool"] == "process":
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        unordered = pool_opt["ordering"] == "unordered"
+        max_pending = pool_opt["max_pending"]
+        if len(outbound_sockets) == 0:
+            outbound_fnct = None
+
+        # Finished tasks write to this pipe to wake up the poller
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+
+        def wakeup(_):
+            os.write(wakeup_w, b"\0")
+
+        # Tasks in arrival order per inbound socket: (future, envelope, messages)
+        pending = {in_key: collections.deque() for in_key in inbound_sockets.keys()}
+        pending_cnt = 0
+
+        message_t0 = time.time()
+        message_cnt = 0
+        outbound_cnt = 0
+        try:
+            while True:
+                # Wake up in time to send the outbound batches that are not full
+                poll_timeout = ZdgNodeIface.flush_outbound_batches(outbound_sockets)
+                ZdgNodeIface.collect_outbound_replies(outbound_sockets)
+
+                poller = zmq.Poller()
+                poller.register(wakeup_r, zmq.POLLIN)
+                if fork_pool is not None:
+                    poller.register(fork_pool.socket, zmq.POLLIN)
+                ZdgNodeIface.watch_held_messages(poller, outbound_sockets, set())
+                if pending_cnt < max_pending:
+                    for in_key, in_val in inbound_sockets.items():
+                        if (in_val["opt"]["mode"] == "acked") and (len(pending[in_key]) > 0):
+                            continue
+                        poller.register(in_val["socket"], zmq.POLLIN)
+
+                try:
+                    t_0 = time.time()
+                    socket_list = dict(poller.poll(poll_timeout))
+                    metrics.node["poll_idle"] += time.time() - t_0
+                except KeyboardInterrupt:
+                    break
+
+                if (fork_pool is not None) and (fork_pool.socket in socket_list):
+                    fork_pool.recv_results()
+                if wakeup_r in socket_list:
+                    while True:
+                        try:
+                            os.read(wakeup_r, 4096)
+                        except BlockingIOError:
+                            break
+
+                for in_key, in_val in inbound_sockets.items():
+                    if in_val["socket"] in socket_list:
+                        envelope, message = ZdgNodeIface.recv_inbound_message(in_val)
+                        if message is None:
+                            continue
+                        messages = message if in_val["opt"]["batch"] > 1 else [message]
+                        if fork_pool is not None:
+                            future = fork_pool.submit(messages, ZdgNodeIface.get_route(messages[0], pool_opt["key"]))
+                        else:
+                            future = executor.submit(
+                                ZdgNodeIface.run_inbound_task, inbound_fnct, outbound_fnct, messages
+                            )
+                        future.add_done_callback(wakeup)
+                        pending[in_key].append((future, envelope, messages))
+                        pending_cnt += 1
+                        metrics.node["pending"] = pending_cnt
+
+                for in_key, in_val in inbound_sockets.items():
+                    task_list = pending[in_key]
+                    if unordered:
+                        done_list = [task for task in task_list if task[0].done()]
+                    else:
+                        done_list = []
+                        while (len(done_list) < len(task_list)) and task_list[len(done_list)][0].done():
+                            done_list.append(task_list[len(done_list)])
+
+                    for task in done_list:
+                        future, envelope, messages = task
+                        task_list.remove(task)
+                        pending_cnt -= 1
+                        metrics.node["pending"] = pending_cnt
+
+                        replies, outbound_data_list, inbound_dt, outbound_dt = future.result()
+                        metrics.node["inbound_fnct"].record(inbound_dt)
+                        for dt in outbound_dt:
+                            metrics.node["outbound_fnct"].record(dt)
+                        # Frames in a shared memory ring are only valid until the reply, forward them first
+                        if "shm" not in in_val:
+                            ZdgNodeIface.send_inbound_replies(in_val, envelope, replies)
+                        tracer.done_trace(messages)
+                        if outbound_fnct is None:
+                            tracer.write_trace(messages)
+
+                        for inbound_message, outbound_data in zip(messages, outbound_data_list):
+                            outbound_cnt += 1
+                            outbound_message = {
+                                "data": outbound_data,
+                                "time": time.time(),
+                                "counter": outbound_cnt,
+                            }
+                            tracer.forward_trace(inbound_message, outbound_message)
+                            outbound_replies = ZdgNodeIface.process_outbound_messages(
+                                message=outbound_message, outbound_sockets=outbound_sockets
+                            )
+                            _ = outbound_replies
+                        if "shm" in in_val:
+                            ZdgNodeIface.send_inbound_replies(in_val, envelope, replies)
+
+                        message_cnt += len(messages)
+                        if message_cnt >= 100:
+                            message_t100 = time.time()
+                            message_dt = message_t100 - message_t0
+                            message_rate = message_cnt / message_dt
+                            print(f"[{fname}] Effective inbound message rate {message_rate} message/s")
+                            message_t0 = time.time()
+                            message_cnt = 0
+
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    @staticmethod
+    def interrupt_on_sigterm():
+        """
+        Raise KeyboardInterrupt on the first SIGTERM, the next ones are ignored while the node exits (multiprocessing
+        terminates daemon processes again at exit). Only the main thread can handle signals, nodes run as threads by
+        ZdgRunner keep the default handler
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def interrupt(signum, frame):
+            _ = signum, frame
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, interrupt)
+
+    @staticmethod
+    def set_node_ready(t_start: float):
+        """
+        set_node_ready
+        """
+        metrics.node["startup"] = time.time() - t_start
+        print(f"Node is ready after {metrics.node['startup']:.3f} s")
 
     @staticmethod
-    def run(inbound_fnct, outbound_fnct):
+    def run(
+        inbound_fnct,
+        outbound_fnct,
+        workers: int = 0,
+        pool: str = "thread",
+        ordering: str = "fifo",
+        inbound_list: str = None,
+        outbound_list: str = None,
+        scheduler: ZdgSourceScheduler = None,
+        key: str = None,
+    ):
         """
-        Pull data from subscribers and push data to publishers
+        Pull data from subscribers and push data to publishers.
+        With workers > 0, inbound_fnct and outbound_fnct of nodes with inbound sockets run in a pool of
+        workers threads (pool "thread"), processes (pool "process") or forked processes that share the edges of
+        the node (pool "fork", with key the messages of a key go to the same worker), see process_pool_communication.
+        inbound_list and outbound_list default to ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST, see ZdgRunner.
+        scheduler sets the rate of source nodes, see process_0_to_n_communication
         """
 
         # print(f"os.uname() {os.uname()}")
@@ -398,8 +2197,36 @@ class ZdgNodeIface:
         print(f"zmq.zmq_version() {zmq.zmq_version()}")
         # print(f"zmq.__version__ {zmq.__version__}")
 
-        inbound_sockets = ZdgNodeIface.create_inbound_sockets()
-        outbound_sockets = ZdgNodeIface.create_outbound_sockets()
+        if (workers > 0) and (pool not in ["thread", "process", "fork"]):
+            print(f"Unknown pool {pool}, expected thread, process or fork")
+            raise ValueError
+        # Options are checked before any socket is created and bound, so that an error leaves no socket behind
+        if (workers > 0) and (ordering not in ["fifo", "unordered"]):
+            print(f"Unknown ordering {ordering}, expected fifo or unordered")
+            raise ValueError
+        if (key is not None) and (pool != "fork"):
+            print("Option key needs the fork pool")
+            raise ValueError
+        if (workers > 0) and (ZdgNodeIface.get_gather_opt(inbound_fnct) is not None):
+            print("An inbound_fnct that gathers messages across inbound sockets can not run in a worker pool")
+            raise ValueError
+
+        t_start = time.time()
+        fork_pool = None
+        if (workers > 0) and (pool == "fork"):
+            # A ZMQ context can not be used across a fork, so the workers are forked before any socket is created
+            fork_pool = ZdgNodeIface.fork_workers(workers, inbound_fnct, outbound_fnct, inbound_list, outbound_list)
+        # SIGTERM (docker stop, ZdgRunner subprocesses) stops the node like KeyboardInterrupt, so that the workers of
+        # a pool are shut down and the exit handlers unlink the shm segments of the node
+        ZdgNodeIface.interrupt_on_sigterm()
+        outbound_sockets = ZdgNodeIface.create_outbound_sockets(outbound_list=outbound_list)
+        ZdgNodeIface.wait_outbound_ready(outbound_sockets)
+        # Binding the inbound sockets announces that the node is ready
+        inbound_sockets = ZdgNodeIface.create_inbound_sockets(inbound_list=inbound_list)
+        ZdgNodeIface.set_shm_copy(inbound_sockets, outbound_sockets)
+        ZdgNodeIface.set_node_ready(t_start)
+        metrics.start()
+        tracer.start()
 
         n_in = len(inbound_sockets)
         m_out = len(outbound_sockets)
@@ -407,10 +2234,17 @@ class ZdgNodeIface:
         print(f"inbound length {n_in}")
         print(f"outbound length {m_out}")
 
-        if (n_in > 0) and (m_out > 0):
+        if (n_in > 0) and (workers > 0):
+            if fork_pool is not None:
+                fork_pool.start(context, ZdgNodeIface.get_ready_timeout())
+            pool_opt = {"workers": workers, "pool": pool, "ordering": ordering, "max_pending": 4 * workers, "key": key}
+            ZdgNodeIface.process_pool_communication(
+                inbound_sockets, inbound_fnct, outbound_sockets, outbound_fnct, pool_opt, fork_pool
+            )
+        elif (n_in > 0) and (m_out > 0):
             ZdgNodeIface.process_n_to_m_communication(inbound_sockets, inbound_fnct, outbound_sockets, outbound_fnct)
         elif (n_in == 0) and (m_out > 0):
-            ZdgNodeIface.process_0_to_n_communication(outbound_sockets, outbound_fnct)
+            ZdgNodeIface.process_0_to_n_communication(outbound_sockets, outbound_fnct, scheduler)
         elif (n_in > 0) and (m_out == 0):
             ZdgNodeIface.process_m_to_0_communication(inbound_sockets, inbound_fnct)
         elif (n_in == 0) and (m_out == 0):
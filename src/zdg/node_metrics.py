@@ -0,0 +1,291 @@
+"""
+Per node and per edge metrics: message and byte rates, latency histograms, handler execution times, timeouts,
+reconnects and poll idle time.
+
+Set ZDG_METRICS_PORT to serve them as JSON on tcp://*:ZDG_METRICS_PORT and/or ZDG_METRICS_INTERVAL (seconds) to
+print them periodically. Read a running node using
+  python -m zdg.node_metrics tcp://hostname:port
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import zmq
+
+
+class ZdgHistogram:
+    """
+    Log-linear histogram of durations (HDR style). Durations are recorded in microseconds, exactly below
+    2 * sub_count and otherwise in buckets with a relative width of 1 / sub_count. Recording is O(1)
+    """
+
+    sub_count = 32
+    sub_bits = 5
+
+    def __init__(self) -> None:
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value: float):
+        """
+        Record a duration in seconds
+        """
+        value_us = max(int(value * 1e6), 0)
+        if value_us < 2 * ZdgHistogram.sub_count:
+            idx = value_us
+        else:
+            shift = value_us.bit_length() - ZdgHistogram.sub_bits - 1
+            idx = ZdgHistogram.sub_count * shift + (value_us >> shift)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+
+        self.total += 1
+        self.sum += value
+        self.min = value if (self.min is None) or (value < self.min) else self.min
+        self.max = value if (self.max is None) or (value > self.max) else self.max
+
+    @staticmethod
+    def get_bucket_value(idx: int):
+        """
+        Middle of the bucket in seconds
+        """
+        if idx < 2 * ZdgHistogram.sub_count:
+            return idx / 1e6
+        shift = idx // ZdgHistogram.sub_count - 1
+        low = (idx - ZdgHistogram.sub_count * shift) << shift
+        return (low + (1 << shift) / 2) / 1e6
+
+    def get_percentiles(self, percentiles: list):
+        """
+        get_percentiles
+        """
+        # list() of a dict is atomic, the node can keep recording while the metrics are being read
+        counts = sorted(list(self.counts.items()))
+        values = []
+        for percentile in percentiles:
+            target = percentile / 100 * self.total
+            acc = 0
+            value = None
+            for idx, cnt in counts:
+                acc += cnt
+                if acc >= target:
+                    value = ZdgHistogram.get_bucket_value(idx)
+                    break
+            values.append(value)
+        return values
+
+    def get_summary(self):
+        """
+        Summary in milliseconds
+        """
+        if self.total == 0:
+            return {"count": 0}
+        p50, p90, p99, p999 = self.get_percentiles([50, 90, 99, 99.9])
+        return {
+            "count": self.total,
+            "mean_ms": self.sum / self.total * 1e3,
+            "min_ms": self.min * 1e3,
+            "p50_ms": p50 * 1e3,
+            "p90_ms": p90 * 1e3,
+            "p99_ms": p99 * 1e3,
+            "p999_ms": p999 * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+class ZdgMetrics:
+    """
+    Metrics of a node, see get_snapshot. Edges are registered by create_inbound_sockets and create_outbound_sockets.
+    Bytes count both directions of an edge (requests and replies), messages and latency count requests only
+    """
+
+    def __init__(self) -> None:
+        self.t_start = time.time()
+        self.t_snapshot = self.t_start
+        self.inbound = {}
+        self.outbound = {}
+        self.node = {
+            "inbound_fnct": ZdgHistogram(),
+            "outbound_fnct": ZdgHistogram(),
+            "poll_idle": 0.0,
+            "reply_wait": 0.0,
+            "pending": 0,
+            "startup": 0.0,
+            "source_lag": ZdgHistogram(),
+            "missed": 0,
+            "gather_batches": 0,
+            "gather_messages": 0,
+        }
+        self.started = False
+
+    def add_edge(self, direction: str, socket_dict: dict):
+        """
+        direction is "inbound" or "outbound". The counters of the edge are stored in socket_dict["metrics"],
+        its dropped messages and queue depth are read from socket_dict
+        """
+        socket_dict["metrics"] = {
+            "messages": 0,
+            "bytes": 0,
+            "latency": ZdgHistogram(),
+            "timeouts": 0,
+            "reconnects": 0,
+            "stalls": 0,
+            "stall_s": 0.0,
+            "spilled": 0,
+            "resent": 0,
+            "ready_s": 0.0,
+            "prev_messages": 0,
+            "prev_bytes": 0,
+        }
+        getattr(self, direction)[socket_dict["url"]] = socket_dict
+
+    @staticmethod
+    def get_frames_size(frames: list) -> int:
+        """
+        get_frames_size
+        """
+        return sum(memoryview(frame).nbytes for frame in frames)
+
+    @staticmethod
+    def record_messages(socket_dict: dict, messages: list):
+        """
+        Count the messages received or sent on an edge, and their latency since they were created (message["time"])
+        """
+        edge = socket_dict["metrics"]
+        edge["messages"] += len(messages)
+        now = time.time()
+        for message in messages:
+            if isinstance(message, dict) and ("time" in message):
+                edge["latency"].record(now - message["time"])
+
+    @staticmethod
+    def get_queue_depth(socket_dict: dict) -> int:
+        """
+        Messages sent and not replied yet, held back, queued (or spilled) for a credit or waiting in a batch
+        """
+        held = 0 if socket_dict.get("held") is None else 1
+        queued = len(socket_dict.get("queue", [])) + len(socket_dict.get("spill") or [])
+        return socket_dict.get("in_flight", 0) + held + queued + len(socket_dict.get("batch", []))
+
+    def get_snapshot(self):
+        """
+        Totals since the node started, and message and byte rates since the previous snapshot
+        """
+        now = time.time()
+        dt = max(now - self.t_snapshot, 1e-9)
+        self.t_snapshot = now
+
+        snapshot = {
+            "node": os.environ.get("ZDG_CONTAINER_NAME", ""),
+            "time": now,
+            "uptime_s": now - self.t_start,
+            "inbound_fnct": self.node["inbound_fnct"].get_summary(),
+            "outbound_fnct": self.node["outbound_fnct"].get_summary(),
+            "poll_idle_s": self.node["poll_idle"],
+            "reply_wait_s": self.node["reply_wait"],
+            "pending": self.node["pending"],
+            "startup_s": self.node["startup"],
+            "source_lag": self.node["source_lag"].get_summary(),
+            "missed": self.node["missed"],
+            "gather_batches": self.node["gather_batches"],
+            "gather_messages": self.node["gather_messages"],
+            "inbound": {},
+            "outbound": {},
+        }
+        for direction in ["inbound", "outbound"]:
+            for url, socket_dict in list(getattr(self, direction).items()):
+                edge = socket_dict["metrics"]
+                messages = edge["messages"]
+                nbytes = edge["bytes"]
+                record = socket_dict.get("record")
+                compressor = socket_dict.get("compressor")
+                snapshot[direction][url] = {
+                    "mode": socket_dict["opt"]["mode"],
+                    "messages": messages,
+                    "bytes": nbytes,
+                    "message_rate": (messages - edge["prev_messages"]) / dt,
+                    "byte_rate": (nbytes - edge["prev_bytes"]) / dt,
+                    "latency": edge["latency"].get_summary(),
+                    "queue_depth": ZdgMetrics.get_queue_depth(socket_dict),
+                    "timeouts": edge["timeouts"],
+                    "reconnects": edge["reconnects"],
+                    "dropped": socket_dict.get("dropped", 0),
+                    "stalls": edge["stalls"],
+                    "stall_s": edge["stall_s"],
+                    "spilled": edge["spilled"],
+                    "resent": edge["resent"],
+                    "ready_s": edge["ready_s"],
+                    "recorded": 0 if record is None else record.recorded,
+                    "record_dropped": 0 if record is None else record.dropped,
+                    "compression": None if compressor is None else compressor.get_summary(),
+                }
+                edge["prev_messages"] = messages
+                edge["prev_bytes"] = nbytes
+        return snapshot
+
+    def serve(self, port: int):
+        """
+        Reply to every request on tcp://*:port with the JSON snapshot
+        """
+        ctx = zmq.Context.instance()
+        socket = ctx.socket(zmq.REP)
+        socket.bind(f"tcp://*:{port}")
+        while True:
+            socket.recv()
+            socket.send_string(json.dumps(self.get_snapshot()))
+
+    def dump(self, interval: float):
+        """
+        Print the JSON snapshot every interval seconds
+        """
+        while True:
+            time.sleep(interval)
+            print(f"[{ZdgMetrics.__name__}] {json.dumps(self.get_snapshot())}")
+
+    def start(self):
+        """
+        Start serving and/or dumping the metrics in background threads, as set by ZDG_METRICS_PORT and
+        ZDG_METRICS_INTERVAL
+        """
+        if self.started:
+            return
+        self.started = True
+
+        port = os.environ.get("ZDG_METRICS_PORT", "")
+        if len(port) > 0:
+            print(f"Serving metrics on tcp://*:{port}")
+            threading.Thread(target=self.serve, args=(int(port),), daemon=True).start()
+
+        interval = os.environ.get("ZDG_METRICS_INTERVAL", "")
+        if len(interval) > 0:
+            threading.Thread(target=self.dump, args=(float(interval),), daemon=True).start()
+
+    @staticmethod
+    def request(url: str, timeout: int = 2500):
+        """
+        Read the metrics of a running node
+        """
+        ctx = zmq.Context.instance()
+        socket = ctx.socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(url)
+        socket.send(b"")
+        if (socket.poll(timeout) & zmq.POLLIN) == 0:
+            print(f"No response from {url}")
+            raise RuntimeError
+        snapshot = json.loads(socket.recv_string())
+        socket.close()
+        return snapshot
+
+
+# Metrics of this process
+metrics = ZdgMetrics()
+
+
+if __name__ == "__main__":
+    print(json.dumps(ZdgMetrics.request(sys.argv[1]), indent=2))
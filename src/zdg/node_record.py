@@ -0,0 +1,195 @@
+"""
+Recording of edge traffic (see the record edge option in node_interface.py). The frames of every message of the edge
+are appended, with the time they were sent or received, to a log of memory-mapped segment files by a background
+thread, so the node never waits for the disk. ZdgRecordReader reads them back, see ZdgReplaySource in node_replay.py
+"""
+
+import bisect
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+
+# Each record is its timestamp and number of frames, the size of each frame and the frames
+RECORD_HEADER = struct.Struct("<dI")
+FRAME_HEADER = struct.Struct("<Q")
+
+# Each entry of the index of a segment is the timestamp and the offset of a record
+INDEX_ENTRY = struct.Struct("<dQ")
+
+
+class ZdgRecordLog:
+    """
+    Append-only log in the directory ZDG_RECORD_DIR/name (default /tmp/name). Records are written to segments of
+    ZDG_RECORD_SEGMENT bytes (default 64 MiB) and their offsets to the index of the segment, a record is complete
+    once its index entry is written. Records wait for the writer thread in a buffer of at most ZDG_RECORD_BUFFER bytes
+    (default 64 MiB), put drops them when it is full. Segments of earlier runs are kept, new ones are added after them
+    """
+
+    def __init__(self, name: str, meta: dict) -> None:
+        record_dir = os.environ.get("ZDG_RECORD_DIR", "/tmp")
+        self.path = os.path.join(record_dir, name)
+        self.segment_size = int(os.environ.get("ZDG_RECORD_SEGMENT", 64 * 1024 * 1024))
+        self.buffer_size = int(os.environ.get("ZDG_RECORD_BUFFER", 64 * 1024 * 1024))
+
+        os.makedirs(self.path, exist_ok=True)
+        # Options of the edge, needed to decode the frames
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f_d:
+            json.dump(meta, f_d)
+
+        self.segment_cnt = len(ZdgRecordReader.get_segments(self.path))
+        self.segment = None
+        self.segment_fd = None
+        self.index_fd = None
+        self.offset = 0
+
+        self.recorded = 0
+        self.dropped = 0
+        self.buffered = 0
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write_records, daemon=True)
+        self.thread.start()
+
+    def put(self, timestamp: float, frames: list) -> bool:
+        """
+        Queue the frames for the writer thread, they are referenced and not copied. Returns False if they were dropped
+        """
+        size = sum(memoryview(frame).nbytes for frame in frames)
+        with self.lock:
+            if self.buffered + size > self.buffer_size:
+                self.dropped += 1
+                return False
+            self.buffered += size
+        self.queue.put((timestamp, frames, size))
+        return True
+
+    def close(self):
+        """
+        Write the records that are still buffered and close the log
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def write_records(self):
+        """
+        Writer thread, the index is flushed every time the buffer is emptied
+        """
+        while True:
+            if self.queue.empty() and (self.index_fd is not None):
+                self.index_fd.flush()
+            item = self.queue.get()
+            if item is None:
+                break
+            timestamp, frames, size = item
+            self.write_record(timestamp, frames)
+            with self.lock:
+                self.buffered -= size
+            self.recorded += 1
+        self.close_segment()
+
+    def write_record(self, timestamp: float, frames: list):
+        """
+        write_record
+        """
+        views = [memoryview(frame).cast("B") for frame in frames]
+        size = RECORD_HEADER.size + FRAME_HEADER.size * len(views) + sum(view.nbytes for view in views)
+        if (self.segment is None) or (self.offset + size > len(self.segment)):
+            self.open_segment(size)
+
+        offset = self.offset
+        RECORD_HEADER.pack_into(self.segment, offset, timestamp, len(views))
+        offset += RECORD_HEADER.size
+        for view in views:
+            FRAME_HEADER.pack_into(self.segment, offset, view.nbytes)
+            offset += FRAME_HEADER.size
+        for view in views:
+            self.segment[offset : offset + view.nbytes] = view
+            offset += view.nbytes
+
+        self.index_fd.write(INDEX_ENTRY.pack(timestamp, self.offset))
+        self.offset = offset
+
+    def open_segment(self, size: int):
+        """
+        Start a new segment, large enough for a record of size bytes
+        """
+        self.close_segment()
+        segment_path = os.path.join(self.path, f"{self.segment_cnt:08d}")
+        self.segment_cnt += 1
+
+        # Kept open until the segment is full
+        self.segment_fd = open(f"{segment_path}.log", "w+b")  # pylint: disable=consider-using-with
+        self.segment_fd.truncate(max(self.segment_size, size))
+        self.segment = mmap.mmap(self.segment_fd.fileno(), max(self.segment_size, size))
+        self.index_fd = open(f"{segment_path}.idx", "wb")  # pylint: disable=consider-using-with
+        self.offset = 0
+
+    def close_segment(self):
+        """
+        Flush the segment and its index, and cut the segment to the size of its records
+        """
+        if self.segment is None:
+            return
+        self.index_fd.close()
+        self.segment.flush()
+        self.segment.close()
+        self.segment_fd.truncate(self.offset)
+        self.segment_fd.close()
+        self.segment = None
+
+
+class ZdgRecordReader:
+    """
+    Reads the records of a ZdgRecordLog, including a log that is still being written
+    """
+
+    def __init__(self, name: str) -> None:
+        record_dir = os.environ.get("ZDG_RECORD_DIR", "/tmp")
+        self.path = os.path.join(record_dir, name)
+        with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f_d:
+            self.meta = json.load(f_d)
+
+    @staticmethod
+    def get_segments(path: str) -> list:
+        """
+        Paths of the segments, without extension, in order
+        """
+        names = sorted(name[: -len(".log")] for name in os.listdir(path) if name.endswith(".log"))
+        return [os.path.join(path, name) for name in names]
+
+    @staticmethod
+    def read_index(segment_path: str) -> list:
+        """
+        (timestamp, offset) of the complete records of the segment
+        """
+        with open(f"{segment_path}.idx", "rb") as f_d:
+            data = f_d.read()
+        data = data[: len(data) - len(data) % INDEX_ENTRY.size]
+        return list(INDEX_ENTRY.iter_unpack(data))
+
+    def read_records(self, t_start: float = None):
+        """
+        Yields the (timestamp, frames) of the records in order, starting at the first record at or after t_start
+        """
+        for segment_path in ZdgRecordReader.get_segments(self.path):
+            index = ZdgRecordReader.read_index(segment_path)
+            if (t_start is not None) and (len(index) > 0):
+                index = index[bisect.bisect_left([timestamp for timestamp, _ in index], t_start) :]
+            if len(index) == 0:
+                continue
+
+            with open(f"{segment_path}.log", "rb") as f_d:
+                with mmap.mmap(f_d.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+                    for timestamp, offset in index:
+                        _, frame_cnt = RECORD_HEADER.unpack_from(segment, offset)
+                        offset += RECORD_HEADER.size
+                        sizes = struct.unpack_from(f"<{frame_cnt}Q", segment, offset)
+                        offset += FRAME_HEADER.size * frame_cnt
+                        frames = []
+                        for size in sizes:
+                            frames.append(segment[offset : offset + size])
+                            offset += size
+                        yield timestamp, frames
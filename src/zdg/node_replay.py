@@ -0,0 +1,137 @@
+"""
+Source node that sends the messages of an edge recorded with the record edge option again, see node_record.py.
+In a ZdgCompose graph, run it as the command of a source node
+  python -u -m zdg.node_replay
+with ZDG_REPLAY_LOG set to the name of the log (e.g. sink_node_0-5553), and optionally ZDG_REPLAY_SPEED and
+ZDG_REPLAY_LOOP, see ZdgReplaySource
+"""
+
+import asyncio
+import os
+import threading
+
+from zdg.node_compress import ZdgCompressor
+from zdg.node_interface import ZdgNodeIface
+from zdg.node_record import ZdgRecordReader
+from zdg.node_schedule import ZdgSourceScheduler
+
+
+class ZdgReplaySource(ZdgSourceScheduler):
+    """
+    Scheduler and outbound_fnct of a source that replays a log, the messages are sent with their original spacing
+    divided by speed (0 is as fast as possible) and their original data. A message is missed if it is sent more than
+    the interval to the previous message late. With loop the log starts over once it ends, otherwise the source
+    goes idle
+    """
+
+    def __init__(self, name: str, speed: float = 1.0, loop: bool = False) -> None:
+        super().__init__(schedule="open")
+        if speed < 0:
+            print("Replay speed can not be negative")
+            raise ValueError
+
+        self.reader = ZdgRecordReader(name)
+        self.speed = speed
+        self.loop = loop
+        self.records = self.read_messages()
+        # Message of the deadline that is due and the next one, as (timestamp, message)
+        self.current = None
+        self.upcoming = next(self.records, None)
+        # 0 replays as fast as possible, otherwise it is updated to the interval to the next message
+        self.period = 1.0 if speed > 0 else 0.0
+
+    @staticmethod
+    def from_env():
+        """
+        Replay source of ZDG_REPLAY_LOG, ZDG_REPLAY_SPEED (default 1) and ZDG_REPLAY_LOOP (default 0)
+        """
+        speed = float(os.environ.get("ZDG_REPLAY_SPEED", 1))
+        loop = int(os.environ.get("ZDG_REPLAY_LOOP", 0)) == 1
+        return ZdgReplaySource(os.environ["ZDG_REPLAY_LOG"], speed, loop)
+
+    def read_messages(self):
+        """
+        Yields the (timestamp, message) of the log, batches are split into their messages. When looping, the
+        timestamps of each pass continue after the previous one
+        """
+        opt = self.reader.meta
+        codec = ZdgNodeIface.create_codec(opt)
+        batch, join = ZdgNodeIface.get_edge_framing(opt)
+        # Frames are recorded as sent, compressed if the edge was
+        compressor = ZdgCompressor(opt) if opt.get("compress", "") != "" else None
+
+        t_offset = 0.0
+        while True:
+            t_first = None
+            t_last = None
+            for timestamp, frames in self.reader.read_records():
+                message = ZdgNodeIface.decode_frames(frames, codec, batch, join, compressor)
+                for message_i in message if batch else [message]:
+                    yield timestamp + t_offset, message_i
+                t_first = timestamp if t_first is None else t_first
+                t_last = timestamp
+            if (not self.loop) or (t_first is None):
+                return
+            t_offset += t_last - t_first
+
+    def advance(self):
+        """
+        advance
+        """
+        self.current = self.upcoming
+        self.upcoming = next(self.records, None)
+
+    def get_interval(self) -> float:
+        """
+        Seconds from the message that is due to the next one
+        """
+        self.advance()
+        if (self.current is None) or (self.upcoming is None):
+            return 0.0
+        interval = max(self.upcoming[0] - self.current[0], 0.0) / self.speed
+        # Messages of a batch have the same timestamp, and a period of 0 would mean as fast as possible
+        if interval > 0:
+            self.period = interval
+        return interval
+
+    def get_current(self):
+        """
+        (timestamp, message) that is due, None once the log ended
+        """
+        if self.period == 0:
+            self.advance()
+        return self.current
+
+    @staticmethod
+    def get_data(message):
+        """
+        get_data
+        """
+        return message["data"] if isinstance(message, dict) and ("data" in message) else message
+
+    def outbound_fnct(self, message={}):
+        """
+        outbound_fnct of ZdgNodeIface.run
+        """
+        _ = message
+        current = self.get_current()
+        if current is None:
+            print(f"[{ZdgReplaySource.__name__}] Replay of {self.reader.path} is done")
+            threading.Event().wait()
+        return ZdgReplaySource.get_data(current[1])
+
+    async def async_outbound_fnct(self, message={}):
+        """
+        outbound_fnct of AsyncZdgNodeIface.run
+        """
+        _ = message
+        current = self.get_current()
+        if current is None:
+            print(f"[{ZdgReplaySource.__name__}] Replay of {self.reader.path} is done")
+            await asyncio.Event().wait()
+        return ZdgReplaySource.get_data(current[1])
+
+
+if __name__ == "__main__":
+    replay = ZdgReplaySource.from_env()
+    ZdgNodeIface.run(inbound_fnct=None, outbound_fnct=replay.outbound_fnct, scheduler=replay)
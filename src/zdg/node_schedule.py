@@ -0,0 +1,122 @@
+"""
+Rate control of source nodes (see process_0_to_n_communication in node_interface.py). Messages are created at
+absolute deadlines, so a late message does not shift the following ones and the rate does not drift
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+
+from zdg.node_metrics import metrics
+
+
+class ZdgSourceScheduler:
+    """
+    Deadlines of a source with a target rate (messages/s) or period (seconds), rate 0 sends as fast as possible.
+    Schedules:
+      steady:  closed loop, every deadline more than one period late is counted as missed and skipped, so the
+               source keeps a steady period and never bursts to catch up
+      open:    open loop load generation at a constant rate, late messages are sent back to back until the source
+               catches up and message["time"] is the deadline, so latencies include the time spent waiting to be
+               sent (no coordinated omission)
+      poisson: open with exponential inter-arrival times
+    The lag of every message behind its deadline (jitter) and the missed deadlines are added to the node metrics
+    """
+
+    schedules = ["steady", "open", "poisson"]
+
+    # The last part of the wait is spent polling the clock, sleep wakes up late by up to a scheduler tick
+    spin_s = 0.0005
+
+    def __init__(self, rate: float = 0, period: float = 0, schedule: str = "steady", seed: int = None) -> None:
+        if schedule not in ZdgSourceScheduler.schedules:
+            print(f"Unknown source schedule {schedule}, expected one of {ZdgSourceScheduler.schedules}")
+            raise ValueError
+        if (rate < 0) or (period < 0):
+            print("Source rate and period can not be negative")
+            raise ValueError
+        if (rate > 0) and (period > 0):
+            print("Set the source rate or the source period, not both")
+            raise ValueError
+
+        self.period = period if period > 0 else (1 / rate if rate > 0 else 0.0)
+        self.schedule = schedule
+        self.open_loop = schedule != "steady"
+        self.rng = random.Random(seed)
+        self.deadline = None
+        self.missed = 0
+
+    @staticmethod
+    def from_env():
+        """
+        Scheduler of ZDG_SOURCE_RATE (messages/s) or ZDG_SOURCE_PERIOD_MS and ZDG_SOURCE_SCHEDULE
+        """
+        rate = float(os.environ.get("ZDG_SOURCE_RATE", 0))
+        period = float(os.environ.get("ZDG_SOURCE_PERIOD_MS", 0)) / 1000
+        schedule = os.environ.get("ZDG_SOURCE_SCHEDULE", "steady")
+        return ZdgSourceScheduler(rate, period, schedule)
+
+    def get_interval(self) -> float:
+        """
+        get_interval
+        """
+        if self.schedule == "poisson":
+            return self.rng.expovariate(1 / self.period)
+        return self.period
+
+    def get_wait(self) -> float:
+        """
+        Seconds until the next deadline, 0 or less if it is due
+        """
+        if (self.period == 0) or (self.deadline is None):
+            return 0.0
+        return self.deadline - time.monotonic()
+
+    def next(self) -> float:
+        """
+        Take the deadline that is due and schedule the next one. Returns the deadline as a time.time() timestamp
+        """
+        now = time.monotonic()
+        t_now = time.time()
+        if self.period == 0:
+            return t_now
+        if self.deadline is None:
+            self.deadline = now
+
+        lag = now - self.deadline
+        metrics.node["source_lag"].record(lag)
+        if lag > self.period:
+            metrics.node["missed"] += 1
+            self.missed += 1
+
+        deadline = self.deadline
+        self.deadline += self.get_interval()
+        if (not self.open_loop) and (self.deadline < now):
+            # Skip the deadlines that were missed, counting them
+            skipped = math.ceil((now - self.deadline) / self.period)
+            metrics.node["missed"] += skipped
+            self.missed += skipped
+            self.deadline += skipped * self.period
+        return t_now - (now - deadline)
+
+    def wait(self) -> float:
+        """
+        Block until the next deadline, see next
+        """
+        wait = self.get_wait()
+        if wait > ZdgSourceScheduler.spin_s:
+            time.sleep(wait - ZdgSourceScheduler.spin_s)
+        while self.get_wait() > 0:
+            pass
+        return self.next()
+
+    async def async_wait(self) -> float:
+        """
+        async_wait, without the spin that would block the event loop
+        """
+        wait = self.get_wait()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return self.next()
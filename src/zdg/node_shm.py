@@ -0,0 +1,187 @@
+"""
+Shared-memory ring buffer of the shm edge option. Large frames of a request are written to a slot of a shared memory
+segment owned by the outbound (sending) end of the edge and only a small descriptor crosses the ZMQ socket. The
+inbound end reads them as zero-copy memoryviews and echoes the descriptors with its reply, which releases the slots
+"""
+
+import atexit
+import random
+import struct
+
+from multiprocessing import resource_tracker, shared_memory
+
+# Segment header: ring id. Slot header: generation of the frame in the slot
+SEGMENT_HEADER = struct.Struct("<Q")
+SLOT_HEADER = struct.Struct("<Q")
+
+# Index frame sent before the frames of a request: ring id and descriptor count, followed by one
+# (frame index, slot, generation, size) descriptor per frame in the ring
+INDEX_HEADER = struct.Struct("<QI")
+INDEX_ENTRY = struct.Struct("<IIQQ")
+
+# Names of the segments created by this process, both ends of an edge share a process when ZdgRunner runs nodes as
+# threads
+CREATED_SEGMENTS = set()
+
+
+class ZdgShmRing:
+    """
+    Both ends of the edge find the segment by its name. Slots are used in ring order, frames that are too large
+    for a slot, or that find no free slot, are sent through the socket as usual
+    """
+
+    def __init__(self, name: str, slots: int, slot_size: int, create: bool) -> None:
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self.slot_stride = SLOT_HEADER.size + slot_size
+        self.owner = create
+        self.segment = None
+        self.ring_id = 0
+
+        # Outbound end only
+        self.free = [True] * slots
+        self.generation = [0] * slots
+        self.next_slot = 0
+
+        if create:
+            self.create()
+
+    def create(self):
+        """
+        Create the segment, replacing the one left behind by a previous run
+        """
+        size = SEGMENT_HEADER.size + self.slots * self.slot_stride
+        try:
+            self.segment = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self.segment = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+
+        CREATED_SEGMENTS.add(self.name)
+        atexit.register(self.unlink)
+        self.ring_id = random.getrandbits(63)
+        SEGMENT_HEADER.pack_into(self.segment.buf, 0, self.ring_id)
+        print(f"Created shared memory ring {self.name}: {self.slots} slots of {self.slot_size} bytes")
+
+    def attach(self, ring_id: int):
+        """
+        Inbound end, (re)attach if the outbound end created a new segment
+        """
+        if (self.segment is not None) and (self.ring_id == ring_id):
+            return
+        if self.segment is not None:
+            self.segment.close()
+
+        self.segment = shared_memory.SharedMemory(name=self.name)
+        # The outbound end owns the segment, do not let the resource tracker unlink it when this process exits. When
+        # this process created it, the registration is the one of the outbound end, see unlink
+        if self.name not in CREATED_SEGMENTS:
+            resource_tracker.unregister(self.segment._name, "shared_memory")  # pylint: disable=protected-access
+        (self.ring_id,) = SEGMENT_HEADER.unpack_from(self.segment.buf, 0)
+        if self.ring_id != ring_id:
+            print(f"Shared memory ring {self.name} was replaced while attaching to it")
+            raise RuntimeError
+
+    def unlink(self):
+        """
+        Outbound end, remove the segment when the process exits. The mapping stays valid for the threads that still
+        use it
+        """
+        if self.name not in CREATED_SEGMENTS:
+            return
+        CREATED_SEGMENTS.discard(self.name)
+        # Spawned processes share the resource tracker of their parent, where the inbound end may have unregistered
+        # the segment, register it again so that unlink finds it
+        resource_tracker.register(self.segment._name, "shared_memory")  # pylint: disable=protected-access
+        try:
+            self.segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def get_slot_offset(self, slot: int) -> int:
+        """
+        get_slot_offset
+        """
+        return SEGMENT_HEADER.size + slot * self.slot_stride
+
+    def alloc_slot(self):
+        """
+        Next free slot in ring order, None if all of them are in use
+        """
+        for i in range(self.slots):
+            slot = (self.next_slot + i) % self.slots
+            if self.free[slot]:
+                self.free[slot] = False
+                self.next_slot = (slot + 1) % self.slots
+                return slot
+        return None
+
+    def put_frames(self, frames: list, min_size: int) -> list:
+        """
+        Outbound end, copy the frames of min_size bytes or more into free slots. Returns the index frame followed
+        by frames, with an empty placeholder in place of each frame that went into the ring
+        """
+        entries = []
+        out_frames = list(frames)
+        for idx, frame in enumerate(frames):
+            buffer = memoryview(frame).cast("B")
+            size = buffer.nbytes
+            if (size < min_size) or (size > self.slot_size):
+                continue
+            slot = self.alloc_slot()
+            if slot is None:
+                break
+
+            self.generation[slot] += 1
+            offset = self.get_slot_offset(slot)
+            SLOT_HEADER.pack_into(self.segment.buf, offset, self.generation[slot])
+            start = offset + SLOT_HEADER.size
+            self.segment.buf[start : start + size] = buffer
+            out_frames[idx] = b""
+            entries.append(INDEX_ENTRY.pack(idx, slot, self.generation[slot], size))
+
+        index_frame = INDEX_HEADER.pack(self.ring_id, len(entries)) + b"".join(entries)
+        return [index_frame] + out_frames
+
+    def get_frames(self, index_frame, frames: list) -> list:
+        """
+        Inbound end, inverse of put_frames. Frames in the ring are memoryviews of the segment, valid until the reply
+        is sent
+        """
+        ring_id, entry_cnt = INDEX_HEADER.unpack_from(index_frame, 0)
+        if entry_cnt == 0:
+            return frames
+
+        self.attach(ring_id)
+        frames = list(frames)
+        for i in range(entry_cnt):
+            idx, slot, generation, size = INDEX_ENTRY.unpack_from(index_frame, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+            offset = self.get_slot_offset(slot)
+            (slot_generation,) = SLOT_HEADER.unpack_from(self.segment.buf, offset)
+            if slot_generation != generation:
+                print(f"Slot {slot} of shared memory ring {self.name} was overwritten before it was read")
+                raise RuntimeError
+            start = offset + SLOT_HEADER.size
+            frames[idx] = self.segment.buf[start : start + size]
+        return frames
+
+    def release_frames(self, index_frame):
+        """
+        Outbound end, release the slots of the index frame echoed by the reply
+        """
+        ring_id, entry_cnt = INDEX_HEADER.unpack_from(index_frame, 0)
+        if ring_id != self.ring_id:
+            return
+        for i in range(entry_cnt):
+            _, slot, generation, _ = INDEX_ENTRY.unpack_from(index_frame, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+            if self.generation[slot] == generation:
+                self.free[slot] = True
+
+    def release_all(self):
+        """
+        Outbound end, after a reset the replies of the requests in flight are lost
+        """
+        self.free = [True] * self.slots
@@ -0,0 +1,54 @@
+"""
+Disk queue of the spill overflow policy (see EDGE_OPT in node_interface.py). Messages that do not fit in the send
+queue of an edge are appended to a file and read back in order once the edge has room for them again
+"""
+
+import os
+import struct
+
+# Each record is its size followed by its bytes
+RECORD_HEADER = struct.Struct("<Q")
+
+
+class ZdgSpillQueue:
+    """
+    FIFO of byte records in a file of ZDG_SPILL_DIR (default /tmp), truncated every time it is emptied
+    """
+
+    def __init__(self, name: str) -> None:
+        spill_dir = os.environ.get("ZDG_SPILL_DIR", "/tmp")
+        self.path = os.path.join(spill_dir, f"{name}-{os.getpid()}.spill")
+        # Kept open for the life of the node
+        self.f_d = open(self.path, "w+b")  # pylint: disable=consider-using-with
+        self.read_offset = 0
+        self.write_offset = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def put(self, record: bytes):
+        """
+        put
+        """
+        self.f_d.seek(self.write_offset)
+        self.f_d.write(RECORD_HEADER.pack(len(record)))
+        self.f_d.write(record)
+        self.write_offset = self.f_d.tell()
+        self.count += 1
+
+    def get(self) -> bytes:
+        """
+        Oldest record, the queue must not be empty
+        """
+        self.f_d.seek(self.read_offset)
+        (size,) = RECORD_HEADER.unpack(self.f_d.read(RECORD_HEADER.size))
+        record = self.f_d.read(size)
+        self.read_offset = self.f_d.tell()
+        self.count -= 1
+
+        if self.count == 0:
+            self.f_d.truncate(0)
+            self.read_offset = 0
+            self.write_offset = 0
+        return record
@@ -0,0 +1,94 @@
+"""
+End-to-end traces across multi-hop graphs. Sources add a trace to one every ZDG_TRACE_SAMPLE messages, every node it
+goes through appends a hop [node name, recv ts, handler done ts, send ts] to message["trace"] and sinks write the
+complete traces as JSON lines to ZDG_TRACE_PATH. See trace_report.py for the per stage latency breakdown
+"""
+
+import json
+import os
+import time
+
+
+class ZdgTrace:
+    """
+    Trace header of the messages of a node. Hops are lists so that every codec can carry them
+    """
+
+    def __init__(self) -> None:
+        self.node_name = ""
+        self.sample = 0
+        self.trace_file = None
+
+    def start(self):
+        """
+        Read ZDG_CONTAINER_NAME, ZDG_TRACE_SAMPLE (0, the default, disables tracing at sources) and ZDG_TRACE_PATH
+        (sinks do not write traces if empty)
+        """
+        self.node_name = os.environ.get("ZDG_CONTAINER_NAME", "")
+        self.sample = int(os.environ.get("ZDG_TRACE_SAMPLE", "0"))
+
+        trace_path = os.environ.get("ZDG_TRACE_PATH", "")
+        if len(trace_path) > 0:
+            print(f"Writing traces to {trace_path}")
+            self.trace_file = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+    def start_trace(self, message: dict, t_start: float):
+        """
+        Sources only, t_start is the time outbound_fnct was called
+        """
+        if (self.sample > 0) and (message["counter"] % self.sample == 0):
+            message["trace"] = [[self.node_name, t_start, time.time(), None]]
+
+    def recv_trace(self, messages: list):
+        """
+        Append a hop to the traced messages that were just received
+        """
+        t_recv = time.time()
+        for message in messages:
+            if isinstance(message, dict) and ("trace" in message):
+                message["trace"].append([self.node_name, t_recv, None, None])
+
+    def done_trace(self, messages: list):
+        """
+        Set the handler done time of the last hop
+        """
+        t_done = time.time()
+        for message in messages:
+            if isinstance(message, dict) and ("trace" in message):
+                message["trace"][-1][2] = t_done
+
+    def forward_trace(self, inbound_message, outbound_message: dict):
+        """
+        The outbound message of an inbound message carries on its trace, the handler done time of the last hop
+        includes outbound_fnct
+        """
+        if isinstance(inbound_message, dict) and ("trace" in inbound_message):
+            trace = inbound_message["trace"]
+            hop = trace[-1][:]
+            hop[2] = time.time()
+            outbound_message["trace"] = trace[:-1] + [hop]
+
+    @staticmethod
+    def stamp_trace(messages: list):
+        """
+        Set the send time of the last hop right before the messages are encoded, every outbound edge sends its own
+        copy of the trace
+        """
+        t_send = time.time()
+        for message in messages:
+            if isinstance(message, dict) and ("trace" in message):
+                message["trace"][-1][3] = t_send
+
+    def write_trace(self, messages: list):
+        """
+        Sinks only, write the complete traces
+        """
+        if self.trace_file is None:
+            return
+        for message in messages:
+            if isinstance(message, dict) and ("trace" in message):
+                self.trace_file.write(f"{json.dumps(message['trace'])}\n")
+
+
+# Traces of this process
+tracer = ZdgTrace()
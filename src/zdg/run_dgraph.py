@@ -0,0 +1,180 @@
+"""
+Run a directed graph on one machine, without Docker. Takes the same edge list as ZdgCompose and the same inbound_fnct
+and outbound_fnct of each node, and runs every node as a thread, an asyncio task or a subprocess
+"""
+
+import asyncio
+import copy
+import inspect
+import multiprocessing
+import os
+import threading
+import time
+
+from zdg.compose_dgraph import ZdgCompose
+from zdg.node_async import AsyncZdgNodeIface
+from zdg.node_interface import ZdgNodeIface
+
+
+class ZdgRunner:
+    """
+    Threads and tasks use inproc edges by default, subprocesses use ipc edges. Nodes running as threads or tasks
+    share the metrics and traces of the process, use subprocesses to tell the nodes apart. In task mode, callbacks
+    that are not async def are called directly from the event loop. Every replica of a node runs the callbacks of
+    the node
+
+    runner = ZdgRunner(edge_list, {"node1": (inbound_fnct, outbound_fnct), ...}, mode="thread")
+    runner.run()
+    """
+
+    runner_modes = ["thread", "task", "subprocess"]
+
+    def __init__(self, edge_list: list, fnct_dict: dict, mode: str = "thread", transport: str = None, port_num=6000):
+        """
+        fnct_dict maps every node name to its (inbound_fnct, outbound_fnct). transport overwrites the transport of
+        every edge
+        """
+        if mode not in ZdgRunner.runner_modes:
+            print(f"Unknown runner mode {mode}, expected one of {ZdgRunner.runner_modes}")
+            raise ValueError
+        if transport is None:
+            transport = "ipc" if mode == "subprocess" else "inproc"
+        if (mode == "subprocess") and (transport == "inproc"):
+            print("Subprocesses can not use inproc edges, use ipc or tcp")
+            raise ValueError
+
+        edge_list = [copy.copy(edge) for edge in edge_list]
+        for edge in edge_list:
+            edge.transport = transport
+        self.env_dict = ZdgRunner.get_node_env(edge_list, port_num)
+
+        for env in self.env_dict.values():
+            if env["ZDG_NODE_NAME"] not in fnct_dict:
+                print(f"Node {env['ZDG_NODE_NAME']} has no (inbound_fnct, outbound_fnct) in fnct_dict")
+                raise ValueError
+
+        self.fnct_dict = fnct_dict
+        self.mode = mode
+
+    @staticmethod
+    def get_node_env(edge_list: list, port_num: int):
+        """
+        ZDG_INBOUND_LIST and ZDG_OUTBOUND_LIST of each service (node or replica of a node), as in the compose file
+        of ZdgCompose but with every hostname replaced by 127.0.0.1, and the name of its node in ZDG_NODE_NAME
+        """
+        compose_data = ZdgCompose(edge_list, port_num).compose_data
+
+        env_dict = {}
+        for name, service in compose_data["services"].items():
+            env = {"ZDG_NODE_NAME": name}
+            for item in service["environment"]:
+                key, val = item.split("=", 1)
+                if key not in ["ZDG_INBOUND_LIST", "ZDG_OUTBOUND_LIST", "ZDG_NODE_NAME"]:
+                    continue
+                if key == "ZDG_OUTBOUND_LIST":
+                    h_p_list = [h_p.split(" ", 1) for h_p in val.split(";") if len(h_p) > 0]
+                    val = ";".join(" ".join(["127.0.0.1"] + h_p[1:]) for h_p in h_p_list)
+                env[key] = val
+            env_dict[name] = env
+        return env_dict
+
+    @staticmethod
+    def get_async_fnct(fnct):
+        """
+        get_async_fnct
+        """
+        if inspect.iscoroutinefunction(fnct):
+            return fnct
+
+        async def async_fnct(*args):
+            return fnct(*args)
+
+        async_fnct.zdg_batch = getattr(fnct, "zdg_batch", False)
+        async_fnct.zdg_gather = getattr(fnct, "zdg_gather", None)
+        return async_fnct
+
+    @staticmethod
+    def run_node(env: dict, inbound_fnct, outbound_fnct):
+        """
+        Entry point of the subprocesses
+        """
+        os.environ.update(env)
+        try:
+            ZdgNodeIface.run(inbound_fnct, outbound_fnct)
+        except KeyboardInterrupt:
+            pass
+
+    def run_threads(self, timeout: float = None):
+        """
+        run_threads
+        """
+        thread_list = []
+        for node_name, env in self.env_dict.items():
+            inbound_fnct, outbound_fnct = self.fnct_dict[env["ZDG_NODE_NAME"]]
+            kwargs = {"inbound_list": env["ZDG_INBOUND_LIST"], "outbound_list": env["ZDG_OUTBOUND_LIST"]}
+            thread = threading.Thread(
+                target=ZdgNodeIface.run, args=(inbound_fnct, outbound_fnct), kwargs=kwargs, name=node_name, daemon=True
+            )
+            thread.start()
+            thread_list.append(thread)
+
+        t_stop = None if timeout is None else time.time() + timeout
+        for thread in thread_list:
+            thread.join(None if t_stop is None else max(0.0, t_stop - time.time()))
+
+    async def run_tasks(self, timeout: float = None):
+        """
+        run_tasks
+        """
+        task_list = []
+        for node_name, env in self.env_dict.items():
+            inbound_fnct, outbound_fnct = self.fnct_dict[env["ZDG_NODE_NAME"]]
+            coro = AsyncZdgNodeIface.run(
+                ZdgRunner.get_async_fnct(inbound_fnct),
+                ZdgRunner.get_async_fnct(outbound_fnct),
+                env["ZDG_INBOUND_LIST"],
+                env["ZDG_OUTBOUND_LIST"],
+            )
+            task_list.append(asyncio.ensure_future(coro))
+
+        await asyncio.wait(task_list, timeout=timeout)
+        for task in task_list:
+            task.cancel()
+
+    def run_subprocesses(self, timeout: float = None):
+        """
+        Callbacks are pickled, they have to be importable (module level functions or methods of picklable objects)
+        """
+        mp_context = multiprocessing.get_context("spawn")
+        proc_list = []
+        for node_name, env in self.env_dict.items():
+            inbound_fnct, outbound_fnct = self.fnct_dict[env["ZDG_NODE_NAME"]]
+            env = dict(env, ZDG_CONTAINER_NAME=node_name)
+            proc = mp_context.Process(
+                target=ZdgRunner.run_node, args=(env, inbound_fnct, outbound_fnct), name=node_name, daemon=True
+            )
+            proc.start()
+            proc_list.append(proc)
+
+        t_stop = None if timeout is None else time.time() + timeout
+        try:
+            for proc in proc_list:
+                proc.join(None if t_stop is None else max(0.0, t_stop - time.time()))
+        finally:
+            for proc in proc_list:
+                proc.terminate()
+
+    def run(self, timeout: float = None):
+        """
+        Run the graph until KeyboardInterrupt or, if given, for timeout seconds
+        """
+        print(f"{ZdgRunner.__name__}: running {len(self.env_dict)} nodes as {self.mode}")
+        try:
+            if self.mode == "thread":
+                self.run_threads(timeout)
+            elif self.mode == "task":
+                asyncio.run(self.run_tasks(timeout))
+            else:
+                self.run_subprocesses(timeout)
+        except KeyboardInterrupt:
+            pass
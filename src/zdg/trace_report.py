@@ -0,0 +1,107 @@
+"""
+Per stage latency breakdown of the traces written by the sinks of a graph (see node_trace.py), in the order of the
+topology of the compose file created by ZdgCompose. Clocks of the nodes are assumed to be in sync (same host)
+
+Run it using
+  python -m zdg.trace_report compose_dgraph.yml trace_sink1.jsonl trace_sink2.jsonl
+"""
+
+import json
+import sys
+
+from zdg.analyze_dgraph import ZdgGraph
+from zdg.node_metrics import ZdgHistogram
+
+
+class ZdgTraceReport:
+    """
+    ZdgTraceReport
+    """
+
+    @staticmethod
+    def read_topology(compose_path: str):
+        """
+        Returns the node names in topological order, nodes in a cycle are left at the end, and the (node1, node2)
+        edges, read from the ZDG_OUTBOUND_LIST of each service
+        """
+        graph = ZdgGraph.read_compose(compose_path)
+        topo_list, cyclic_list = graph.get_topo_order()
+        return topo_list + cyclic_list, graph.pair_list
+
+    @staticmethod
+    def read_traces(trace_path_list: list):
+        """
+        read_traces
+        """
+        trace_list = []
+        for trace_path in trace_path_list:
+            with open(trace_path, "r", encoding="utf-8") as f_d:
+                for line in f_d:
+                    if len(line.strip()) > 0:
+                        trace_list.append(json.loads(line))
+        return trace_list
+
+    @staticmethod
+    def get_stages(trace_list: list):
+        """
+        Histograms of the handler time of each node (done - recv), and of the send wait (send - done of the sender)
+        and network time (recv of the receiver - send of the sender) of each edge. Also the end-to-end latency of
+        each path
+        """
+        handler = {}
+        send_wait = {}
+        network = {}
+        path_latency = {}
+        for trace in trace_list:
+            for hop1, hop2 in zip(trace[:-1], trace[1:]):
+                edge = (hop1[0], hop2[0])
+                send_wait.setdefault(edge, ZdgHistogram()).record(hop1[3] - hop1[2])
+                network.setdefault(edge, ZdgHistogram()).record(hop2[1] - hop1[3])
+            for name, t_recv, t_done, _ in trace:
+                handler.setdefault(name, ZdgHistogram()).record(t_done - t_recv)
+
+            path = tuple(hop[0] for hop in trace)
+            path_latency.setdefault(path, ZdgHistogram()).record(trace[-1][2] - trace[0][1])
+
+        return handler, send_wait, network, path_latency
+
+    @staticmethod
+    def get_row(stage: str, histogram: ZdgHistogram):
+        """
+        get_row
+        """
+        if histogram is None:
+            return f"{stage:<40} {'no traces':>10}"
+        summary = histogram.get_summary()
+        return (
+            f"{stage:<40} {summary['count']:>10} {summary['mean_ms']:>10.3f} {summary['p50_ms']:>10.3f} "
+            f"{summary['p99_ms']:>10.3f} {summary['max_ms']:>10.3f}"
+        )
+
+    @staticmethod
+    def report(compose_path: str, trace_path_list: list):
+        """
+        report
+        """
+        topo_list, edge_list = ZdgTraceReport.read_topology(compose_path)
+        trace_list = ZdgTraceReport.read_traces(trace_path_list)
+        handler, send_wait, network, path_latency = ZdgTraceReport.get_stages(trace_list)
+
+        print(f"{len(trace_list)} traces, {len(topo_list)} nodes, {len(edge_list)} edges")
+        print(f"{'stage':<40} {'count':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+        for name1 in topo_list:
+            print(ZdgTraceReport.get_row(f"{name1} handler", handler.get(name1)))
+            for edge in edge_list:
+                if edge[0] != name1:
+                    continue
+                print(ZdgTraceReport.get_row(f"{edge[0]} -> {edge[1]} send wait", send_wait.get(edge)))
+                print(ZdgTraceReport.get_row(f"{edge[0]} -> {edge[1]} network", network.get(edge)))
+
+        print("")
+        print(f"{'path':<40} {'count':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+        for path, histogram in sorted(path_latency.items()):
+            print(ZdgTraceReport.get_row(" -> ".join(path), histogram))
+
+
+if __name__ == "__main__":
+    ZdgTraceReport.report(sys.argv[1], sys.argv[2:])